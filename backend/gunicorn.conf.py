@@ -0,0 +1,11 @@
+# Loaded by gunicorn from the working directory
+import os
+
+
+def child_exit(server, worker):
+    # Drop the live gauges of a dead worker from the shared Prometheus files
+    # (see microgrid_monitoring.instrumentation)
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
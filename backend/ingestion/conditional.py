@@ -0,0 +1,102 @@
+"""
+HTTP conditional requests driven by the data revisions (DataRevision).
+
+Every write to the readings (ingestion, edits, deletes, compaction) bumps the
+revision of the days it touches, so the revision of a range identifies the
+data a response was built from. Views decorated with conditional_on_revision
+answer `304 Not Modified` from that revision alone (one small aggregate
+query), without reading readings or running serializers, and send ETag,
+Last-Modified and Cache-Control headers otherwise.
+"""
+import hashlib
+import json
+from datetime import date, datetime
+from functools import wraps
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import http_date
+
+from .services import range_revision
+
+
+def revision_day(value):
+    """
+    Local day of a range bound (date, datetime or ISO string), None when
+    missing or unparsable: the range then stays open on that side, which
+    only makes the validators more conservative.
+    """
+    if isinstance(value, str):
+        try:
+            value = parse_datetime(value) or parse_date(value)
+        except ValueError:
+            value = None
+    if isinstance(value, datetime):
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return timezone.localdate(value)
+    if isinstance(value, date):
+        return value
+    return None
+
+
+def data_validators(request, start=None, end=None, site=None):
+    """
+    `(etag, last_modified)` of a response built from the readings of
+    [start, end] (of one site, or of all sites) for this exact request.
+    `last_modified` is a POSIX timestamp, None when the range was never
+    written.
+    """
+    revision = range_revision(revision_day(start), revision_day(end), site)
+    payload = {
+        'path': request.path,
+        'query': sorted(request.GET.lists()),
+        'version': revision['version'],
+        # KPIs depend on the integration settings as well as on the data
+        'integration': settings.KPI_INTEGRATION,
+    }
+    digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    updated_at = revision['updated_at']
+    return f'"{digest[:40]}"', int(updated_at.timestamp()) if updated_at else None
+
+
+def conditional_on_revision(get_range):
+    """
+    Decorator of a DRF view handler. `get_range(view, request)` returns the
+    `(start, end, site)` the response depends on. Requests whose
+    If-None-Match / If-Modified-Since still match get a 304 without calling
+    the handler; successful responses carry the validators.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            if not settings.HTTP_CONDITIONAL_ENABLED:
+                return handler(view, request, *args, **kwargs)
+            etag, last_modified = data_validators(request, *get_range(view, request))
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = handler(view, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(last_modified)
+                set_revalidation_headers(response)
+            return response
+        return wrapper
+    return decorator
+
+
+def set_revalidation_headers(response):
+    """
+    Browsers keep the response but revalidate it on every use; nginx may
+    micro-cache it for HTTP_MICROCACHE_SECONDS (X-Accel-Expires, read and
+    stripped by nginx). X-Accel-Expires overrides `private` in nginx, so its
+    cache key includes the Authorization header and requests without one
+    are not cached (see nginx/nginx.conf).
+    """
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Authorization',))
+    if settings.HTTP_MICROCACHE_SECONDS:
+        response['X-Accel-Expires'] = str(settings.HTTP_MICROCACHE_SECONDS)
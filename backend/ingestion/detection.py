@@ -0,0 +1,227 @@
+"""
+Streaming anomaly detection run on every ingestion batch.
+
+Each signal listed in ANOMALY_RULES is checked against up to three rules:
+fixed `min` / `max` thresholds and a `zscore` limit measured against an
+exponentially weighted mean and variance (smoothing factor `alpha`, active
+after `warmup` readings). The baseline lives in DetectorState, so it carries
+over from one batch and one file to the next. Consecutive flagged readings
+form one AnomalyEvent, extended across batch boundaries when the next batch
+follows within ANOMALY_EVENT_MAX_GAP_SECONDS. A run already recorded by an
+event (a file ingested again) is not recorded twice.
+
+Everything but the handful of events written is vectorized, so detection
+costs a small fraction of parsing the same rows.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from .models import AnomalyEvent, DetectorState
+
+DEFAULT_ALPHA = 0.01
+DEFAULT_WARMUP = 60
+
+
+def ewm_with_state(values, initial, alpha):
+    """
+    Exponentially weighted mean of `values` continuing from `initial`:
+    returns y where y[0] = initial and y[i] = (1 - alpha) y[i-1] + alpha values[i-1].
+    """
+    series = pd.Series(np.concatenate(([initial], values)))
+    return series.ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
+def flag_runs(flags):
+    """Return the (start, stop) index pairs of the runs of True in `flags`."""
+    padded = np.concatenate(([False], flags, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[0::2], edges[1::2]
+
+
+class SignalDetector:
+    """
+    Rules and running baseline of one signal. `detect` consumes a batch of
+    (timestamps, values) sorted by time and returns the flagged runs.
+    """
+
+    def __init__(self, rule, state):
+        self.minimum = rule.get("min")
+        self.maximum = rule.get("max")
+        self.zscore = rule.get("zscore")
+        self.alpha = rule.get("alpha", DEFAULT_ALPHA)
+        self.warmup = rule.get("warmup", DEFAULT_WARMUP)
+        self.state = state
+
+    def detect(self, timestamps, values):
+        """
+        `timestamps` are int64 UTC nanoseconds, `values` floats (NaN = missing).
+        Returns a list of runs `(kind, start_ns, end_ns, count, peak_value,
+        peak_z, at_start, at_end)`, the last two telling whether the run
+        touches the first / last valid reading of the batch.
+        """
+        valid = ~np.isnan(values)
+        timestamps, values = timestamps[valid], values[valid]
+        if not len(values):
+            return []
+
+        zscores = np.full(len(values), np.nan)
+        if self.zscore:
+            zscores = self._update_baseline(timestamps, values)
+
+        runs = []
+        if self.maximum is not None:
+            runs += self._runs("high", values > self.maximum, timestamps, values, zscores, values)
+        if self.minimum is not None:
+            runs += self._runs("low", values < self.minimum, timestamps, values, zscores, -values)
+        if self.zscore:
+            with np.errstate(invalid="ignore"):
+                outliers = np.abs(zscores) > self.zscore
+            runs += self._runs("zscore", outliers, timestamps, values, zscores, np.abs(zscores))
+        return runs
+
+    def _update_baseline(self, timestamps, values):
+        state = self.state
+        # Readings older than the baseline (backfills) are only checked against thresholds
+        last_ns = pd.Timestamp(state.last_timestamp).value if state.last_timestamp else None
+        fresh = np.ones(len(values), dtype=bool) if last_ns is None else timestamps > last_ns
+        zscores = np.full(len(values), np.nan)
+        x = values[fresh]
+        if not len(x):
+            return zscores
+
+        initial_mean = state.mean if state.sample_count else x[0]
+        means = ewm_with_state(x, initial_mean, self.alpha)
+        deviations = x - means[:-1]
+        variances = ewm_with_state((1 - self.alpha) * deviations ** 2, state.variance, self.alpha)
+
+        # z-score of each reading against the baseline *before* it
+        seen = state.sample_count + np.arange(len(x))
+        spread = np.sqrt(variances[:-1])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            z = np.where((seen >= self.warmup) & (spread > 0), deviations / spread, np.nan)
+        zscores[fresh] = z
+
+        state.mean = float(means[-1])
+        state.variance = float(variances[-1])
+        state.sample_count += len(x)
+        state.last_timestamp = datetime.fromtimestamp(
+            timestamps[fresh][-1] / 1e9, dt_timezone.utc
+        )
+        return zscores
+
+    def _runs(self, kind, flags, timestamps, values, zscores, severity):
+        starts, stops = flag_runs(flags)
+        runs = []
+        for start, stop in zip(starts, stops):
+            peak = start + int(np.nanargmax(severity[start:stop]))
+            peak_z = zscores[peak]
+            runs.append((
+                kind,
+                int(timestamps[start]),
+                int(timestamps[stop - 1]),
+                int(stop - start),
+                float(values[peak]),
+                None if np.isnan(peak_z) else float(peak_z),
+                start == 0,
+                stop == len(flags),
+            ))
+        return runs
+
+
+def detect_anomalies(site_id, timestamps, columns, rules=None):
+    """
+    Run the detection rules on one batch of readings of `site_id`.
+
+    `timestamps` is an int64 array of UTC nanoseconds and `columns` maps
+    signal names to float arrays (NaN = missing), in any order. Events are
+    written (or extended across batches) and baselines saved in one
+    transaction. Returns the number of new events.
+    """
+    rules = settings.ANOMALY_RULES if rules is None else rules
+    signals = [signal for signal in rules if signal in columns]
+    if not signals or not len(timestamps):
+        return 0
+
+    order = np.argsort(timestamps, kind="stable")
+    timestamps = timestamps[order]
+
+    # Created up front, outside the locking transaction, so concurrent
+    # ingestions of a new site do not both insert the same state
+    for signal in signals:
+        DetectorState.objects.get_or_create(site_id=site_id, signal=signal)
+
+    created = 0
+    with transaction.atomic():
+        states = {
+            state.signal: state
+            for state in DetectorState.objects.select_for_update().filter(
+                site_id=site_id, signal__in=signals
+            )
+        }
+        for signal in signals:
+            state = states.get(signal) or DetectorState(site_id=site_id, signal=signal)
+            detector = SignalDetector(rules[signal], state)
+            runs = detector.detect(timestamps, np.asarray(columns[signal], dtype=float)[order])
+            created += _record_runs(site_id, signal, runs, state)
+            state.save()
+    return created
+
+
+def _record_runs(site_id, signal, runs, state):
+    created = 0
+    open_events = {}
+    max_gap_ns = settings.ANOMALY_EVENT_MAX_GAP_SECONDS * 10**9
+    for kind, start_ns, end_ns, count, peak_value, peak_z, at_start, at_end in runs:
+        event = None
+        # A run opening the batch continues the event left open by the
+        # previous one, when it follows that event closely
+        previous_id = state.open_events.get(kind)
+        if previous_id and at_start:
+            event = AnomalyEvent.objects.filter(pk=previous_id).first()
+            if event is not None and not 0 < start_ns - pd.Timestamp(event.ended_at).value <= max_gap_ns:
+                event = None
+        recorded = AnomalyEvent.objects.filter(
+            site_id=site_id, signal=signal, kind=kind,
+            started_at__lte=_to_datetime(start_ns), ended_at__gte=_to_datetime(end_ns),
+        ).first()
+        if recorded is not None:
+            # Readings already scanned (e.g. the same file ingested again)
+            event = recorded
+        elif event is not None:
+            event.ended_at = _to_datetime(end_ns)
+            event.sample_count += count
+            if _more_extreme(kind, peak_value, peak_z, event):
+                event.peak_value, event.peak_zscore = peak_value, peak_z
+            event.save(update_fields=["ended_at", "sample_count", "peak_value", "peak_zscore"])
+        else:
+            event = AnomalyEvent.objects.create(
+                site_id=site_id,
+                signal=signal,
+                kind=kind,
+                started_at=_to_datetime(start_ns),
+                ended_at=_to_datetime(end_ns),
+                sample_count=count,
+                peak_value=peak_value,
+                peak_zscore=peak_z,
+            )
+            created += 1
+        if at_end:
+            open_events[kind] = event.pk
+    state.open_events = open_events
+    return created
+
+
+def _more_extreme(kind, peak_value, peak_z, event):
+    if kind == "high":
+        return peak_value > event.peak_value
+    if kind == "low":
+        return peak_value < event.peak_value
+    return peak_z is not None and (event.peak_zscore is None or abs(peak_z) > abs(event.peak_zscore))
+
+
+def _to_datetime(ns):
+    return datetime.fromtimestamp(ns / 1e9, dt_timezone.utc)
@@ -1,9 +1,10 @@
 from django_filters import rest_framework as filters
-from .models import MicrogridData
+from .models import AnomalyEvent, MicrogridData, Site
 
 class MicrogridDataFilter(filters.FilterSet):
     min_power = filters.NumberFilter(field_name="ge_active_power", lookup_expr='gte')
     max_power = filters.NumberFilter(field_name="ge_active_power", lookup_expr='lte')
+    site = filters.ModelChoiceFilter(queryset=Site.objects.all(), to_field_name='slug')
     
     class Meta:
         model = MicrogridData
@@ -11,4 +12,16 @@ class MicrogridDataFilter(filters.FilterSet):
             'timestamp': ['gte', 'lte', 'exact'],
             'ge_active_power': ['gte', 'lte'],
             'pvpcs_active_power': ['gte', 'lte'],
-        }
\ No newline at end of file
+        }
+
+
+class AnomalyEventFilter(filters.FilterSet):
+    site = filters.ModelChoiceFilter(queryset=Site.objects.all(), to_field_name='slug')
+
+    class Meta:
+        model = AnomalyEvent
+        fields = {
+            'signal': ['exact'],
+            'kind': ['exact'],
+            'started_at': ['gte', 'lte'],
+        }
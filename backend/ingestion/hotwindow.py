@@ -0,0 +1,345 @@
+"""
+Hot window: the raw readings of the last HOT_WINDOW_HOURS hours of every
+site, stored column by column in Redis and shared by the web and worker
+processes, so recent-range KPIs and chart series are computed from NumPy
+arrays without touching the database.
+
+Per site, under the `hw:<site_id>` prefix:
+
+- `:seg:<start>`: one hash per segment of HOT_WINDOW_SEGMENT_SECONDS
+  seconds (start in epoch seconds), one binary field per column
+  (`timestamp` int64 UTC nanoseconds, measurements float64, NULL -> NaN);
+- `:versions`: segment start -> version, a random token written with every
+  rewrite of the segment, so a version is never reused, even once the
+  segment was dropped or Redis lost its keys. Each process keeps the
+  decoded segments in memory and only fetches the ones whose version
+  changed;
+- `:since`: UTC nanoseconds from which the window holds every reading of
+  the site; missing until the window is built.
+
+The database stays the reference: segments are rewritten from it after
+ingestion, edits and deletes (refresh_segments, refresh_range, once the
+transaction commits) and the `maintain_hot_window` task builds missing
+windows and drops the segments that slid out. A range starting before
+`since`, or a site compacted within the range, is served by the database,
+as is everything when Redis cannot be reached.
+"""
+import logging
+import uuid
+
+import numpy as np
+import pandas as pd
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import MicrogridData, Site
+from .services import MEASUREMENT_FIELDS, iter_reading_chunks
+
+logger = logging.getLogger(__name__)
+
+NS_PER_SECOND = 10**9
+TIMESTAMP_FIELD = "timestamp"
+LOCK_TIMEOUT_SECONDS = 120
+
+_client = None
+# (site_id, segment start) -> (version, {column: array}), per process
+_segments = {}
+
+
+def enabled():
+    return bool(settings.HOT_WINDOW_REDIS_URL) and settings.HOT_WINDOW_HOURS > 0
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.HOT_WINDOW_REDIS_URL, socket_timeout=1, socket_connect_timeout=1
+        )
+    return _client
+
+
+def _key(site_id, *parts):
+    return ":".join(("hw", str(site_id)) + tuple(str(part) for part in parts))
+
+
+def _segment_start(ns):
+    """Start (epoch seconds) of the segment holding the UTC nanoseconds `ns`."""
+    width = settings.HOT_WINDOW_SEGMENT_SECONDS
+    return int(ns) // NS_PER_SECOND // width * width
+
+
+def _segment_starts(timestamps):
+    """Sorted starts of the segments holding the UTC nanoseconds `timestamps`."""
+    width = settings.HOT_WINDOW_SEGMENT_SECONDS
+    return [int(start) for start in np.unique(np.asarray(timestamps, dtype="int64") // NS_PER_SECOND // width * width)]
+
+
+def _window_start_ns(now=None):
+    now = now or timezone.now()
+    return pd.Timestamp(now).value - settings.HOT_WINDOW_HOURS * 3600 * NS_PER_SECOND
+
+
+def _bound_ns(value):
+    """UTC nanoseconds of a range bound (datetime, date or ISO string), None if unparsable."""
+    if isinstance(value, str):
+        try:
+            value = parse_datetime(value) or parse_date(value)
+        except ValueError:
+            return None
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        value = value.tz_localize(timezone.get_current_timezone())
+    return value.value
+
+
+def _lock(client, site_id):
+    return client.lock(_key(site_id, "lock"), timeout=LOCK_TIMEOUT_SECONDS, blocking_timeout=LOCK_TIMEOUT_SECONDS)
+
+
+def _read_database(site_id, start_s, end_s=None):
+    """Readings of the site from `start_s` (to `end_s` excluded) as one array per column."""
+    queryset = MicrogridData.objects.filter(site_id=site_id, timestamp__gte=pd.Timestamp(start_s, unit="s", tz="UTC"))
+    if end_s is not None:
+        queryset = queryset.filter(timestamp__lt=pd.Timestamp(end_s, unit="s", tz="UTC"))
+    timestamps, columns = [np.empty(0, dtype="int64")], {field: [np.empty(0)] for field in MEASUREMENT_FIELDS}
+    for chunk_timestamps, chunk_columns in iter_reading_chunks(queryset, MEASUREMENT_FIELDS):
+        timestamps.append(chunk_timestamps)
+        for field in MEASUREMENT_FIELDS:
+            columns[field].append(chunk_columns[field].astype("float64"))
+    columns = {field: np.concatenate(parts) for field, parts in columns.items()}
+    columns[TIMESTAMP_FIELD] = np.concatenate(timestamps)
+    return columns
+
+
+def _write_segments(pipeline, site_id, starts, columns):
+    """Queue the rewrite of segments `starts` from `columns` (readings covering them, sorted)."""
+    width = settings.HOT_WINDOW_SEGMENT_SECONDS
+    timestamps = columns[TIMESTAMP_FIELD]
+    for start in starts:
+        left = np.searchsorted(timestamps, start * NS_PER_SECOND, side="left")
+        right = np.searchsorted(timestamps, (start + width) * NS_PER_SECOND, side="left")
+        key = _key(site_id, "seg", start)
+        if left == right:
+            pipeline.delete(key)
+            pipeline.hdel(_key(site_id, "versions"), start)
+            continue
+        pipeline.hset(key, mapping={
+            column: np.ascontiguousarray(values[left:right]).tobytes() for column, values in columns.items()
+        })
+        pipeline.hset(_key(site_id, "versions"), start, uuid.uuid4().hex)
+
+
+def rebuild(site_id, now=None):
+    """Load the whole window of a site from the database, replacing what Redis holds."""
+    client = get_client()
+    since = _segment_start(_window_start_ns(now))
+    with _lock(client, site_id):
+        columns = _read_database(site_id, since)
+        timestamps = columns[TIMESTAMP_FIELD]
+        starts = _segment_starts(timestamps)
+        pipeline = client.pipeline()
+        for old in client.hkeys(_key(site_id, "versions")):
+            if int(old) not in starts:
+                pipeline.delete(_key(site_id, "seg", int(old)))
+                pipeline.hdel(_key(site_id, "versions"), old)
+        _write_segments(pipeline, site_id, starts, columns)
+        pipeline.set(_key(site_id, "since"), since * NS_PER_SECOND)
+        pipeline.execute()
+    return len(timestamps)
+
+
+def trim(site_id, now=None):
+    """Drop the segments of a built window that slid out of it. Returns False if not built."""
+    client = get_client()
+    since = _segment_start(_window_start_ns(now))
+    with _lock(client, site_id):
+        built = client.get(_key(site_id, "since"))
+        if built is None:
+            return False
+        pipeline = client.pipeline()
+        for start in client.hkeys(_key(site_id, "versions")):
+            if int(start) < since:
+                pipeline.delete(_key(site_id, "seg", int(start)))
+                pipeline.hdel(_key(site_id, "versions"), start)
+        pipeline.set(_key(site_id, "since"), max(int(built), since * NS_PER_SECOND))
+        pipeline.execute()
+    return True
+
+
+def _refresh(site_id, starts):
+    client = get_client()
+    with _lock(client, site_id):
+        since = client.get(_key(site_id, "since"))
+        if since is None:
+            # Not built yet: the next rebuild reads these rows anyway
+            return
+        starts = sorted(start for start in starts if start >= _segment_start(int(since)))
+        if not starts:
+            return
+        width = settings.HOT_WINDOW_SEGMENT_SECONDS
+        pipeline = client.pipeline()
+        for start in starts:
+            _write_segments(pipeline, site_id, [start], _read_database(site_id, start, start + width))
+        pipeline.execute()
+
+
+def _refresh_on_commit(site_id, starts):
+    def run():
+        try:
+            _refresh(site_id, starts)
+        except redis.RedisError:
+            # A stale window must not survive a missed update
+            logger.exception("Hot window refresh failed for site %s, dropping it", site_id)
+            invalidate(site_id)
+    transaction.on_commit(run)
+
+
+def refresh_segments(site_id, timestamps):
+    """
+    Rewrite from the database, once the current transaction commits, the
+    segments of a site holding `timestamps` (UTC nanoseconds) that fall in
+    the window: call after writing rows at these timestamps.
+    """
+    if not enabled():
+        return
+    window_start = _segment_start(_window_start_ns())
+    starts = [start for start in _segment_starts(timestamps) if start >= window_start]
+    if starts:
+        _refresh_on_commit(site_id, starts)
+
+
+def refresh_range(site_id=None, start=None, end=None):
+    """
+    Rewrite the segments of [start, end] (either bound optional) held for
+    one site, or for every site: call after deleting the rows of a range.
+    """
+    if not enabled():
+        return
+    start_ns = _bound_ns(start) if start else None
+    end_ns = _bound_ns(end) if end else None
+    width = settings.HOT_WINDOW_SEGMENT_SECONDS
+    site_ids = [site_id] if site_id is not None else list(Site.objects.values_list("pk", flat=True))
+    try:
+        client = get_client()
+        for current in site_ids:
+            # Deleting only empties segments: the ones present are enough
+            starts = [
+                int(segment) for segment in client.hkeys(_key(current, "versions"))
+                if (start_ns is None or (int(segment) + width) * NS_PER_SECOND > start_ns)
+                and (end_ns is None or int(segment) * NS_PER_SECOND <= end_ns)
+            ]
+            if starts:
+                _refresh_on_commit(current, starts)
+    except redis.RedisError:
+        logger.exception("Hot window refresh failed, dropping the windows")
+        for current in site_ids:
+            invalidate(current)
+
+
+def invalidate(site_id):
+    """Forget the window of a site: ranges fall back to the database until it is rebuilt."""
+    try:
+        get_client().delete(_key(site_id, "since"))
+    except redis.RedisError:
+        logger.exception("Hot window of site %s could not be invalidated", site_id)
+
+
+def _decode(raw):
+    columns = {}
+    for column, payload in raw.items():
+        column = column.decode()
+        columns[column] = np.frombuffer(payload, dtype="int64" if column == TIMESTAMP_FIELD else "float64")
+    return columns
+
+
+def load(site_id, start_ns, end_ns, fields):
+    """
+    `(timestamps, columns)` of `fields` for the readings of a site in
+    [start_ns, end_ns] (UTC nanoseconds, bounds included), in timestamp
+    order, or None when the window does not cover `start_ns`.
+    """
+    client = get_client()
+    pipeline = client.pipeline()
+    pipeline.get(_key(site_id, "since"))
+    pipeline.hgetall(_key(site_id, "versions"))
+    since, versions = pipeline.execute()
+    if since is None or start_ns < int(since):
+        return None
+
+    versions = {int(start): version for start, version in versions.items()}
+    width = settings.HOT_WINDOW_SEGMENT_SECONDS
+    wanted = sorted(
+        start for start in versions
+        if (start + width) * NS_PER_SECOND > start_ns and start * NS_PER_SECOND <= end_ns
+    )
+    stale = [start for start in wanted if _segments.get((site_id, start), (None,))[0] != versions[start]]
+    if stale:
+        pipeline = client.pipeline()
+        for start in stale:
+            pipeline.hgetall(_key(site_id, "seg", start))
+        for start, raw in zip(stale, pipeline.execute()):
+            if raw:
+                _segments[(site_id, start)] = (versions[start], _decode(raw))
+            else:
+                # Evicted payload: never serve the copy of an older version
+                _segments.pop((site_id, start), None)
+    for cached in [key for key in _segments if key[0] == site_id and key[1] not in versions]:
+        del _segments[cached]
+
+    parts = [_segments[(site_id, start)][1] for start in wanted if (site_id, start) in _segments]
+    if not parts:
+        return np.empty(0, dtype="int64"), {field: np.empty(0) for field in fields}
+    timestamps = np.concatenate([part[TIMESTAMP_FIELD] for part in parts])
+    left = np.searchsorted(timestamps, start_ns, side="left")
+    right = np.searchsorted(timestamps, end_ns, side="right")
+    columns = {field: np.concatenate([part[field] for part in parts])[left:right] for field in fields}
+    return timestamps[left:right], columns
+
+
+def window_readings(start, end=None, site=None, fields=MEASUREMENT_FIELDS):
+    """
+    Readings of [start, end] (end open when omitted) from the hot window, as
+    a list of `(site, timestamps, columns)` per site (one site or all of
+    them), or None when the range must be read from the database.
+    """
+    if not enabled() or start is None:
+        return None
+    start_ns = _bound_ns(start)
+    end_ns = _bound_ns(end) if end is not None else np.iinfo("int64").max
+    if start_ns is None or end_ns is None:
+        return None
+    if any(field not in MEASUREMENT_FIELDS for field in fields):
+        return None
+    sites = [site] if site is not None else list(Site.objects.all())
+    readings = []
+    try:
+        for current in sites:
+            current = current if isinstance(current, Site) else Site.objects.get(pk=current)
+            # Compacted rows are only in the cold tier
+            if current.compacted_until is not None and _bound_ns(current.compacted_until) > start_ns:
+                return None
+            loaded = load(current.pk, start_ns, end_ns, fields)
+            if loaded is None:
+                return None
+            readings.append((current,) + loaded)
+    except redis.RedisError as exc:
+        logger.warning("Hot window unavailable (%s), reading from the database", exc)
+        return None
+    return readings
+
+
+def maintain(now=None):
+    """Build the missing windows and trim the others. Returns the sites rebuilt."""
+    rebuilt = []
+    for site_id in Site.objects.values_list("pk", flat=True):
+        if not trim(site_id, now):
+            rebuild(site_id, now)
+            rebuilt.append(site_id)
+    return rebuilt
+
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from ingestion.parsers import CSV_ENGINES, read_csv_file
+from ingestion.services import CSV_COLUMN_MAPPING, parse_readings
+
+
+def legacy_read(file_path, delimiter):
+    """Reading step of the original process_csv_file, kept as the baseline."""
+    try:
+        df = pd.read_csv(file_path, delimiter=delimiter, encoding="utf-8")
+    except UnicodeDecodeError:
+        df = pd.read_csv(file_path, delimiter=delimiter, encoding="latin-1")
+    df.columns = df.columns.str.strip()
+    df.rename(columns=CSV_COLUMN_MAPPING, inplace=True)
+    return df
+
+
+def write_synthetic_csv(file_path, rows, seed, compression=None):
+    """Export in the known layout: one reading per second, every column filled."""
+    rng = np.random.default_rng(seed)
+    timestamps = pd.date_range("2025-01-01", periods=rows, freq="s")
+    data = {"Timestamp": timestamps.strftime("%Y/%m/%d %H:%M:%S")}
+    for column, field in CSV_COLUMN_MAPPING.items():
+        if field not in ("timestamp", "site"):
+            data[column] = rng.normal(50, 10, rows).round(3)
+    pd.DataFrame(data).to_csv(file_path, index=False, compression=compression)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the CSV reading and parsing step of the ingestion pipeline: "
+        "the original pandas reader against each INGESTION_CSV_ENGINE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--file", help="Existing CSV export to read instead of a synthetic one.")
+        parser.add_argument("--delimiter", default=",")
+        parser.add_argument("--gzip", action="store_true", help="Compress the synthetic file.")
+        parser.add_argument("--repeat", type=int, default=3, help="Best of N runs.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        file_path = options["file"]
+        temporary = None
+        if not file_path:
+            suffix = ".csv.gz" if options["gzip"] else ".csv"
+            handle, temporary = tempfile.mkstemp(suffix=suffix)
+            os.close(handle)
+            write_synthetic_csv(temporary, options["rows"], options["seed"], "gzip" if options["gzip"] else None)
+            file_path = temporary
+        try:
+            self.stdout.write(f"{file_path}: {os.path.getsize(file_path) / 1e6:.1f} MB")
+            self._run("pandas (original)", lambda: self._legacy(file_path, options["delimiter"]), options["repeat"])
+            for engine in CSV_ENGINES:
+                self._run(
+                    f"engine {engine}",
+                    lambda engine=engine: self._engine(file_path, options["delimiter"], engine),
+                    options["repeat"],
+                )
+        finally:
+            if temporary:
+                os.remove(temporary)
+
+    def _legacy(self, file_path, delimiter):
+        started = time.perf_counter()
+        df = legacy_read(file_path, delimiter)
+        read = time.perf_counter() - started
+        readings, skipped = parse_readings(df, site_id=1)
+        return read, time.perf_counter() - started - read, len(readings), len(skipped)
+
+    def _engine(self, file_path, delimiter, engine):
+        started = time.perf_counter()
+        df, csv_format = read_csv_file(file_path, delimiter, engine=engine)
+        read = time.perf_counter() - started
+        readings, skipped = parse_readings(df, site_id=1, timestamp_format=csv_format["timestamp_format"])
+        return read, time.perf_counter() - started - read, len(readings), len(skipped)
+
+    def _run(self, label, function, repeat):
+        runs = [function() for _ in range(max(repeat, 1))]
+        read, parse, kept, skipped = min(runs, key=lambda run: run[0] + run[1])
+        total = read + parse
+        self.stdout.write(
+            f"{label:<20} read {read:7.3f} s  parse {parse:7.3f} s  total {total:7.3f} s "
+            f"{kept / total / 1e6:6.2f} M rows/s  ({kept} kept, {skipped} skipped)"
+        )
@@ -0,0 +1,200 @@
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from ingestion.models import IngestionRun, Site
+from ingestion.parsers import is_csv_file, sniff_csv
+from ingestion.tasks import process_csv_file
+
+CHECKPOINT_VERSION = 1
+
+
+def ingest_file(file_path, delimiter, site_id):
+    """
+    Ingest one file in place, as process_csv_file does for uploads: rows and
+    their anomaly detection are committed chunk by chunk, so workers of the
+    same site only wait on each other for one chunk. A failed or interrupted
+    file keeps the chunks it committed; ingesting it again skips them as
+    'already_ingested' (its run records the file's span before writing).
+    Returns `(file_path, run_id, result)`.
+    """
+    started = time.perf_counter()
+    run = IngestionRun.objects.create(file_name=file_path[-255:], site_id=site_id)
+    result = process_csv_file(file_path, delimiter, site_id, run.pk, keep_file=True)
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    return file_path, run.pk, result
+
+
+def collect_files(sources):
+    """CSV files (compressed or not) of the given directories and glob patterns."""
+    files = set()
+    for source in sources:
+        if os.path.isdir(source):
+            for root, _, names in os.walk(source):
+                files.update(os.path.join(root, name) for name in names)
+        else:
+            files.update(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+    return sorted(os.path.abspath(path) for path in files if is_csv_file(path))
+
+
+def order_by_timestamp(files, delimiter):
+    """Files sorted by their first timestamp; files without one come last."""
+    def key(file_path):
+        try:
+            first = sniff_csv(file_path, delimiter)["first_timestamp"]
+        except (OSError, ValueError):
+            first = None
+        first = pd.to_datetime(first, errors="coerce") if first else pd.NaT
+        return (pd.isna(first), first if not pd.isna(first) else pd.Timestamp.min, file_path)
+    return sorted(files, key=key)
+
+
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class Checkpoint:
+    """
+    JSON record of the files already ingested, keyed by absolute path with
+    their size and modification time: a file changed since is ingested again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") != CHECKPOINT_VERSION:
+                raise CommandError(f"Unsupported checkpoint file: {path}")
+            self.files = data["files"]
+
+    def is_done(self, file_path):
+        entry = self.files.get(file_path)
+        return bool(entry) and entry["status"] == "completed" and entry["signature"] == file_signature(file_path)
+
+    def record(self, file_path, run_id, result):
+        self.files[file_path] = {
+            "signature": file_signature(file_path),
+            "status": result["status"],
+            "run_id": run_id,
+            "imported_rows": result.get("imported_rows", 0),
+            "skipped_rows": result.get("skipped_rows", 0),
+            "error": result.get("error", ""),
+            "at": timezone.now().isoformat(),
+        }
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        # Write then rename, so an interruption never truncates the checkpoint
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump({"version": CHECKPOINT_VERSION, "files": self.files}, f, indent=1)
+        os.replace(temporary, self.path)
+
+
+class Command(BaseCommand):
+    help = (
+        "Ingest historical CSV exports (plain, .gz or .bz2) straight from disk, "
+        "oldest first, with the parsing and validation of uploads. Progress is "
+        "checkpointed: rerun the same command to resume an interrupted backfill. "
+        "With several workers files run concurrently, so the anomaly detection "
+        "of one site sees them in approximate rather than strict order."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("sources", nargs="+", help="Directories (walked recursively) or glob patterns.")
+        parser.add_argument("--site", help="Slug of the site the rows belong to (default site when omitted).")
+        parser.add_argument("--delimiter", default=",", help="Expected delimiter; sniffed when it does not fit.")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parallel worker processes.")
+        parser.add_argument(
+            "--checkpoint",
+            default="bulk_ingest_checkpoint.json",
+            help="Checkpoint file (default: bulk_ingest_checkpoint.json in the current directory).",
+        )
+        parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and ingest every file.")
+        parser.add_argument("--dry-run", action="store_true", help="List the files in ingestion order and stop.")
+
+    def handle(self, *args, **options):
+        site_id = None
+        if options["site"]:
+            site = Site.objects.filter(slug=options["site"]).first()
+            if site is None:
+                raise CommandError(f"Unknown site: {options['site']}")
+            site_id = site.pk
+
+        files = collect_files(options["sources"])
+        if not files:
+            raise CommandError("No CSV files found.")
+        delimiter = options["delimiter"]
+        files = order_by_timestamp(files, delimiter)
+
+        checkpoint = Checkpoint(options["checkpoint"])
+        if options["restart"]:
+            checkpoint.files = {}
+        pending = [file_path for file_path in files if not checkpoint.is_done(file_path)]
+        self.stdout.write(f"{len(files)} files, {len(files) - len(pending)} already ingested, {len(pending)} to go.")
+        if options["dry_run"]:
+            for file_path in pending:
+                self.stdout.write(file_path)
+            return
+
+        workers = max(1, min(options["workers"], len(pending) or 1))
+        totals = {"completed": 0, "failed": 0, "imported_rows": 0, "skipped_rows": 0}
+        started = time.perf_counter()
+        try:
+            for done, (file_path, run_id, result) in enumerate(
+                self._ingest(pending, delimiter, site_id, workers), start=1
+            ):
+                checkpoint.record(file_path, run_id, result)
+                totals[result["status"]] += 1
+                totals["imported_rows"] += result.get("imported_rows", 0)
+                totals["skipped_rows"] += result.get("skipped_rows", 0)
+                self._report(done, len(pending), file_path, result)
+        except KeyboardInterrupt:
+            raise CommandError("Interrupted: rerun the command to resume.")
+
+        elapsed = time.perf_counter() - started
+        style = self.style.SUCCESS if not totals["failed"] else self.style.WARNING
+        self.stdout.write(style(
+            f"{totals['completed']} files ingested, {totals['failed']} failed: "
+            f"{totals['imported_rows']} rows imported, {totals['skipped_rows']} skipped "
+            f"in {elapsed:.1f} s with {workers} workers."
+        ))
+
+    def _ingest(self, files, delimiter, site_id, workers):
+        """Yield ingest_file results as files complete."""
+        if workers == 1:
+            for file_path in files:
+                yield ingest_file(file_path, delimiter, site_id)
+            return
+        # Forked workers must open their own database connections
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            # Submitted oldest first; the pool takes them in that order
+            futures = [executor.submit(ingest_file, file_path, delimiter, site_id) for file_path in files]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _report(self, done, total, file_path, result):
+        prefix = f"[{done}/{total}] {file_path}:"
+        if result["status"] == "completed":
+            self.stdout.write(
+                f"{prefix} {result['imported_rows']} imported, {result['skipped_rows']} skipped "
+                f"({result['seconds']} s)"
+            )
+        else:
+            self.stderr.write(f"{prefix} failed: {result.get('error', '')}")
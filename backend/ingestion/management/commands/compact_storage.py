@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ingestion.services import (
+    MEASUREMENT_FIELDS,
+    MEASUREMENT_PRECISIONS,
+    readings_storage_stats,
+    set_measurement_precision,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Switch the measurement columns of the readings table between 8-byte "
+        "double precision and compact 4-byte real storage. Rewrites the table "
+        "under an exclusive lock; run it in a maintenance window."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--precision",
+            choices=sorted(MEASUREMENT_PRECISIONS),
+            default="real",
+            help="Target column type (default: real).",
+        )
+        parser.add_argument(
+            "--fields",
+            nargs="+",
+            choices=MEASUREMENT_FIELDS,
+            default=MEASUREMENT_FIELDS,
+            metavar="FIELD",
+            help="Measurement fields to convert (default: all of them).",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Compact storage is only supported on PostgreSQL.")
+
+        before = readings_storage_stats()
+        altered = set_measurement_precision(options["precision"], options["fields"])
+        if not altered:
+            self.stdout.write("Nothing to do: the columns already use that type.")
+            return
+        after = readings_storage_stats()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Converted {len(altered)} columns to {MEASUREMENT_PRECISIONS[options['precision']]}."
+        ))
+        self.stdout.write(
+            f"Tuple size:    {before['tuple_bytes']} -> {after['tuple_bytes']} bytes"
+        )
+        self.stdout.write(
+            f"Bytes per row: {before['bytes_per_row']} -> {after['bytes_per_row']} (heap + indexes)"
+        )
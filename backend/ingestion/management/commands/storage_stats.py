@@ -0,0 +1,27 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ingestion.services import measurement_column_types, readings_storage_stats
+
+
+class Command(BaseCommand):
+    help = "Report the on-disk size of the readings table and its bytes per row."
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("Storage statistics are only available on PostgreSQL.")
+
+        stats = readings_storage_stats()
+        self.stdout.write(f"Rows:          {stats['rows']}")
+        self.stdout.write(f"Heap:          {stats['heap_bytes']} bytes")
+        self.stdout.write(f"Indexes:       {stats['index_bytes']} bytes")
+        self.stdout.write(f"Total:         {stats['total_bytes']} bytes")
+        self.stdout.write(f"Tuple size:    {stats['tuple_bytes']} bytes (average)")
+        self.stdout.write(f"Bytes per row: {stats['bytes_per_row']} (heap + indexes)")
+
+        types = measurement_column_types()
+        summary = ", ".join(f"{count} {sql_type}" for sql_type, count in sorted(Counter(types.values()).items()))
+        self.stdout.write(f"Measurement columns: {summary}")
+
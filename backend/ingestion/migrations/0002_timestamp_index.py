@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='microgriddata',
+            name='timestamp',
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
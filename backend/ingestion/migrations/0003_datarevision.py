@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0002_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
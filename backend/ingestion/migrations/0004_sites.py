@@ -0,0 +1,86 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def assign_default_site(apps, schema_editor):
+    Site = apps.get_model("ingestion", "Site")
+    MicrogridData = apps.get_model("ingestion", "MicrogridData")
+    DataRevision = apps.get_model("ingestion", "DataRevision")
+    site, _ = Site.objects.get_or_create(slug="default", defaults={"name": "Default site"})
+    MicrogridData.objects.filter(site__isnull=True).update(site=site)
+    DataRevision.objects.filter(site__isnull=True).update(site=site)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ingestion", "0003_datarevision"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Site",
+            fields=[
+                ("id", models.SmallAutoField(primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=100)),
+                ("slug", models.SlugField(unique=True)),
+                ("description", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["name"],
+            },
+        ),
+        migrations.AddField(
+            model_name="microgriddata",
+            name="site",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="readings",
+                to="ingestion.site",
+            ),
+        ),
+        migrations.AddField(
+            model_name="datarevision",
+            name="site",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="revisions",
+                to="ingestion.site",
+            ),
+        ),
+        migrations.RunPython(assign_default_site, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="microgriddata",
+            name="site",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="readings",
+                to="ingestion.site",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="datarevision",
+            name="site",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="revisions",
+                to="ingestion.site",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="datarevision",
+            name="day",
+            field=models.DateField(),
+        ),
+        migrations.AlterUniqueTogether(
+            name="datarevision",
+            unique_together={("site", "day")},
+        ),
+        migrations.AddIndex(
+            model_name="microgriddata",
+            index=models.Index(fields=["site", "timestamp"], name="mgdata_site_timestamp_idx"),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0004_sites'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='site',
+            name='compacted_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ReadingAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField()),
+                ('battery_active_power', models.FloatField(blank=True, null=True)),
+                ('battery_active_power_set_response', models.FloatField(blank=True, null=True)),
+                ('pvpcs_active_power', models.FloatField(blank=True, null=True)),
+                ('ge_body_active_power', models.FloatField(blank=True, null=True)),
+                ('ge_active_power', models.FloatField(blank=True, null=True)),
+                ('ge_body_active_power_set_response', models.FloatField(blank=True, null=True)),
+                ('fc_active_power_fc_end_set', models.FloatField(blank=True, null=True)),
+                ('fc_active_power', models.FloatField(blank=True, null=True)),
+                ('fc_active_power_fc_end_set_response', models.FloatField(blank=True, null=True)),
+                ('island_mode_mccb_active_power', models.FloatField(blank=True, null=True)),
+                ('mg_lv_msb_ac_voltage', models.FloatField(blank=True, null=True)),
+                ('receiving_point_ac_voltage', models.FloatField(blank=True, null=True)),
+                ('island_mode_mccb_ac_voltage', models.FloatField(blank=True, null=True)),
+                ('island_mode_mccb_frequency', models.FloatField(blank=True, null=True)),
+                ('mg_lv_msb_frequency', models.FloatField(blank=True, null=True)),
+                ('inlet_temperature_of_chilled_water', models.FloatField(blank=True, null=True)),
+                ('outlet_temperature', models.FloatField(blank=True, null=True)),
+                ('battery_active_power_energy', models.FloatField(blank=True, null=True)),
+                ('pvpcs_active_power_energy', models.FloatField(blank=True, null=True)),
+                ('fc_active_power_energy', models.FloatField(blank=True, null=True)),
+                ('ge_active_power_energy', models.FloatField(blank=True, null=True)),
+                ('battery_active_power_min', models.FloatField(blank=True, null=True)),
+                ('battery_active_power_max', models.FloatField(blank=True, null=True)),
+                ('pvpcs_active_power_min', models.FloatField(blank=True, null=True)),
+                ('pvpcs_active_power_max', models.FloatField(blank=True, null=True)),
+                ('fc_active_power_min', models.FloatField(blank=True, null=True)),
+                ('fc_active_power_max', models.FloatField(blank=True, null=True)),
+                ('ge_active_power_min', models.FloatField(blank=True, null=True)),
+                ('ge_active_power_max', models.FloatField(blank=True, null=True)),
+                ('production_max', models.FloatField(blank=True, null=True)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='aggregates', to='ingestion.site')),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'unique_together': {('site', 'timestamp')},
+            },
+        ),
+    ]
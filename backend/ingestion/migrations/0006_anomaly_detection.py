@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0005_reading_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnomalyEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signal', models.CharField(max_length=64)),
+                ('kind', models.CharField(choices=[('high', 'Above maximum'), ('low', 'Below minimum'), ('zscore', 'Statistical outlier')], max_length=10)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField(default=1)),
+                ('peak_value', models.FloatField()),
+                ('peak_zscore', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to='ingestion.site')),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['site', 'started_at'], name='anomaly_site_started_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DetectorState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('signal', models.CharField(max_length=64)),
+                ('mean', models.FloatField(default=0.0)),
+                ('variance', models.FloatField(default=0.0)),
+                ('sample_count', models.PositiveBigIntegerField(default=0)),
+                ('last_timestamp', models.DateTimeField(blank=True, null=True)),
+                ('open_events', models.JSONField(blank=True, default=dict)),
+                ('site', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detector_states', to='ingestion.site')),
+            ],
+            options={
+                'unique_together': {('site', 'signal')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0006_anomaly_detection'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255)),
+                ('task_id', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('total_rows', models.PositiveIntegerField(default=0)),
+                ('imported_rows', models.PositiveIntegerField(default=0)),
+                ('skipped_rows', models.PositiveIntegerField(default=0)),
+                ('quality', models.JSONField(blank=True, default=dict)),
+                ('timings', models.JSONField(blank=True, default=dict)),
+                ('error_message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('site', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingestion_runs', to='ingestion.site')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
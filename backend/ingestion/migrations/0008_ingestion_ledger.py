@@ -0,0 +1,33 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0007_ingestion_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionrun',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='ingestionrun',
+            name='first_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ingestionrun',
+            name='header_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='ingestionrun',
+            name='last_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
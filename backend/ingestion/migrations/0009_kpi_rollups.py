@@ -0,0 +1,128 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:26
+
+from django.db import migrations, models
+
+# The view definitions are frozen here; later changes go in new migrations.
+# Days are UTC days (TIME_ZONE), like those of DataRevision.
+CREATE_HOURLY_VIEW = """
+CREATE MATERIALIZED VIEW ingestion_kpi_hourly AS
+WITH minutes AS (
+    SELECT r.site_id,
+        date_bin('1 minute', r.timestamp, TIMESTAMPTZ '1970-01-01 00:00:00+00') AS minute,
+        count(*) AS sample_count,
+        avg(coalesce(r.battery_active_power, 0)) / 60 AS battery_active_power_energy,
+        avg(coalesce(r.pvpcs_active_power, 0)) / 60 AS pvpcs_active_power_energy,
+        avg(coalesce(r.fc_active_power, 0)) / 60 AS fc_active_power_energy,
+        avg(coalesce(r.ge_active_power, 0)) / 60 AS ge_active_power_energy,
+        sum(r.mg_lv_msb_ac_voltage) AS mg_lv_msb_ac_voltage_sum,
+        count(r.mg_lv_msb_ac_voltage) AS mg_lv_msb_ac_voltage_count,
+        sum(r.mg_lv_msb_frequency) AS mg_lv_msb_frequency_sum,
+        count(r.mg_lv_msb_frequency) AS mg_lv_msb_frequency_count,
+        max(r.ge_active_power) AS ge_active_power_max,
+        max(coalesce(r.battery_active_power, 0) + coalesce(r.pvpcs_active_power, 0)
+            + coalesce(r.fc_active_power, 0)) AS production_max
+    FROM ingestion_microgriddata r JOIN ingestion_site s ON s.id = r.site_id
+    WHERE s.compacted_until IS NULL OR r.timestamp >= s.compacted_until
+    GROUP BY r.site_id, minute
+    UNION ALL
+    SELECT a.site_id, a.timestamp,
+        a.sample_count,
+        a.battery_active_power_energy,
+        a.pvpcs_active_power_energy,
+        a.fc_active_power_energy,
+        a.ge_active_power_energy,
+        a.mg_lv_msb_ac_voltage * a.sample_count,
+        CASE WHEN a.mg_lv_msb_ac_voltage IS NULL THEN 0 ELSE a.sample_count END,
+        a.mg_lv_msb_frequency * a.sample_count,
+        CASE WHEN a.mg_lv_msb_frequency IS NULL THEN 0 ELSE a.sample_count END,
+        a.ge_active_power_max,
+        a.production_max
+    FROM ingestion_readingaggregate a JOIN ingestion_site s ON s.id = a.site_id
+    WHERE a.timestamp < s.compacted_until
+),
+hours AS (
+    SELECT site_id,
+        date_bin('1 hour', minute, TIMESTAMPTZ '1970-01-01 00:00:00+00') AS period_start,
+        sum(sample_count)::double precision AS sample_count,
+        sum(battery_active_power_energy)::double precision AS battery_active_power_energy,
+        sum(pvpcs_active_power_energy)::double precision AS pvpcs_active_power_energy,
+        sum(fc_active_power_energy)::double precision AS fc_active_power_energy,
+        sum(ge_active_power_energy)::double precision AS ge_active_power_energy,
+        sum(mg_lv_msb_ac_voltage_sum)::double precision AS mg_lv_msb_ac_voltage_sum,
+        sum(mg_lv_msb_ac_voltage_count)::double precision AS mg_lv_msb_ac_voltage_count,
+        sum(mg_lv_msb_frequency_sum)::double precision AS mg_lv_msb_frequency_sum,
+        sum(mg_lv_msb_frequency_count)::double precision AS mg_lv_msb_frequency_count,
+        max(ge_active_power_max) AS ge_active_power_max,
+        max(production_max) AS production_max
+    FROM minutes GROUP BY site_id, period_start
+)
+SELECT h.*, h.period_start + interval '1 hour' AS period_end,
+    (h.period_start AT TIME ZONE 'UTC')::date AS day,
+    coalesce(v.version, 0) AS revision
+FROM hours h LEFT JOIN ingestion_datarevision v
+    ON v.site_id = h.site_id AND v.day = (h.period_start AT TIME ZONE 'UTC')::date
+"""
+
+CREATE_DAILY_VIEW = """
+CREATE MATERIALIZED VIEW ingestion_kpi_daily AS
+SELECT site_id, day,
+    (day::timestamp AT TIME ZONE 'UTC') AS period_start,
+    ((day + 1)::timestamp AT TIME ZONE 'UTC') AS period_end,
+    sum(sample_count)::double precision AS sample_count,
+    sum(battery_active_power_energy)::double precision AS battery_active_power_energy,
+    sum(pvpcs_active_power_energy)::double precision AS pvpcs_active_power_energy,
+    sum(fc_active_power_energy)::double precision AS fc_active_power_energy,
+    sum(ge_active_power_energy)::double precision AS ge_active_power_energy,
+    sum(mg_lv_msb_ac_voltage_sum)::double precision AS mg_lv_msb_ac_voltage_sum,
+    sum(mg_lv_msb_ac_voltage_count)::double precision AS mg_lv_msb_ac_voltage_count,
+    sum(mg_lv_msb_frequency_sum)::double precision AS mg_lv_msb_frequency_sum,
+    sum(mg_lv_msb_frequency_count)::double precision AS mg_lv_msb_frequency_count,
+    max(ge_active_power_max) AS ge_active_power_max,
+    max(production_max) AS production_max,
+    max(revision) AS revision
+FROM ingestion_kpi_hourly GROUP BY site_id, day
+"""
+
+# Unique indexes: required by REFRESH ... CONCURRENTLY, and the lookup path
+CREATE_INDEXES = (
+    "CREATE UNIQUE INDEX ingestion_kpi_hourly_site_period ON ingestion_kpi_hourly (site_id, period_start)",
+    "CREATE UNIQUE INDEX ingestion_kpi_daily_site_period ON ingestion_kpi_daily (site_id, period_start)",
+)
+
+DROP_VIEWS = (
+    "DROP MATERIALIZED VIEW IF EXISTS ingestion_kpi_daily",
+    "DROP MATERIALIZED VIEW IF EXISTS ingestion_kpi_hourly",
+)
+
+
+def create_rollup_views(apps, schema_editor):
+    # Materialized views are PostgreSQL only; elsewhere KPIs read the tables
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in (CREATE_HOURLY_VIEW, CREATE_DAILY_VIEW) + CREATE_INDEXES:
+            schema_editor.execute(statement)
+
+
+def drop_rollup_views(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in DROP_VIEWS:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0008_ingestion_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('requested_at', models.DateTimeField(blank=True, null=True)),
+                ('pending_since', models.DateTimeField(blank=True, null=True)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_rollup_views, drop_rollup_views),
+    ]
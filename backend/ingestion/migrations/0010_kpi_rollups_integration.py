@@ -0,0 +1,185 @@
+from importlib import import_module
+
+from django.db import migrations
+
+# Rebuild the KPI rollup views so their energies follow the default
+# KPI_INTEGRATION ('trapezoid', max_gap_seconds 900, missing 'skip', no
+# resampling) instead of per-minute mean power. Per hour and power signal the
+# hourly view keeps:
+# - `<field>_energy`: compacted minutes plus the trapezoids between two
+#   readings of the hour;
+# - `<field>_lead_energy` / `<field>_lead_from`: the trapezoid joining the
+#   hour's first reading to the previous one (earlier hour), and when that
+#   previous reading was taken;
+# - `<field>_first_at` / `<field>_first` / `<field>_last_at` / `<field>_last`:
+#   first and last reading, so a reader joins consecutive periods exactly as
+#   a scan of the readings would.
+# The daily view adds the leads that stay inside the day. Days are UTC days.
+EPOCH = "TIMESTAMPTZ '1970-01-01 00:00:00+00'"
+POWER_FIELDS = ("battery_active_power", "pvpcs_active_power", "fc_active_power", "ge_active_power")
+MEAN_FIELDS = ("mg_lv_msb_ac_voltage", "mg_lv_msb_frequency")
+MAX_GAP = "interval '900 seconds'"
+
+
+def _steps(field):
+    return f"""
+{field}_steps AS (
+    SELECT site_id, id, timestamp, value, previous_at,
+        date_bin('1 hour', timestamp, {EPOCH}) AS period_start,
+        CASE WHEN timestamp - previous_at <= {MAX_GAP}
+            THEN (previous + value) / 2 * extract(epoch FROM timestamp - previous_at)::double precision / 3600
+        END AS energy
+    FROM (
+        SELECT site_id, id, timestamp, {field} AS value,
+            lag(timestamp) OVER w AS previous_at, lag({field}) OVER w AS previous
+        FROM raw WHERE {field} IS NOT NULL
+        WINDOW w AS (PARTITION BY site_id ORDER BY timestamp, id)
+    ) readings
+),
+{field}_hours AS (
+    SELECT site_id, period_start,
+        sum(energy) FILTER (WHERE previous_at >= period_start) AS energy,
+        sum(energy) FILTER (WHERE previous_at < period_start) AS lead_energy,
+        max(previous_at) FILTER (WHERE previous_at < period_start) AS lead_from,
+        min(timestamp) AS first_at,
+        (array_agg(value ORDER BY timestamp, id))[1] AS first_reading,
+        max(timestamp) AS last_at,
+        (array_agg(value ORDER BY timestamp DESC, id DESC))[1] AS last_reading
+    FROM {field}_steps GROUP BY site_id, period_start
+)"""
+
+
+def _mean_columns():
+    return ", ".join(f"sum({field}) AS {field}_sum, count({field}) AS {field}_count" for field in MEAN_FIELDS)
+
+
+RAW_HOURS = f"""
+raw AS (
+    SELECT r.* FROM ingestion_microgriddata r JOIN ingestion_site s ON s.id = r.site_id
+    WHERE s.compacted_until IS NULL OR r.timestamp >= s.compacted_until
+),
+parts AS (
+    SELECT site_id, date_bin('1 hour', timestamp, {EPOCH}) AS period_start,
+        count(*) AS sample_count,
+        {", ".join(f"NULL::double precision AS {field}_energy" for field in POWER_FIELDS)},
+        {_mean_columns()},
+        max(coalesce(ge_active_power, 0)) AS ge_active_power_max,
+        max(coalesce(battery_active_power, 0) + coalesce(pvpcs_active_power, 0)
+            + coalesce(fc_active_power, 0)) AS production_max
+    FROM raw GROUP BY site_id, period_start
+    UNION ALL
+    SELECT a.site_id, date_bin('1 hour', a.timestamp, {EPOCH}),
+        sum(a.sample_count),
+        {", ".join(f"sum(a.{field}_energy)" for field in POWER_FIELDS)},
+        {", ".join(
+            f"sum(a.{field} * a.sample_count), sum(CASE WHEN a.{field} IS NULL THEN 0 ELSE a.sample_count END)"
+            for field in MEAN_FIELDS
+        )},
+        max(coalesce(a.ge_active_power_max, 0)),
+        max(coalesce(a.production_max, 0))
+    FROM ingestion_readingaggregate a JOIN ingestion_site s ON s.id = a.site_id
+    WHERE a.timestamp < s.compacted_until
+    GROUP BY a.site_id, 2
+),
+hours AS (
+    SELECT site_id, period_start,
+        sum(sample_count)::double precision AS sample_count,
+        {", ".join(f"sum({field}_energy) AS {field}_energy" for field in POWER_FIELDS)},
+        {", ".join(
+            f"sum({field}_{stat})::double precision AS {field}_{stat}"
+            for field in MEAN_FIELDS for stat in ("sum", "count")
+        )},
+        max(ge_active_power_max) AS ge_active_power_max,
+        max(production_max) AS production_max
+    FROM parts GROUP BY site_id, period_start
+)"""
+
+CREATE_HOURLY_VIEW = (
+    "CREATE MATERIALIZED VIEW ingestion_kpi_hourly AS WITH"
+    + RAW_HOURS + ","
+    + ",".join(_steps(field) for field in POWER_FIELDS)
+    + f"""
+SELECT h.site_id, h.period_start, h.period_start + interval '1 hour' AS period_end,
+    (h.period_start AT TIME ZONE 'UTC')::date AS day,
+    coalesce(v.version, 0) AS revision,
+    h.sample_count,
+    {", ".join(
+        f"coalesce(h.{field}_energy, 0) + coalesce({field}.energy, 0) AS {field}_energy, "
+        f"{field}.lead_energy AS {field}_lead_energy, {field}.lead_from AS {field}_lead_from, "
+        f"{field}.first_at AS {field}_first_at, {field}.first_reading AS {field}_first, "
+        f"{field}.last_at AS {field}_last_at, {field}.last_reading AS {field}_last"
+        for field in POWER_FIELDS
+    )},
+    {", ".join(f"h.{field}_{stat}" for field in MEAN_FIELDS for stat in ("sum", "count"))},
+    h.ge_active_power_max, h.production_max
+FROM hours h
+LEFT JOIN ingestion_datarevision v
+    ON v.site_id = h.site_id AND v.day = (h.period_start AT TIME ZONE 'UTC')::date
+"""
+    + "".join(
+        f"LEFT JOIN {field}_hours {field} ON {field}.site_id = h.site_id AND {field}.period_start = h.period_start\n"
+        for field in POWER_FIELDS
+    )
+)
+
+CREATE_DAILY_VIEW = f"""
+CREATE MATERIALIZED VIEW ingestion_kpi_daily AS
+SELECT site_id, day,
+    (day::timestamp AT TIME ZONE 'UTC') AS period_start,
+    ((day + 1)::timestamp AT TIME ZONE 'UTC') AS period_end,
+    max(revision) AS revision,
+    sum(sample_count)::double precision AS sample_count,
+    {", ".join(
+        f"sum({field}_energy) + coalesce(sum({field}_lead_energy) "
+        f"FILTER (WHERE {field}_lead_from >= (day::timestamp AT TIME ZONE 'UTC')), 0) AS {field}_energy, "
+        f"min({field}_first_at) AS {field}_first_at, "
+        f"(array_agg({field}_first ORDER BY period_start)"
+        f" FILTER (WHERE {field}_first IS NOT NULL))[1] AS {field}_first, "
+        f"max({field}_last_at) AS {field}_last_at, "
+        f"(array_agg({field}_last ORDER BY period_start DESC)"
+        f" FILTER (WHERE {field}_last IS NOT NULL))[1] AS {field}_last"
+        for field in POWER_FIELDS
+    )},
+    {", ".join(
+        f"sum({field}_{stat})::double precision AS {field}_{stat}"
+        for field in MEAN_FIELDS for stat in ("sum", "count")
+    )},
+    max(ge_active_power_max) AS ge_active_power_max,
+    max(production_max) AS production_max
+FROM ingestion_kpi_hourly GROUP BY site_id, day
+"""
+
+CREATE_INDEXES = (
+    "CREATE UNIQUE INDEX ingestion_kpi_hourly_site_period ON ingestion_kpi_hourly (site_id, period_start)",
+    "CREATE UNIQUE INDEX ingestion_kpi_daily_site_period ON ingestion_kpi_daily (site_id, period_start)",
+)
+
+DROP_VIEWS = (
+    "DROP MATERIALIZED VIEW IF EXISTS ingestion_kpi_daily",
+    "DROP MATERIALIZED VIEW IF EXISTS ingestion_kpi_hourly",
+)
+
+
+def create_rollup_views(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in DROP_VIEWS + (CREATE_HOURLY_VIEW, CREATE_DAILY_VIEW) + CREATE_INDEXES:
+            schema_editor.execute(statement)
+
+
+def restore_rollup_views(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        previous = import_module('ingestion.migrations.0009_kpi_rollups')
+        statements = (previous.CREATE_HOURLY_VIEW, previous.CREATE_DAILY_VIEW) + previous.CREATE_INDEXES
+        for statement in DROP_VIEWS + statements:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0009_kpi_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rollup_views, restore_rollup_views),
+    ]
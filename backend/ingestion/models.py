@@ -1,8 +1,41 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+DEFAULT_SITE_SLUG = "default"
+
+
+class Site(models.Model):
+    """
+    A monitored microgrid. Readings reference it through a 2-byte key so the
+    site dimension adds almost nothing to the size of MicrogridData rows.
+    """
+    id = models.SmallAutoField(primary_key=True)
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=50, unique=True)
+    description = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Readings before this instant live in ReadingAggregate (cold tier)
+    compacted_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["name"]
+
+    @classmethod
+    def default(cls):
+        """Site used for uploads and legacy data that do not name one."""
+        site, _ = cls.objects.get_or_create(
+            slug=DEFAULT_SITE_SLUG, defaults={"name": "Default site"}
+        )
+        return site
+
+    def __str__(self):
+        return self.name
 
 
 class MicrogridData(models.Model):
-    timestamp = models.DateTimeField()
+    site = models.ForeignKey(Site, on_delete=models.PROTECT, related_name="readings")
+    timestamp = models.DateTimeField(db_index=True)
 
     battery_active_power = models.FloatField(null=True, blank=True)
     battery_active_power_set_response = models.FloatField(null=True, blank=True)
@@ -30,6 +63,210 @@ class MicrogridData(models.Model):
 
     class Meta:
         ordering = ["timestamp"]
+        indexes = [
+            # Per-site range scans: WHERE site_id = ? AND timestamp BETWEEN ...
+            models.Index(fields=["site", "timestamp"], name="mgdata_site_timestamp_idx"),
+        ]
 
     def __str__(self):
         return f"{self.timestamp} | PV={self.pvpcs_active_power} | GE={self.ge_active_power}"
+
+
+class DataRevision(models.Model):
+    """
+    Per-site, per-day change counter for MicrogridData.
+
+    Every write touching a day (ingestion, edit, delete) increments its
+    version, so the sum of versions over a date range changes whenever the
+    data of that range changes.
+    """
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name="revisions")
+    day = models.DateField()
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = [("site", "day")]
+
+    def __str__(self):
+        return f"{self.site_id}/{self.day} v{self.version}"
+
+
+class RollupRefresh(models.Model):
+    """
+    Debounce state of the KPI rollup views (see ingestion.rollups), a single
+    row: when a refresh was last requested, since when one is pending, and
+    when the views were last refreshed.
+    """
+    requested_at = models.DateTimeField(null=True, blank=True)
+    pending_since = models.DateTimeField(null=True, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"rollups refreshed at {self.refreshed_at}"
+
+
+class ReadingAggregate(models.Model):
+    """
+    Cold tier of MicrogridData: one row per site and minute for readings
+    older than RAW_DATA_TIER_AFTER_DAYS (see services.compact_site_readings).
+
+    Measurement columns hold the per-minute mean under the same names as
+    MicrogridData, so range filters and streamed readers work on both tiers.
+    The energy and extremes needed for KPIs and charts are kept alongside.
+    """
+    site = models.ForeignKey(Site, on_delete=models.PROTECT, related_name="aggregates")
+    # Start of the minute
+    timestamp = models.DateTimeField()
+    sample_count = models.PositiveIntegerField()
+
+    battery_active_power = models.FloatField(null=True, blank=True)
+    battery_active_power_set_response = models.FloatField(null=True, blank=True)
+
+    pvpcs_active_power = models.FloatField(null=True, blank=True)
+
+    ge_body_active_power = models.FloatField(null=True, blank=True)
+    ge_active_power = models.FloatField(null=True, blank=True)
+    ge_body_active_power_set_response = models.FloatField(null=True, blank=True)
+
+    fc_active_power_fc_end_set = models.FloatField(null=True, blank=True)
+    fc_active_power = models.FloatField(null=True, blank=True)
+    fc_active_power_fc_end_set_response = models.FloatField(null=True, blank=True)
+
+    island_mode_mccb_active_power = models.FloatField(null=True, blank=True)
+    mg_lv_msb_ac_voltage = models.FloatField(null=True, blank=True)
+    receiving_point_ac_voltage = models.FloatField(null=True, blank=True)
+    island_mode_mccb_ac_voltage = models.FloatField(null=True, blank=True)
+
+    island_mode_mccb_frequency = models.FloatField(null=True, blank=True)
+    mg_lv_msb_frequency = models.FloatField(null=True, blank=True)
+
+    inlet_temperature_of_chilled_water = models.FloatField(null=True, blank=True)
+    outlet_temperature = models.FloatField(null=True, blank=True)
+
+    # Per-minute energy (kWh) and extremes of the power signals. The energy is
+    # the mean power of the minute's readings over the whole minute, NULL
+    # readings left out (or counted as 0 kW under KPI_INTEGRATION 'zero' and
+    # 'legacy'). It is not the gap-aware integration KPI_INTEGRATION applies
+    # to raw readings: intervals across minute boundaries, partial minutes and
+    # max_gap_seconds are ignored, so the KPIs of a compacted period differ
+    # slightly from those of the same readings kept raw. Energies are fixed at
+    # compaction time: a later change of KPI_INTEGRATION does not rewrite them.
+    battery_active_power_energy = models.FloatField(null=True, blank=True)
+    pvpcs_active_power_energy = models.FloatField(null=True, blank=True)
+    fc_active_power_energy = models.FloatField(null=True, blank=True)
+    ge_active_power_energy = models.FloatField(null=True, blank=True)
+    battery_active_power_min = models.FloatField(null=True, blank=True)
+    battery_active_power_max = models.FloatField(null=True, blank=True)
+    pvpcs_active_power_min = models.FloatField(null=True, blank=True)
+    pvpcs_active_power_max = models.FloatField(null=True, blank=True)
+    fc_active_power_min = models.FloatField(null=True, blank=True)
+    fc_active_power_max = models.FloatField(null=True, blank=True)
+    ge_active_power_min = models.FloatField(null=True, blank=True)
+    ge_active_power_max = models.FloatField(null=True, blank=True)
+    # Highest battery + PV + fuel cell output of a single reading
+    production_max = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["timestamp"]
+        unique_together = [("site", "timestamp")]
+
+    def __str__(self):
+        return f"{self.site_id}/{self.timestamp} ({self.sample_count} readings)"
+
+
+class AnomalyEvent(models.Model):
+    """
+    A run of consecutive readings of one signal flagged by the same rule
+    during ingestion (see ingestion.detection).
+    """
+    KIND_CHOICES = [
+        ("high", "Above maximum"),
+        ("low", "Below minimum"),
+        ("zscore", "Statistical outlier"),
+    ]
+
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name="anomalies")
+    signal = models.CharField(max_length=64)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    sample_count = models.PositiveIntegerField(default=1)
+    # Most extreme reading of the run and its z-score (when the baseline was known)
+    peak_value = models.FloatField()
+    peak_zscore = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-started_at"]
+        indexes = [
+            models.Index(fields=["site", "started_at"], name="anomaly_site_started_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.site_id}/{self.signal} {self.kind} @ {self.started_at}"
+
+
+class DetectorState(models.Model):
+    """
+    Running baseline of one signal of one site, carried from one ingestion
+    batch (and file) to the next: exponentially weighted mean and variance,
+    last reading seen, and the events still open at the end of the batch.
+    """
+    site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name="detector_states")
+    signal = models.CharField(max_length=64)
+    mean = models.FloatField(default=0.0)
+    variance = models.FloatField(default=0.0)
+    sample_count = models.PositiveBigIntegerField(default=0)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    # Rule kind -> id of the AnomalyEvent the next batch may extend
+    open_events = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        unique_together = [("site", "signal")]
+
+    def __str__(self):
+        return f"{self.site_id}/{self.signal} n={self.sample_count}"
+
+
+class IngestionRun(models.Model):
+    """
+    One uploaded file and what became of it: row counts, the data quality
+    profile computed while parsing it (see ingestion.quality) and timings.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    file_name = models.CharField(max_length=255)
+    # Site requested at upload; rows may name others through a Site column
+    site = models.ForeignKey(Site, on_delete=models.SET_NULL, null=True, blank=True, related_name="ingestion_runs")
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    task_id = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    total_rows = models.PositiveIntegerField(default=0)
+    imported_rows = models.PositiveIntegerField(default=0)
+    skipped_rows = models.PositiveIntegerField(default=0)
+    quality = models.JSONField(default=dict, blank=True)
+    # Seconds spent in each phase, e.g. {"parse": 0.8, "profile": 0.02, "write": 3.1}
+    timings = models.JSONField(default=dict, blank=True)
+    error_message = models.TextField(blank=True)
+    # Ingestion ledger (see ingestion.services.find_identical_run,
+    # drop_ingested_rows and forget_ingested_range): SHA-256 of the uploaded
+    # bytes and of the header, and the time span of the rows of a
+    # single-site file
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    header_hash = models.CharField(max_length=64, blank=True)
+    first_timestamp = models.DateTimeField(null=True, blank=True)
+    last_timestamp = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.file_name} ({self.status})"
@@ -0,0 +1,244 @@
+"""
+CSV reading layer of the ingestion pipeline.
+
+The file format is sniffed once from its first bytes (sniff_csv): encoding,
+delimiter, header layout and timestamp format. The file is then read in one
+pass by the configured engine (INGESTION_CSV_ENGINE):
+
+- "arrow": pyarrow's multithreaded CSV reader. For the known column layout
+  the column types are declared up front (floats, and timestamps in the
+  sniffed format), so no type inference or per-value parsing is needed.
+  If a value does not fit, the file is re-read with every column as text
+  and left to parse_readings, which keeps the usual NULL semantics.
+- "pandas": the single-threaded pandas C parser.
+
+The reader actually used ('arrow', 'arrow-text' or 'pandas') and the reason
+of every fallback end up in the returned format, and so in the quality
+profile of the ingestion run.
+
+Gzip and bzip2 files are read transparently by both engines; compression is
+detected from the leading bytes, uploads being stored under a .csv name.
+"""
+import codecs
+import csv
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from django.conf import settings
+
+from .services import CSV_COLUMN_MAPPING, MEASUREMENT_FIELDS, TIMESTAMP_FORMATS
+
+SNIFF_BYTES = 64 * 1024
+SNIFF_DELIMITERS = ",;\t|"
+# Timestamp layouts recognised by sniffing, most common first
+SNIFF_TIMESTAMP_FORMATS = TIMESTAMP_FORMATS + (
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y/%m/%d %H:%M",
+    "%Y-%m-%d %H:%M",
+)
+# Values read as NULL, as the pandas reader does
+NULL_VALUES = ["", "NA", "N/A", "NaN", "nan", "NULL", "null", "None", "#N/A", "-NaN", "-nan"]
+# Longest reason recorded for a fallback
+FALLBACK_REASON_LENGTH = 200
+# File names the ingestion accepts, compressed or not
+CSV_FILE_SUFFIXES = (".csv", ".csv.gz", ".csv.bz2")
+# Leading bytes -> codec name, as understood by pyarrow and pandas
+COMPRESSION_MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+)
+
+
+def is_csv_file(file_path):
+    """True when the name of `file_path` ends with one of CSV_FILE_SUFFIXES."""
+    return str(file_path).lower().endswith(CSV_FILE_SUFFIXES)
+
+
+def detect_compression(file_path):
+    """Compression of `file_path` from its leading bytes, None when plain."""
+    with open(file_path, "rb") as f:
+        head = f.read(4)
+    for magic, compression in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def sniff_csv(file_path, delimiter=None):
+    """
+    Detect the format of a CSV file from its first SNIFF_BYTES bytes.
+
+    Returns a dict with `encoding` ('utf-8', 'utf-8-sig' or 'latin-1'),
+    `delimiter` (`delimiter` when given and it splits the header, the
+    sniffed one otherwise), `columns` (the raw header names),
+    `known_layout` (every column is in CSV_COLUMN_MAPPING) and
+    `timestamp_format` (a strptime format matching every sampled
+    timestamp, or None), `first_timestamp` (the first raw timestamp
+    value, or None) and `compression` (see detect_compression).
+    """
+    compression = detect_compression(file_path)
+    with pa.input_stream(file_path, compression=compression) as stream:
+        sample = stream.read(SNIFF_BYTES)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    else:
+        encoding = "utf-8"
+    try:
+        # Incremental: a multibyte character may be cut at the end of the sample
+        text = codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+    except UnicodeDecodeError:
+        encoding = "latin-1"
+        text = sample.decode(encoding)
+
+    lines = text.splitlines()
+    if len(sample) == SNIFF_BYTES and len(lines) > 1:
+        lines = lines[:-1]  # possibly truncated
+    header = lines[0] if lines else ""
+
+    if not delimiter or len(header.split(delimiter)) < 2:
+        try:
+            delimiter = csv.Sniffer().sniff("\n".join(lines[:50]), delimiters=SNIFF_DELIMITERS).delimiter
+        except csv.Error:
+            delimiter = delimiter or ","
+
+    rows = list(csv.reader(lines, delimiter=delimiter))
+    columns = rows[0] if rows else []
+    names = [column.strip() for column in columns]
+    timestamps = []
+    if "Timestamp" in names:
+        position = names.index("Timestamp")
+        timestamps = [row[position].strip() for row in rows[1:] if len(row) > position and row[position].strip()]
+
+    return {
+        "encoding": encoding,
+        "delimiter": delimiter,
+        "columns": columns,
+        "known_layout": bool(names) and "Timestamp" in names and all(name in CSV_COLUMN_MAPPING for name in names),
+        "timestamp_format": sniff_timestamp_format(timestamps),
+        "first_timestamp": timestamps[0] if timestamps else None,
+        "compression": compression,
+    }
+
+
+def sniff_timestamp_format(values):
+    """First format of SNIFF_TIMESTAMP_FORMATS parsing every value, or None."""
+    if not values:
+        return None
+    for fmt in SNIFF_TIMESTAMP_FORMATS:
+        try:
+            for value in values:
+                datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return fmt
+    return None
+
+
+def read_csv_file(file_path, delimiter=None, engine=None):
+    """
+    Read a CSV export into a frame whose columns are renamed through
+    CSV_COLUMN_MAPPING. Returns `(frame, csv_format)`, `csv_format` being
+    the sniff_csv result plus the `engine` that read the file ('arrow',
+    'arrow-text' or 'pandas') and `fallbacks`, why the faster readers were
+    given up (empty when the sniffed format held for the whole file).
+    """
+    csv_format = sniff_csv(file_path, delimiter)
+    csv_format["engine"] = engine or settings.INGESTION_CSV_ENGINE
+    csv_format["fallbacks"] = []
+    reader = CSV_ENGINES[csv_format["engine"]]
+    try:
+        df = reader(file_path, csv_format)
+    except UnicodeDecodeError as exc:
+        _fall_back(csv_format, "encoding", exc)
+        csv_format["encoding"] = "latin-1"
+        df = reader(file_path, csv_format)
+
+    # Clean column names and map them to model field names
+    df.columns = df.columns.str.strip()
+    df.rename(columns=CSV_COLUMN_MAPPING, inplace=True)
+    return df, csv_format
+
+
+def _fall_back(csv_format, reader, exc):
+    """Record why `reader` could not read the file."""
+    csv_format["fallbacks"].append(f"{reader}: {exc}"[:FALLBACK_REASON_LENGTH])
+
+
+def read_csv_pandas(file_path, csv_format):
+    csv_format["engine"] = "pandas"
+    return pd.read_csv(
+        file_path,
+        delimiter=csv_format["delimiter"],
+        encoding=csv_format["encoding"],
+        compression=csv_format["compression"],
+    )
+
+
+def read_csv_arrow(file_path, csv_format):
+    # Arrow reads UTF-8 natively and skips a BOM; other encodings are transcoded
+    encoding = "utf8" if csv_format["encoding"].startswith("utf-8") else csv_format["encoding"]
+    read_options = pa_csv.ReadOptions(use_threads=True, encoding=encoding)
+    parse_options = pa_csv.ParseOptions(delimiter=csv_format["delimiter"])
+    column_types = _known_layout_types(csv_format)
+    if column_types:
+        try:
+            csv_format["engine"] = "arrow"
+            return _read_arrow(file_path, read_options, parse_options, column_types, csv_format)
+        except pa.ArrowInvalid as exc:
+            # A value does not fit the declared types (e.g. a timestamp
+            # layout changing after the sniffed sample): fall back to text
+            _fall_back(csv_format, "arrow", exc)
+    # Every column as text; parse_readings does the conversions
+    column_types = {column: pa.string() for column in csv_format["columns"]} or None
+    try:
+        csv_format["engine"] = "arrow-text"
+        return _read_arrow(file_path, read_options, parse_options, column_types, csv_format)
+    except pa.ArrowInvalid as exc:
+        # Ragged rows or bytes invalid in the sniffed encoding: the pandas
+        # reader pads short rows and raises UnicodeDecodeError
+        _fall_back(csv_format, "arrow-text", exc)
+        return read_csv_pandas(file_path, csv_format)
+
+
+def _known_layout_types(csv_format):
+    """Declared Arrow types of the known layout, None when it does not apply."""
+    if not csv_format["known_layout"] or not csv_format["timestamp_format"]:
+        return None
+    # Arrow's strptime has no %f: fractional timestamps stay text
+    arrow_timestamps = "%f" not in csv_format["timestamp_format"]
+    types = {}
+    for column in csv_format["columns"]:
+        field = CSV_COLUMN_MAPPING[column.strip()]
+        if field == "timestamp" and arrow_timestamps:
+            types[column] = pa.timestamp("ns")
+        elif field in MEASUREMENT_FIELDS:
+            types[column] = pa.float64()
+        else:
+            types[column] = pa.string()
+    return types
+
+
+def _read_arrow(file_path, read_options, parse_options, column_types, csv_format):
+    convert_options = pa_csv.ConvertOptions(
+        column_types=column_types,
+        null_values=NULL_VALUES,
+        strings_can_be_null=True,
+        timestamp_parsers=[csv_format["timestamp_format"]] if csv_format["timestamp_format"] else None,
+    )
+    with pa.input_stream(file_path, compression=csv_format["compression"]) as stream:
+        table = pa_csv.read_csv(
+            stream, read_options=read_options, parse_options=parse_options, convert_options=convert_options
+        )
+    return table.to_pandas()
+
+
+CSV_ENGINES = {
+    "arrow": read_csv_arrow,
+    "pandas": read_csv_pandas,
+}
+
@@ -0,0 +1,93 @@
+"""
+Data quality profile of an ingested file, computed on the parsed arrays.
+
+The profile records why rows were rejected and, for each measurement
+column, its null rate, how many values were present but unparsable
+(stored as NULL), how many fall outside QUALITY_RANGES, and its
+min/mean/max. It also checks the timestamp sequence of each site for
+duplicates, monotonicity breaks and sampling gaps. Every statistic is one
+vectorized pass, so profiling costs a small fraction of the parse.
+"""
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .services import CSV_COLUMN_MAPPING, MEASUREMENT_FIELDS, _blank
+
+
+def profile_readings(source, readings, skipped):
+    """
+    Profile one file. `source` is the raw frame (columns renamed through
+    CSV_COLUMN_MAPPING); `readings` and `skipped` come from parse_readings.
+    Returns a JSON-serializable dict.
+    """
+    known = set(CSV_COLUMN_MAPPING.values())
+    return {
+        "rows": int(len(source)),
+        "imported_rows": int(len(readings)),
+        "skipped_rows": {reason: int(count) for reason, count in skipped.value_counts().items()},
+        "unknown_columns": [str(column) for column in source.columns if column not in known],
+        "missing_columns": [field for field in MEASUREMENT_FIELDS if field not in source.columns],
+        "columns": {
+            field: profile_column(source[field], readings[field])
+            for field in MEASUREMENT_FIELDS if field in readings.columns
+        },
+        "timestamps": {
+            str(site_id): profile_timestamps(timestamps)
+            for site_id, timestamps in readings["timestamp"].groupby(readings["site_id"], sort=True)
+        },
+    }
+
+
+def profile_column(raw, values):
+    """
+    Statistics of one measurement column over the imported rows. `raw` is
+    the column as read from the file, `values` its parsed imported rows.
+    """
+    count = len(values)
+    nulls = values.isna()
+    invalid = 0
+    # Present in the file but not a number, stored as NULL (text columns only)
+    if raw.dtype == object and nulls.any():
+        invalid = int((~_blank(raw.loc[values.index[nulls]])).sum())
+    profile = {
+        "null_rate": round(float(nulls.mean()), 4) if count else 0.0,
+        "invalid": invalid,
+        "out_of_range": 0,
+        "min": None,
+        "mean": None,
+        "max": None,
+    }
+    present = values[~nulls]
+    if len(present):
+        profile.update(
+            min=float(present.min()), mean=round(float(present.mean()), 4), max=float(present.max())
+        )
+    bounds = settings.QUALITY_RANGES.get(values.name)
+    if bounds is not None:
+        low, high = bounds
+        profile["out_of_range"] = int(((present < low) | (present > high)).sum())
+    return profile
+
+
+def profile_timestamps(timestamps):
+    """
+    Sequence checks on the timestamps of one site, in file order:
+    duplicates, backward steps, median sampling interval and the gaps
+    longer than QUALITY_GAP_FACTOR times that interval.
+    """
+    ns = pd.DatetimeIndex(timestamps).asi8
+    steps = np.diff(ns)
+    ordered = np.diff(np.sort(ns))
+    intervals = ordered[ordered > 0]
+    median = float(np.median(intervals)) if len(intervals) else 0.0
+    gaps = intervals[intervals > settings.QUALITY_GAP_FACTOR * median] if median else intervals[:0]
+    return {
+        "first": timestamps.min().isoformat() if len(ns) else None,
+        "last": timestamps.max().isoformat() if len(ns) else None,
+        "duplicates": int(len(ns) - len(np.unique(ns))),
+        "monotonicity_breaks": int((steps < 0).sum()),
+        "median_interval_seconds": round(median / 1e9, 3),
+        "gaps": int(len(gaps)),
+        "max_gap_seconds": round(float(gaps.max()) / 1e9, 3) if len(gaps) else 0.0,
+    }
@@ -0,0 +1,182 @@
+"""
+Hourly and daily KPI rollups kept in PostgreSQL materialized views.
+
+`ingestion_kpi_hourly` holds, per site and hour, the figures the KPIs are
+built from: reading count, consumption and production peaks, sum / count
+of voltage and frequency and, per power signal, the energy integrated
+inside the hour (compacted minutes plus the trapezoids between raw
+readings, as KPI_INTEGRATION does by default) with the first and last
+reading of the hour, so a reader joins consecutive periods as a scan of the
+readings would. `ingestion_kpi_daily` rolls the hours up per UTC day. Both
+read the raw and the compacted tier and record the DataRevision of their
+day, so a row whose day changed since the last refresh is known to be stale
+and is skipped (its period is read from the tables instead). The views are
+created by migrations whose SQL is frozen (0009_kpi_rollups,
+0010_kpi_rollups_integration): a change of definition is a new migration.
+
+Every data change requests a refresh (request_refresh, from
+bump_data_revisions); the `refresh_kpi_rollups` task waits until changes
+have been quiet for KPI_ROLLUP_REFRESH_DELAY_SECONDS (at most
+KPI_ROLLUP_REFRESH_MAX_WAIT_SECONDS), so a burst of uploads triggers one
+`REFRESH MATERIALIZED VIEW CONCURRENTLY`, which keeps the views readable
+and only rewrites the rows that changed. Other databases have no views, and
+other KPI_INTEGRATION settings cannot be read from them: available() is
+False and KPIs are computed from the tables.
+"""
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import MicrogridData, RollupRefresh
+
+HOURLY_VIEW = "ingestion_kpi_hourly"
+DAILY_VIEW = "ingestion_kpi_daily"
+
+POWER_FIELDS = ("battery_active_power", "pvpcs_active_power", "fc_active_power", "ge_active_power")
+CONSUMPTION_FIELD = "ge_active_power"
+MEAN_FIELDS = ("mg_lv_msb_ac_voltage", "mg_lv_msb_frequency")
+
+# Columns summed (resp. maxed) from minutes to hours and from hours to days
+SUM_COLUMNS = (
+    ("sample_count",)
+    + tuple(f"{field}_energy" for field in POWER_FIELDS)
+    + tuple(f"{field}_{stat}" for field in MEAN_FIELDS for stat in ("sum", "count"))
+)
+MAX_COLUMNS = (f"{CONSUMPTION_FIELD}_max", "production_max")
+# First and last reading of each power signal over the period
+READING_COLUMNS = tuple(
+    f"{field}_{edge}" for field in POWER_FIELDS for edge in ("first_at", "first", "last_at", "last")
+)
+# Days of the views (frozen in their migrations), those of DataRevision
+VIEW_TIME_ZONE = "UTC"
+# Energy integration of the views (0010_kpi_rollups_integration)
+VIEW_INTEGRATION = {"method": "trapezoid", "max_gap_seconds": 900, "missing": "skip", "resample_seconds": 0}
+
+
+def _read_alias():
+    return router.db_for_read(MicrogridData)
+
+
+def available():
+    """
+    True when KPIs can be read from the views: enabled, on PostgreSQL, and
+    with the days and the energy integration the views were built with.
+    """
+    integration = dict(VIEW_INTEGRATION, **settings.KPI_INTEGRATION)
+    integration["resample_seconds"] = integration["resample_seconds"] or 0
+    return (
+        settings.KPI_ROLLUPS_ENABLED
+        and settings.TIME_ZONE == VIEW_TIME_ZONE
+        and integration == VIEW_INTEGRATION
+        and connections[_read_alias()].vendor == "postgresql"
+    )
+
+
+def refresh_views():
+    """Refresh both views without blocking their readers (hours first, days are built on them)."""
+    with connections["default"].cursor() as cursor:
+        for view in (HOURLY_VIEW, DAILY_VIEW):
+            cursor.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}")
+
+
+def request_refresh():
+    """Ask for a (debounced) refresh once the current transaction commits."""
+    if settings.KPI_ROLLUPS_ENABLED and connections["default"].vendor == "postgresql":
+        # After commit, so long ingestion transactions never hold the state row
+        transaction.on_commit(_schedule_refresh)
+
+
+def _schedule_refresh():
+    from .tasks import refresh_kpi_rollups
+
+    now = timezone.now()
+    RollupRefresh.objects.get_or_create(pk=1)
+    RollupRefresh.objects.filter(pk=1).update(requested_at=now)
+    # Start a pending refresh unless one is scheduled (or lost: pending far too long)
+    stuck = now - timedelta(seconds=2 * settings.KPI_ROLLUP_REFRESH_MAX_WAIT_SECONDS)
+    started = RollupRefresh.objects.filter(
+        Q(pending_since__isnull=True) | Q(pending_since__lt=stuck), pk=1
+    ).update(pending_since=now)
+    if started:
+        refresh_kpi_rollups.apply_async(countdown=settings.KPI_ROLLUP_REFRESH_DELAY_SECONDS)
+
+
+def _fetch(cursor, view, site_id, start, end, exclude_days=()):
+    columns = ("period_start", "period_end", "day") + SUM_COLUMNS + MAX_COLUMNS + READING_COLUMNS
+    sql = (
+        f"SELECT {', '.join('k.' + column for column in columns)} FROM {view} k"
+        " LEFT JOIN ingestion_datarevision v ON v.site_id = k.site_id AND v.day = k.day"
+        " WHERE k.site_id = %s AND k.revision = coalesce(v.version, 0)"
+    )
+    params = [site_id]
+    if start is not None:
+        sql += " AND k.period_start >= %s"
+        params.append(start)
+    if end is not None:
+        sql += " AND k.period_end <= %s"
+        params.append(end)
+    if exclude_days:
+        sql += " AND NOT (k.day = ANY(%s))"
+        params.append(list(exclude_days))
+    cursor.execute(sql + " ORDER BY k.period_start", params)
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def _unsplit(rows, boundaries):
+    """Rows no boundary falls strictly inside."""
+    return [
+        row for row in rows
+        if not any(row["period_start"] < boundary < row["period_end"] for boundary in boundaries)
+    ]
+
+
+def _as_ns(value):
+    return pd.Timestamp(value).value if value is not None else 0
+
+
+def rollup_readings(site, start=None, end=None, boundaries=()):
+    """
+    Up-to-date rollup rows of a site for the whole hours of [start, end)
+    (aware datetimes on hour boundaries, either open): whole UTC days from
+    the daily view, the remaining hours from the hourly view. Periods with
+    one of `boundaries` strictly inside are left out, so every row lies
+    wholly on one side of each boundary.
+
+    Returns `(covered, timestamps, columns)`: the merged `(start, end)`
+    intervals the rows cover, and the rows as a chunk in the shape of the
+    compacted tier (iter_tiered_chunks): `sample_count`, `<power>_energy`,
+    `ge_active_power_max`, `production_max`, the mean of each of
+    MEAN_FIELDS with its reading count `<field>_count`, and READING_COLUMNS
+    (`_at` in ns, 0 and NaN when the period has no reading of the signal).
+    """
+    site_id = getattr(site, "pk", site)
+    with connections[_read_alias()].cursor() as cursor:
+        days = _unsplit(_fetch(cursor, DAILY_VIEW, site_id, start, end), boundaries)
+        hours = _fetch(cursor, HOURLY_VIEW, site_id, start, end, exclude_days=[row["day"] for row in days])
+    rows = sorted(days + _unsplit(hours, boundaries), key=lambda row: row["period_start"])
+
+    covered = []
+    for row in rows:
+        if covered and covered[-1][1] == row["period_start"]:
+            covered[-1] = (covered[-1][0], row["period_end"])
+        else:
+            covered.append((row["period_start"], row["period_end"]))
+
+    timestamps = np.array([pd.Timestamp(row["period_start"]).value for row in rows], dtype="int64")
+    columns = {
+        name: np.array([row[name] for row in rows], dtype="float64")
+        for name in SUM_COLUMNS + MAX_COLUMNS + READING_COLUMNS
+        if not name.endswith("_at")
+    }
+    for name in READING_COLUMNS:
+        if name.endswith("_at"):
+            columns[name] = np.array([_as_ns(row[name]) for row in rows], dtype="int64")
+    for field in MEAN_FIELDS:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            columns[field] = columns.pop(f"{field}_sum") / columns[f"{field}_count"]
+    return covered, timestamps, columns
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import MicrogridData
+from .models import AnomalyEvent, IngestionRun, MicrogridData, Site
+from .services import MEASUREMENT_FIELDS
 
 
 class CSVUploadSerializer(serializers.Serializer):
@@ -11,9 +12,62 @@ class CSVUploadSerializer(serializers.Serializer):
         default=",",
         help_text="Délimiteur utilisé dans le fichier CSV (par défaut: ,)"
     )
+    site = serializers.SlugRelatedField(
+        slug_field="slug",
+        queryset=Site.objects.all(),
+        required=False,
+        help_text="Site des mesures (par défaut: site par défaut, ou colonne Site du fichier)"
+    )
+    force = serializers.BooleanField(
+        default=False,
+        help_text="Ingérer le fichier même s'il l'a déjà été (par défaut: non)"
+    )
 
 
 class MicrogridDataSerializer(serializers.ModelSerializer):
     class Meta:
         model = MicrogridData
         fields = "__all__"
+
+
+class TieredReadingSerializer(serializers.ModelSerializer):
+    """
+    Row of the data list: a raw reading (`tier` "raw") or a compacted
+    per-minute aggregate (`tier` "minute", means of `sample_count` readings).
+    `id` is the reading's id, usable with the detail endpoint, and null for
+    aggregates: their ids belong to another table and would collide.
+    """
+    id = serializers.SerializerMethodField()
+    site = serializers.IntegerField()
+    tier = serializers.CharField()
+    sample_count = serializers.IntegerField()
+
+    class Meta:
+        model = MicrogridData
+        fields = ["id", "timestamp", *MEASUREMENT_FIELDS, "site", "tier", "sample_count"]
+
+    def get_id(self, row):
+        return row["id"] if row["tier"] == "raw" else None
+
+
+class SiteSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Site
+        fields = ["id", "name", "slug", "description", "created_at"]
+        read_only_fields = ["id", "created_at"]
+
+
+class AnomalyEventSerializer(serializers.ModelSerializer):
+    site = serializers.SlugRelatedField(slug_field="slug", read_only=True)
+
+    class Meta:
+        model = AnomalyEvent
+        fields = "__all__"
+
+
+class IngestionRunSerializer(serializers.ModelSerializer):
+    site = serializers.SlugRelatedField(slug_field="slug", read_only=True)
+
+    class Meta:
+        model = IngestionRun
+        exclude = ["created_by"]
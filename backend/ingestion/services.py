@@ -0,0 +1,738 @@
+import hashlib
+from datetime import datetime, time, timedelta
+from itertools import chain
+from time import sleep
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Avg, Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce, Trunc
+from django.utils import timezone
+from .models import DEFAULT_SITE_SLUG, IngestionRun, MicrogridData, DataRevision, ReadingAggregate, Site
+from .rollups import request_refresh as request_rollup_refresh
+
+# Nombre de lignes lues par aller-retour avec le curseur serveur
+READING_CHUNK_SIZE = 20000
+
+# Every measured signal of MicrogridData, in model order
+MEASUREMENT_FIELDS = tuple(
+    field.name for field in MicrogridData._meta.concrete_fields
+    if isinstance(field, models.FloatField)
+)
+
+# Power signals whose per-minute energy and extremes are kept in the cold tier
+AGGREGATE_EXTREMA_FIELDS = (
+    'battery_active_power',
+    'pvpcs_active_power',
+    'fc_active_power',
+    'ge_active_power',
+)
+PRODUCTION_SUM_FIELDS = ('battery_active_power', 'pvpcs_active_power', 'fc_active_power')
+# Value columns of ReadingAggregate (everything but the key)
+AGGREGATE_VALUE_FIELDS = (
+    ('sample_count',) + MEASUREMENT_FIELDS
+    + tuple(f'{field}_{stat}' for field in AGGREGATE_EXTREMA_FIELDS for stat in ('energy', 'min', 'max'))
+    + ('production_max',)
+)
+
+# Aggregation level -> Trunc kind
+AGGREGATION_LEVELS = {
+    'minute': 'minute',
+    'hour': 'hour',
+    'day': 'day',
+}
+
+
+def readings_queryset(start=None, end=None, site=None):
+    """
+    Return the MicrogridData queryset bounded to [start, end], optionally
+    restricted to one site (a Site or its pk). Either bound may be omitted.
+    """
+    qs = MicrogridData.objects.all()
+    if site is not None:
+        qs = qs.filter(site=site)
+    if start:
+        qs = qs.filter(timestamp__gte=start)
+    if end:
+        qs = qs.filter(timestamp__lte=end)
+    return qs
+
+
+def aggregates_queryset(start=None, end=None, site=None):
+    """
+    Cold-tier counterpart of readings_queryset: ReadingAggregate rows whose
+    minute starts in [start, end], optionally restricted to one site.
+    """
+    qs = ReadingAggregate.objects.all()
+    if site is not None:
+        qs = qs.filter(site=site)
+    if start:
+        qs = qs.filter(timestamp__gte=start)
+    if end:
+        qs = qs.filter(timestamp__lte=end)
+    return qs
+
+
+def iter_tiered_chunks(start, end, site, fields, aggregate_fields=(), chunk_size=READING_CHUNK_SIZE):
+    """
+    Stream the readings of one site over [start, end] across both tiers, in
+    timestamp order: per-minute aggregates before the site's
+    `compacted_until`, then raw readings. Chunks have the shape of
+    iter_reading_chunks; cold chunks also carry `aggregate_fields`
+    (e.g. `sample_count`, `ge_active_power_max`).
+    """
+    site = site if isinstance(site, Site) else Site.objects.get(pk=site)
+    hot = readings_queryset(start, end, site)
+    if site.compacted_until is not None:
+        cold = aggregates_queryset(start, end, site).filter(timestamp__lt=site.compacted_until)
+        yield from iter_reading_chunks(cold, tuple(fields) + tuple(aggregate_fields), chunk_size)
+        hot = hot.filter(timestamp__gte=site.compacted_until)
+    yield from iter_reading_chunks(hot, fields, chunk_size)
+
+
+def iter_reading_chunks(queryset, fields, chunk_size=READING_CHUNK_SIZE):
+    """
+    Stream `fields` of `queryset` in timestamp order as NumPy chunks.
+
+    Rows are fetched through a server-side cursor so memory stays bounded
+    by `chunk_size` whatever the size of the range. Each chunk is a tuple
+    `(timestamps, columns)` where `timestamps` is an int64 array of UTC
+    nanoseconds and `columns` maps each field to a float array (NULL -> NaN).
+    """
+    rows = (
+        queryset.order_by('timestamp')
+        .values_list('timestamp', *fields)
+        .iterator(chunk_size=chunk_size)
+    )
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield _chunk_to_arrays(batch, fields)
+            batch = []
+    if batch:
+        yield _chunk_to_arrays(batch, fields)
+
+
+def iter_reading_rows(queryset, fields, aggregation='raw', chunk_size=READING_CHUNK_SIZE):
+    """
+    Stream `(timestamp, *fields)` tuples of `queryset` in timestamp order.
+
+    With `aggregation` set to one of AGGREGATION_LEVELS, rows are averaged
+    per bucket by the database and the timestamp is the bucket start.
+    """
+    if aggregation == 'raw':
+        rows = queryset.order_by('timestamp').values_list('timestamp', *fields)
+    else:
+        rows = (
+            queryset.order_by()
+            .annotate(bucket=Trunc('timestamp', AGGREGATION_LEVELS[aggregation]))
+            .values('bucket')
+            .annotate(**{f'{field}_avg': Avg(field) for field in fields})
+            .order_by('bucket')
+            .values_list('bucket', *(f'{field}_avg' for field in fields))
+        )
+    return rows.iterator(chunk_size=chunk_size)
+
+
+def iter_tiered_rows(start, end, site, fields, aggregation='raw', chunk_size=READING_CHUNK_SIZE):
+    """
+    Tiered counterpart of iter_reading_rows for one site over [start, end].
+
+    Before the site's `compacted_until` only per-minute means exist: they
+    are yielded as they are for 'raw' and 'minute' (the finest resolution
+    left), and weighted by their reading count for coarser buckets, so a
+    bucket averages the same readings whichever tier holds them. A bucket
+    straddling `compacted_until` is merged into a single row.
+    """
+    site = site if isinstance(site, Site) else Site.objects.get(pk=site)
+    hot = readings_queryset(start, end, site)
+    if site.compacted_until is None:
+        yield from iter_reading_rows(hot, fields, aggregation, chunk_size)
+        return
+    cold = aggregates_queryset(start, end, site).filter(timestamp__lt=site.compacted_until)
+    hot = hot.filter(timestamp__gte=site.compacted_until)
+    if aggregation in ('raw', 'minute'):
+        # compacted_until is on a minute boundary: no minute spans both tiers
+        yield from cold.order_by('timestamp').values_list('timestamp', *fields).iterator(chunk_size=chunk_size)
+        yield from iter_reading_rows(hot, fields, aggregation, chunk_size)
+        return
+
+    pending = None
+    for bucket, *totals in chain(
+        _bucket_totals(cold, fields, aggregation, F('sample_count'), chunk_size),
+        _bucket_totals(hot, fields, aggregation, None, chunk_size),
+    ):
+        if pending is not None and pending[0] == bucket:
+            pending[1:] = [a + b for a, b in zip(pending[1:], totals)]
+            continue
+        if pending is not None:
+            yield _bucket_means(pending, len(fields))
+        pending = [bucket, *totals]
+    if pending is not None:
+        yield _bucket_means(pending, len(fields))
+
+
+def _bucket_totals(queryset, fields, aggregation, weight, chunk_size):
+    """Per-bucket `(bucket, *sums, *counts)` of `fields`, each row counting `weight` readings."""
+    sums, counts = {}, {}
+    for field in fields:
+        present = Q(**{f'{field}__isnull': False})
+        if weight is None:
+            sums[f'{field}_sum'] = Sum(field, default=0.0)
+            counts[f'{field}_count'] = Count(field)
+        else:
+            sums[f'{field}_sum'] = Sum(F(field) * weight, default=0.0)
+            counts[f'{field}_count'] = Sum(weight, filter=present, default=0)
+    return (
+        queryset.order_by()
+        .annotate(bucket=Trunc('timestamp', AGGREGATION_LEVELS[aggregation]))
+        .values('bucket')
+        .annotate(**sums, **counts)
+        .order_by('bucket')
+        .values_list('bucket', *sums, *counts)
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def _bucket_means(totals, width):
+    bucket, sums, counts = totals[0], totals[1:width + 1], totals[width + 1:]
+    return (bucket, *(total / count if count else None for total, count in zip(sums, counts)))
+
+
+def _chunk_to_arrays(batch, fields):
+    block = np.array(batch, dtype=object)
+    timestamps = pd.to_datetime(block[:, 0], utc=True).asi8
+    values = block[:, 1:].astype(float)
+    return timestamps, {field: values[:, i] for i, field in enumerate(fields)}
+
+
+def delete_in_batches(queryset, batch_size, pause=0.0, on_progress=None):
+    """
+    Delete the rows of `queryset` in batches of at most `batch_size` rows,
+    oldest first, sleeping `pause` seconds between batches so concurrent
+    ingestion and reads keep getting the locks and I/O they need.
+    `on_progress(deleted)` is called after every batch. Returns the total.
+    """
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('timestamp').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        count, _ = MicrogridData.objects.filter(pk__in=ids).delete()
+        deleted += count
+        if on_progress:
+            on_progress(deleted)
+        if pause:
+            sleep(pause)
+
+
+def days_between(start, end):
+    """
+    Return the list of local dates covered by the datetimes [start, end].
+    """
+    if start is None or end is None:
+        return []
+    day = timezone.localdate(start)
+    last = timezone.localdate(end)
+    days = []
+    while day <= last:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def bump_data_revisions(site, days):
+    """
+    Mark the given days of `site` (a Site or its pk) as changed so caches
+    keyed on their revision (generated reports, HTTP validators, KPI
+    rollups) are invalidated.
+    """
+    site_id = getattr(site, 'pk', site)
+    days = sorted(set(days))
+    if not days:
+        return
+    DataRevision.objects.bulk_create(
+        [DataRevision(site_id=site_id, day=day) for day in days], ignore_conflicts=True
+    )
+    DataRevision.objects.filter(site_id=site_id, day__in=days).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    # The KPI rollup views hold these days too
+    request_rollup_refresh()
+
+
+def bump_queryset_revisions(queryset):
+    """
+    Bump the revision of every site and day spanned by `queryset`. Must be
+    called before the rows are deleted.
+    """
+    spans = (
+        queryset.order_by()
+        .values('site')
+        .annotate(first=Min('timestamp'), last=Max('timestamp'))
+    )
+    for span in spans:
+        bump_data_revisions(span['site'], days_between(span['first'], span['last']))
+
+
+def range_revision(start_date=None, end_date=None, site=None):
+    """
+    Return the data revision of the inclusive date range [start_date, end_date]
+    (of one site, or of all sites) as a dict with a monotonically increasing
+    `version` and the `updated_at` of its most recent change (None when the
+    range was never written).
+    """
+    revisions = DataRevision.objects.all()
+    if site is not None:
+        revisions = revisions.filter(site=site)
+    if start_date:
+        revisions = revisions.filter(day__gte=start_date)
+    if end_date:
+        revisions = revisions.filter(day__lte=end_date)
+    summary = revisions.aggregate(version=Sum('version'), updated_at=Max('updated_at'))
+    return {
+        'version': summary['version'] or 0,
+        'updated_at': summary['updated_at'],
+    }
+
+
+# Column types of the measurement fields: 'double' (FloatField default) or
+# the opt-in compact 'real' (4 bytes, ~7 significant digits, enough for
+# sensor readings in kW, V, Hz and °C)
+MEASUREMENT_PRECISIONS = {
+    'double': 'double precision',
+    'real': 'real',
+}
+
+
+def measurement_column_types():
+    """
+    Return {field: SQL type} for the measurement columns of MicrogridData as
+    they exist in the database (PostgreSQL only).
+    """
+    table = MicrogridData._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_name = %s AND column_name = ANY(%s)",
+            [table, [MicrogridData._meta.get_field(f).column for f in MEASUREMENT_FIELDS]],
+        )
+        return dict(cursor.fetchall())
+
+
+def set_measurement_precision(precision, fields=MEASUREMENT_FIELDS):
+    """
+    Store `fields` of MicrogridData as `precision` ('real' or 'double').
+
+    The ORM reads either type as a Python float, so ingestion, filters and
+    KPIs work unchanged. The table is rewritten under an exclusive lock:
+    run it in a maintenance window. Returns the fields actually altered.
+    """
+    sql_type = MEASUREMENT_PRECISIONS[precision]
+    current = measurement_column_types()
+    table = connection.ops.quote_name(MicrogridData._meta.db_table)
+    columns = [
+        MicrogridData._meta.get_field(field).column for field in fields
+        if current.get(MicrogridData._meta.get_field(field).column) != sql_type
+    ]
+    if columns:
+        alterations = ", ".join(
+            f"ALTER COLUMN {connection.ops.quote_name(column)} TYPE {sql_type}" for column in columns
+        )
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {table} {alterations}")
+    return columns
+
+
+def readings_storage_stats():
+    """
+    Measure the on-disk footprint of MicrogridData (PostgreSQL only): row
+    count, heap / index / total bytes, and bytes per row both overall and
+    for the average tuple alone.
+    """
+    table = MicrogridData._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_relation_size(%s), pg_indexes_size(%s), pg_total_relation_size(%s)",
+            [table, table, table],
+        )
+        heap_bytes, index_bytes, total_bytes = cursor.fetchone()
+        cursor.execute(
+            f"SELECT count(*), avg(pg_column_size(t.*)) FROM {connection.ops.quote_name(table)} t"
+        )
+        rows, tuple_bytes = cursor.fetchone()
+    return {
+        'rows': rows,
+        'heap_bytes': heap_bytes,
+        'index_bytes': index_bytes,
+        'total_bytes': total_bytes,
+        'tuple_bytes': round(float(tuple_bytes or 0), 1),
+        'bytes_per_row': round(total_bytes / rows, 1) if rows else None,
+    }
+
+
+def compact_site_readings(site, cutoff, pause=0.0):
+    """
+    Move the raw readings of `site` older than `cutoff` (rounded down to the
+    minute) into the per-minute ReadingAggregate tier, one day at a time.
+
+    Each day is aggregated by the database, merged into any aggregate that
+    already covers the same minute (late backfills), and deleted in a single
+    transaction, so an interrupted run never loses or double-counts rows.
+    Rows inserted while the job runs are left for the next run. Returns the
+    number of raw rows compacted.
+    """
+    site = site if isinstance(site, Site) else Site.objects.get(pk=site)
+    cutoff = cutoff.replace(second=0, microsecond=0)
+    raw = readings_queryset(site=site).filter(timestamp__lt=cutoff)
+    last_id = raw.aggregate(last=Max('pk'))['last']
+    raw = raw.filter(pk__lte=last_id or 0)
+
+    compacted = 0
+    while True:
+        first = raw.aggregate(first=Min('timestamp'))['first']
+        if first is None:
+            break
+        day = timezone.localdate(first)
+        day_end = min(
+            timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min)), cutoff
+        )
+        with transaction.atomic():
+            rows = raw.filter(timestamp__gte=first, timestamp__lt=day_end)
+            bump_data_revisions(site, [day])
+            aggregates = _aggregate_minutes(rows, site)
+            _merge_existing_aggregates(aggregates, site)
+            ReadingAggregate.objects.bulk_create(
+                aggregates,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['site', 'timestamp'],
+                update_fields=AGGREGATE_VALUE_FIELDS,
+            )
+            count, _ = rows.delete()
+        compacted += count
+        if pause:
+            sleep(pause)
+
+    Site.objects.filter(pk=site.pk).filter(
+        Q(compacted_until__isnull=True) | Q(compacted_until__lt=cutoff)
+    ).update(compacted_until=cutoff)
+    return compacted
+
+
+def _aggregate_minutes(rows, site):
+    production = sum((Coalesce(field, 0.0) for field in PRODUCTION_SUM_FIELDS), Value(0.0))
+    annotations = {f'avg_{field}': Avg(field) for field in MEASUREMENT_FIELDS}
+    # Missing readings count as 0 kW only where the KPIs on raw data do the same
+    integration = settings.KPI_INTEGRATION
+    zero_filled = integration['missing'] == 'zero' or integration['method'] == 'legacy'
+    for field in AGGREGATE_EXTREMA_FIELDS:
+        annotations[f'mean_{field}'] = Avg(Coalesce(field, 0.0)) if zero_filled else Avg(field)
+        annotations[f'min_{field}'] = Min(field)
+        annotations[f'max_{field}'] = Max(field)
+    minutes = (
+        rows.order_by()
+        .annotate(minute=Trunc('timestamp', 'minute'))
+        .values('minute')
+        .annotate(readings=Count('pk'), max_production=Max(production), **annotations)
+        .order_by('minute')
+    )
+    aggregates = []
+    for minute in minutes:
+        aggregate = ReadingAggregate(
+            site=site,
+            timestamp=minute['minute'],
+            sample_count=minute['readings'],
+            production_max=minute['max_production'],
+        )
+        for field in MEASUREMENT_FIELDS:
+            setattr(aggregate, field, minute[f'avg_{field}'])
+        for field in AGGREGATE_EXTREMA_FIELDS:
+            # Mean power over one minute, in kWh
+            mean = minute[f'mean_{field}']
+            setattr(aggregate, f'{field}_energy', None if mean is None else mean / 60)
+            setattr(aggregate, f'{field}_min', minute[f'min_{field}'])
+            setattr(aggregate, f'{field}_max', minute[f'max_{field}'])
+        aggregates.append(aggregate)
+    return aggregates
+
+
+def _merge_existing_aggregates(aggregates, site):
+    if not aggregates:
+        return
+    existing = {
+        aggregate.timestamp: aggregate
+        for aggregate in ReadingAggregate.objects.filter(
+            site=site, timestamp__in=[aggregate.timestamp for aggregate in aggregates]
+        )
+    }
+    for aggregate in aggregates:
+        previous = existing.get(aggregate.timestamp)
+        if previous is None:
+            continue
+        total = aggregate.sample_count + previous.sample_count
+        for field in MEASUREMENT_FIELDS:
+            new, old = getattr(aggregate, field), getattr(previous, field)
+            if new is None:
+                setattr(aggregate, field, old)
+            elif old is not None:
+                setattr(aggregate, field, (new * aggregate.sample_count + old * previous.sample_count) / total)
+        for field in AGGREGATE_EXTREMA_FIELDS:
+            energy = f'{field}_energy'
+            new, old = getattr(aggregate, energy), getattr(previous, energy)
+            if new is None:
+                setattr(aggregate, energy, old)
+            elif old is not None:
+                setattr(aggregate, energy, (new * aggregate.sample_count + old * previous.sample_count) / total)
+            setattr(aggregate, f'{field}_min', _none_aware(min, aggregate, previous, f'{field}_min'))
+            setattr(aggregate, f'{field}_max', _none_aware(max, aggregate, previous, f'{field}_max'))
+        aggregate.production_max = _none_aware(max, aggregate, previous, 'production_max')
+        aggregate.sample_count = total
+
+
+def _none_aware(pick, a, b, field):
+    values = [value for value in (getattr(a, field), getattr(b, field)) if value is not None]
+    return pick(values) if values else None
+
+
+# CSV header -> MicrogridData field
+CSV_COLUMN_MAPPING = {
+    "Timestamp": "timestamp",
+    "Battery_Active_Power": "battery_active_power",
+    "Battery_Active_Power_Set_Response": "battery_active_power_set_response",
+    "PVPCS_Active_Power": "pvpcs_active_power",
+    "GE_Body_Active_Power": "ge_body_active_power",
+    "GE_Active_Power": "ge_active_power",
+    "GE_Body_Active_Power_Set_Response": "ge_body_active_power_set_response",
+    "FC_Active_Power_FC_END_Set": "fc_active_power_fc_end_set",
+    "FC_Active_Power": "fc_active_power",
+    "FC_Active_Power_FC_end_Set_Response": "fc_active_power_fc_end_set_response",
+    "Island_mode_MCCB_Active_Power": "island_mode_mccb_active_power",
+    "MG-LV-MSB_AC_Voltage": "mg_lv_msb_ac_voltage",
+    "Receiving_Point_AC_Voltage": "receiving_point_ac_voltage",
+    "Island_mode_MCCB_AC_Voltage": "island_mode_mccb_ac_voltage",
+    "Island_mode_MCCB_Frequency": "island_mode_mccb_frequency",
+    "MG-LV-MSB_Frequency": "mg_lv_msb_frequency",
+    "Inlet_Temperature_of_Chilled_Water": "inlet_temperature_of_chilled_water",
+    "Outlet_Temperature": "outlet_temperature",
+    "Site": "site",
+}
+
+# Timestamp layouts tried, in order, before falling back to per-value parsing
+TIMESTAMP_FORMATS = ("%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+def _blank(column):
+    """True where a raw CSV value is missing or only whitespace."""
+    blank = column.isna()
+    if column.dtype == object:
+        blank |= column.astype(str).str.strip() == ''
+    return blank
+
+
+def parse_timestamps(column, formats=TIMESTAMP_FORMATS):
+    """
+    Parse a column of raw timestamps into naive datetimes (NaT when
+    unparsable): `formats` first, then any format per value. A column the
+    reader already parsed is returned as is.
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column
+    text = column.astype(str).str.strip()
+    parsed = pd.Series(pd.NaT, index=column.index, dtype='datetime64[ns]')
+    for fmt in formats:
+        pending = parsed.isna()
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(text[pending], format=fmt, errors='coerce')
+    pending = parsed.isna()
+    if pending.any():
+        try:
+            fallback = pd.to_datetime(text[pending], format='mixed', errors='coerce')
+        except (TypeError, ValueError):  # e.g. mixed time zone offsets
+            fallback = None
+        if fallback is not None and getattr(fallback.dt, 'tz', None) is None:
+            parsed[pending] = fallback
+    return parsed
+
+
+def parse_readings(df, site_id, timestamp_format=None):
+    """
+    Vectorized parse of a CSV frame whose columns were renamed through
+    CSV_COLUMN_MAPPING. `timestamp_format` (e.g. sniffed from the file) is
+    tried before TIMESTAMP_FORMATS.
+
+    Returns `(readings, skipped)`: `readings` is a frame indexed like `df`
+    with an aware `timestamp`, a `site_id` and a float column (NaN = NULL)
+    per measurement field present; `skipped` maps the index of every
+    rejected row to its reason ('missing_timestamp', 'invalid_timestamp'
+    or 'unknown_site').
+    """
+    reasons = pd.Series(None, index=df.index, dtype=object)
+
+    if 'timestamp' in df.columns:
+        missing = _blank(df['timestamp'])
+        formats = TIMESTAMP_FORMATS
+        if timestamp_format:
+            formats = tuple(dict.fromkeys((timestamp_format,) + formats))
+        timestamps = parse_timestamps(df['timestamp'], formats)
+        reasons[missing] = 'missing_timestamp'
+        reasons[~missing & timestamps.isna()] = 'invalid_timestamp'
+    else:
+        timestamps = pd.Series(pd.NaT, index=df.index, dtype='datetime64[ns]')
+        reasons[:] = 'missing_timestamp'
+
+    site_ids = pd.Series(site_id, index=df.index)
+    if 'site' in df.columns:
+        named = ~_blank(df['site'])
+        slugs = df['site'][named].astype(str).str.strip()
+        site_ids[named] = slugs.map(dict(Site.objects.values_list('slug', 'id')))
+        reasons[reasons.isna() & site_ids.isna()] = 'unknown_site'
+
+    kept = reasons.isna()
+    readings = pd.DataFrame(index=df.index[kept])
+    readings['timestamp'] = timestamps[kept].dt.tz_localize(
+        timezone.get_current_timezone(), ambiguous='NaT', nonexistent='NaT'
+    )
+    readings['site_id'] = site_ids[kept].astype(int)
+    for field in MEASUREMENT_FIELDS:
+        if field in df.columns:
+            readings[field] = pd.to_numeric(df[field][kept], errors='coerce').astype(float)
+
+    # Local times that do not exist or are ambiguous (DST changes)
+    dropped = readings['timestamp'].isna()
+    if dropped.any():
+        reasons[readings.index[dropped]] = 'invalid_timestamp'
+        readings = readings[~dropped]
+    return readings, reasons.dropna()
+
+
+def build_readings(readings):
+    """Turn a parse_readings frame into unsaved MicrogridData objects."""
+    fields = [field for field in MEASUREMENT_FIELDS if field in readings.columns]
+    values = readings[fields].astype(object).where(readings[fields].notna(), None)
+    return [
+        MicrogridData(site_id=site_id, timestamp=timestamp, **dict(zip(fields, row)))
+        for site_id, timestamp, row in zip(
+            readings['site_id'].tolist(),
+            pd.DatetimeIndex(readings['timestamp']).to_pydatetime(),
+            values.itertuples(index=False, name=None),
+        )
+    ]
+
+
+# -- Ingestion ledger -------------------------------------------------------
+
+def header_hash(columns):
+    """SHA-256 of a CSV header, whitespace around the names ignored."""
+    return hashlib.sha256('\x1f'.join(column.strip() for column in columns).encode()).hexdigest()
+
+
+def find_identical_run(content_hash, site=None):
+    """
+    Latest run of the same file (same bytes, same requested site) that did
+    not fail, or None.
+    """
+    return (
+        IngestionRun.objects.filter(content_hash=content_hash, site=site)
+        .exclude(status='failed')
+        .order_by('-created_at')
+        .first()
+    )
+
+
+def drop_ingested_rows(readings, skipped, site, columns_hash, exclude_run=None):
+    """
+    Drop the readings already stored that fall in the time span of an
+    earlier run of the same requested `site` and header (recorded before
+    its rows are written, so a failed run counts for the chunks it stored):
+    a re-exported file overlapping an earlier one only adds its new rows,
+    including those filling holes of the earlier span (e.g. after a
+    delete). Behind the site's `compacted_until` a reading is stored when
+    its minute is. The dropped rows join `skipped` as 'already_ingested'.
+    Returns `(readings, skipped)`.
+    """
+    if readings.empty:
+        return readings, skipped
+    first, last = readings['timestamp'].min(), readings['timestamp'].max()
+    spans = (
+        IngestionRun.objects.filter(
+            site=site,
+            header_hash=columns_hash,
+            first_timestamp__lte=last,
+            last_timestamp__gte=first,
+        )
+        .exclude(pk=exclude_run)
+        .values_list('first_timestamp', 'last_timestamp')
+    )
+    covered = pd.Series(False, index=readings.index)
+    for span_first, span_last in spans:
+        covered |= readings['timestamp'].between(span_first, span_last)
+    if not covered.any():
+        return readings, skipped
+
+    stored_site = Site.objects.get(pk=readings['site_id'].iloc[0])
+    candidates = readings.loc[covered, 'timestamp']
+    low, high = candidates.min(), candidates.max()
+    timestamps = pd.DatetimeIndex(candidates).asi8
+    present = _stored(timestamps, readings_queryset(low, high, stored_site))
+    if stored_site.compacted_until is not None:
+        minute_ns = 60 * 10**9
+        present |= _stored(
+            timestamps - timestamps % minute_ns, aggregates_queryset(low.floor('min'), high, stored_site)
+        ) & (timestamps < pd.Timestamp(stored_site.compacted_until).value)
+    duplicates = candidates.index[present]
+    if duplicates.empty:
+        return readings, skipped
+    dropped = pd.Series('already_ingested', index=duplicates, dtype=object)
+    return readings.drop(duplicates), pd.concat([skipped, dropped]).sort_index()
+
+
+def _stored(timestamps, queryset):
+    """
+    True where the UTC nanoseconds `timestamps` are the timestamp of a row
+    of `queryset`. Stored timestamps are streamed in chunks, never loaded
+    whole, whatever the size of the span.
+    """
+    unique = np.unique(timestamps)
+    found = np.zeros(len(unique), dtype=bool)
+    for stored, _ in iter_reading_chunks(queryset, ()):
+        index = np.searchsorted(unique, stored).clip(max=len(unique) - 1)
+        hit = unique[index] == stored
+        found[index[hit]] = True
+    return found[np.searchsorted(unique, timestamps)]
+
+
+def forget_ingested_range(start=None, end=None, site=None, keep_spans=False):
+    """
+    Keep the ingestion ledger true after the readings of [start, end] (of
+    one site, or of all sites) were deleted: runs overlapping the range lose
+    their content hash, so the same file can be uploaded again, and spans
+    lying wholly inside the range are cleared unless `keep_spans`
+    (minutes of the range still in the cold tier). Partly deleted spans are
+    kept: drop_ingested_rows only drops readings still stored.
+    """
+    runs = IngestionRun.objects.filter(first_timestamp__isnull=False)
+    if site is not None:
+        site_id = getattr(site, 'pk', site)
+        requested = Q(site_id=site_id)
+        # Runs record the requested site; None stands for the default site
+        if Site.objects.filter(pk=site_id, slug=DEFAULT_SITE_SLUG).exists():
+            requested |= Q(site__isnull=True)
+        runs = runs.filter(requested)
+    if start:
+        runs = runs.filter(last_timestamp__gte=start)
+    if end:
+        runs = runs.filter(first_timestamp__lte=end)
+    runs.update(content_hash='')
+    if keep_spans:
+        return
+    inside = runs
+    if start:
+        inside = inside.filter(first_timestamp__gte=start)
+    if end:
+        inside = inside.filter(last_timestamp__lte=end)
+    inside.update(first_timestamp=None, last_timestamp=None)
@@ -1,146 +1,310 @@
 import pandas as pd
 import os
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.utils import timezone
 from celery import shared_task
-from .models import MicrogridData
+from redis import RedisError
+from microgrid_monitoring.instrumentation import count_ingested_rows, observe_phases
+from . import hotwindow, rollups
+from .detection import detect_anomalies
+from .models import IngestionRun, MicrogridData, RollupRefresh, Site
+from .parsers import read_csv_file
+from .quality import profile_readings
+from .services import (
+    aggregates_queryset,
+    build_readings,
+    bump_data_revisions,
+    bump_queryset_revisions,
+    compact_site_readings,
+    delete_in_batches,
+    drop_ingested_rows,
+    forget_ingested_range,
+    header_hash,
+    parse_readings,
+    readings_queryset,
+)
+
+# Rows written (and scanned for anomalies) per transaction
+INGESTION_CHUNK_SIZE = 10000
 
 @shared_task(queue='ingestion')
-def process_csv_file(file_path, delimiter):
+def process_csv_file(file_path, delimiter, site_id=None, run_id=None, keep_file=False, skip_ingested=True):
     """
     Celery task to process CSV file in the background.
+
+    The format of the file is sniffed (see ingestion.parsers); `delimiter`
+    is used when it splits the header. Rows are stored under `site_id` (the
+    default site when omitted), unless
+    the file has a `Site` column holding site slugs, which wins per row.
+    The outcome, quality profile and timings are recorded on the
+    IngestionRun `run_id` when given. The file is deleted afterwards unless
+    `keep_file` (e.g. when ingesting an archive in place).
+
+    Rows of a single-site file already covered by an earlier run of the
+    same site and header are skipped as 'already_ingested' (unless not
+    `skip_ingested`); the span of the file is recorded on its run for the
+    next ones. Without `run_id` nothing is recorded: later files are not
+    deduplicated against this one.
     """
     if not os.path.exists(file_path):
-        return {"error": f"File not found: {file_path}", "status": "failed"}
+        result = {"error": f"File not found: {file_path}", "status": "failed"}
+        finish_ingestion_run(run_id, result)
+        return result
+    if run_id:
+        IngestionRun.objects.filter(pk=run_id).update(status="processing")
+    timings = {}
     try:
-        # Try UTF-8, fallback to Latin-1
-        try:
-            df = pd.read_csv(file_path, delimiter=delimiter, encoding='utf-8')
-        except UnicodeDecodeError:
-            df = pd.read_csv(file_path, delimiter=delimiter, encoding='latin-1')
-
-        # Clean column names to match model field names
-        df.columns = df.columns.str.strip()
-        
-        # Map CSV column names to model field names
-        column_mapping = {
-            "Timestamp": "timestamp",
-            "Battery_Active_Power": "battery_active_power",
-            "Battery_Active_Power_Set_Response": "battery_active_power_set_response",
-            "PVPCS_Active_Power": "pvpcs_active_power",
-            "GE_Body_Active_Power": "ge_body_active_power",
-            "GE_Active_Power": "ge_active_power",
-            "GE_Body_Active_Power_Set_Response": "ge_body_active_power_set_response",
-            "FC_Active_Power_FC_END_Set": "fc_active_power_fc_end_set",
-            "FC_Active_Power": "fc_active_power",
-            "FC_Active_Power_FC_end_Set_Response": "fc_active_power_fc_end_set_response",
-            "Island_mode_MCCB_Active_Power": "island_mode_mccb_active_power",
-            "MG-LV-MSB_AC_Voltage": "mg_lv_msb_ac_voltage",
-            "Receiving_Point_AC_Voltage": "receiving_point_ac_voltage",
-            "Island_mode_MCCB_AC_Voltage": "island_mode_mccb_ac_voltage",
-            "Island_mode_MCCB_Frequency": "island_mode_mccb_frequency",
-            "MG-LV-MSB_Frequency": "mg_lv_msb_frequency",
-            "Inlet_Temperature_of_Chilled_Water": "inlet_temperature_of_chilled_water",
-            "Outlet_Temperature": "outlet_temperature"
+        started = time.perf_counter()
+        # Encoding, delimiter and timestamp format are sniffed once, then one read
+        df, csv_format = read_csv_file(file_path, delimiter)
+        timings["read"] = _elapsed(started)
+
+        requested_site_id = site_id
+        if site_id is None:
+            site_id = Site.default().pk
+
+        # Vectorized parse: rejected rows come back with their reason
+        started = time.perf_counter()
+        readings, skipped = parse_readings(df, site_id, csv_format["timestamp_format"])
+        timings["parse"] = _elapsed(started)
+
+        # Overlap with earlier files of the same export (single-site files only)
+        ledger = {"header_hash": header_hash(csv_format["columns"])}
+        if "site" not in df.columns and not readings.empty:
+            ledger["first_timestamp"] = readings["timestamp"].min().to_pydatetime()
+            ledger["last_timestamp"] = readings["timestamp"].max().to_pydatetime()
+            if skip_ingested:
+                readings, skipped = drop_ingested_rows(
+                    readings, skipped, requested_site_id, ledger["header_hash"], exclude_run=run_id
+                )
+            # Recorded before writing: a failed run still covers the rows it stored
+            if run_id:
+                IngestionRun.objects.filter(pk=run_id).update(**ledger)
+
+        started = time.perf_counter()
+        quality = profile_readings(df, readings, skipped)
+        quality["format"] = {
+            key: csv_format[key] for key in ("engine", "fallbacks", "encoding", "delimiter", "timestamp_format")
         }
-        
-        # Rename columns to match model
-        df.rename(columns=column_mapping, inplace=True)
-        
-        total_rows = len(df)
-        total_imported = 0
-        total_skipped = 0
-        
-        # Process in chunks to reduce memory usage
-        chunk_size = 10000
-        for chunk_start in range(0, total_rows, chunk_size):
-            chunk_end = min(chunk_start + chunk_size, total_rows)
-            chunk_df = df.iloc[chunk_start:chunk_end]
-            
-            objs_to_create = []
-            for _, row in chunk_df.iterrows():
-                try:
-                    timestamp_value = row.get("timestamp")
-                    if pd.isna(timestamp_value) or str(timestamp_value).strip() == '':
-                        total_skipped += 1
-                        continue
-
-                    # Try specific formats first
-                    ts = None
-                    for fmt in ["%Y/%m/%d %H:%M:%S", "%Y-%m-%d %H:%M:%S"]:
-                        try:
-                            ts = pd.to_datetime(str(timestamp_value), format=fmt, errors='coerce')
-                            if not pd.isna(ts):
-                                break
-                        except:
-                            continue
-                    
-                    # If specific formats didn't work, try general parsing
-                    if pd.isna(ts) or ts is None:
-                        ts = pd.to_datetime(str(timestamp_value), errors='coerce')
-                    
-                    if pd.isna(ts):
-                        total_skipped += 1
-                        continue
-                        
-                    # Fix: Convert pandas Timestamp to a naive Python datetime object
-                    # and then make it timezone-aware.
-                    ts_aware = timezone.make_aware(ts.to_pydatetime(), timezone.get_current_timezone())
-
-                    def safe_float(val):
-                        if pd.isna(val) or val == '':
-                            return None
-                        try:
-                            return float(val)
-                        except Exception:
-                            return None
-
-                    obj = MicrogridData(
-                        timestamp=ts_aware,
-                        battery_active_power=safe_float(row.get("battery_active_power")),
-                        battery_active_power_set_response=safe_float(row.get("battery_active_power_set_response")),
-                        pvpcs_active_power=safe_float(row.get("pvpcs_active_power")),
-                        ge_body_active_power=safe_float(row.get("ge_body_active_power")),
-                        ge_active_power=safe_float(row.get("ge_active_power")),
-                        ge_body_active_power_set_response=safe_float(row.get("ge_body_active_power_set_response")),
-                        fc_active_power_fc_end_set=safe_float(row.get("fc_active_power_fc_end_set")),
-                        fc_active_power=safe_float(row.get("fc_active_power")),
-                        fc_active_power_fc_end_set_response=safe_float(row.get("fc_active_power_fc_end_set_response")),
-                        island_mode_mccb_active_power=safe_float(row.get("island_mode_mccb_active_power")),
-                        mg_lv_msb_ac_voltage=safe_float(row.get("mg_lv_msb_ac_voltage")),
-                        receiving_point_ac_voltage=safe_float(row.get("receiving_point_ac_voltage")),
-                        island_mode_mccb_ac_voltage=safe_float(row.get("island_mode_mccb_ac_voltage")),
-                        island_mode_mccb_frequency=safe_float(row.get("island_mode_mccb_frequency")),
-                        mg_lv_msb_frequency=safe_float(row.get("mg_lv_msb_frequency")),
-                        inlet_temperature_of_chilled_water=safe_float(row.get("inlet_temperature_of_chilled_water")),
-                        outlet_temperature=safe_float(row.get("outlet_temperature")),
-                    )
-                    objs_to_create.append(obj)
-                except Exception as e:
-                    total_skipped += 1
-                    continue
-
-            if objs_to_create:
-                MicrogridData.objects.bulk_create(objs_to_create, batch_size=500)
-                total_imported += len(objs_to_create)
+        timings["profile"] = _elapsed(started)
+
+        # Write and scan for anomalies in chunks to bound memory; each chunk
+        # commits with its detection, so detector locks are only held for one chunk
+        started = time.perf_counter()
+        total_anomalies = 0
+        for chunk_start in range(0, len(readings), INGESTION_CHUNK_SIZE):
+            chunk = readings.iloc[chunk_start:chunk_start + INGESTION_CHUNK_SIZE]
+            with transaction.atomic():
+                MicrogridData.objects.bulk_create(build_readings(chunk), batch_size=500)
+                if settings.ANOMALY_DETECTION_ENABLED:
+                    total_anomalies += detect_batch_anomalies(chunk)
+        timings["write"] = _elapsed(started)
+
+        # Invalidate caches built on the days this file touched
+        touched_days = {
+            touched_site_id: set(group["timestamp"].dt.date)
+            for touched_site_id, group in readings.groupby("site_id")
+        }
+        for touched_site_id, days in touched_days.items():
+            bump_data_revisions(touched_site_id, days)
+        # Recent rows go to the hot window as well
+        for touched_site_id, group in readings.groupby("site_id"):
+            hotwindow.refresh_segments(touched_site_id, pd.DatetimeIndex(group["timestamp"]).asi8)
+
+        # Backfilled rows behind a site's compaction watermark join the cold tier now
+        for site in Site.objects.filter(pk__in=list(touched_days), compacted_until__isnull=False):
+            if min(touched_days[site.pk]) <= timezone.localdate(site.compacted_until):
+                compact_site_readings(site, site.compacted_until)
 
         # Clean up the temporary file
-        try:
-            os.remove(file_path)
-        except:
-            pass
-
-        return {
-            "imported_rows": total_imported,
-            "skipped_rows": total_skipped,
-            "total_rows": total_rows,
+        if not keep_file:
+            try:
+                os.remove(file_path)
+            except:
+                pass
+
+        result = {
+            "imported_rows": len(readings),
+            "skipped_rows": len(skipped),
+            "total_rows": len(df),
+            "anomalies_detected": total_anomalies,
             "status": "completed"
         }
+        finish_ingestion_run(run_id, result, quality, timings, ledger)
+        return result
         
     except Exception as e:
         # Clean up the temporary file even if there's an error
-        try:
-            os.remove(file_path)
-        except:
-            pass
+        if not keep_file:
+            try:
+                os.remove(file_path)
+            except:
+                pass
         
-        return {"error": f"Failed to process CSV: {str(e)}", "status": "failed"}
\ No newline at end of file
+        result = {"error": f"Failed to process CSV: {str(e)}", "status": "failed"}
+        finish_ingestion_run(run_id, result, timings=timings)
+        return result
+
+
+def _elapsed(started):
+    return round(time.perf_counter() - started, 4)
+
+
+def finish_ingestion_run(run_id, result, quality=None, timings=None, ledger=None):
+    """
+    Record the outcome of process_csv_file on its IngestionRun (with the
+    `ledger` fields of a completed file) and in the metrics.
+    """
+    observe_phases("ingestion", timings or {})
+    count_ingested_rows(result.get("imported_rows", 0), result.get("skipped_rows", 0))
+    if not run_id:
+        return
+    IngestionRun.objects.filter(pk=run_id).update(
+        status=result["status"],
+        total_rows=result.get("total_rows", 0),
+        imported_rows=result.get("imported_rows", 0),
+        skipped_rows=result.get("skipped_rows", 0),
+        quality=quality or {},
+        timings=timings or {},
+        error_message=result.get("error", ""),
+        completed_at=timezone.now(),
+        **(ledger or {}),
+    )
+
+
+def detect_batch_anomalies(readings):
+    """
+    Run the anomaly detection stage on a parse_readings frame, site by
+    site. Returns the number of new events.
+    """
+    created = 0
+    for site_id, group in readings.groupby("site_id", sort=False):
+        columns = {
+            signal: group[signal].to_numpy(dtype=float)
+            for signal in settings.ANOMALY_RULES if signal in group.columns
+        }
+        created += detect_anomalies(site_id, pd.DatetimeIndex(group["timestamp"]).asi8, columns)
+    return created
+
+
+@shared_task(bind=True, queue='ingestion')
+def bulk_delete_microgrid_data(self, start_date=None, end_date=None, site_id=None):
+    """
+    Celery task deleting the records of [start_date, end_date] (of one site,
+    or of all sites) in bounded, paced batches. Progress is published as a
+    PROGRESS state readable from the task status endpoint.
+    """
+    queryset = readings_queryset(start_date, end_date, site_id)
+    total = queryset.count()
+
+    def report_progress(deleted):
+        self.update_state(state='PROGRESS', meta={'deleted_count': deleted, 'total': total})
+
+    # Invalidate caches built on the affected days
+    bump_queryset_revisions(queryset)
+    deleted = delete_in_batches(
+        queryset,
+        settings.BULK_DELETE_BATCH_SIZE,
+        settings.BULK_DELETE_PAUSE_SECONDS,
+        report_progress,
+    )
+    # Compacted minutes of the range go too (tiny next to the raw rows)
+    aggregates = aggregates_queryset(start_date, end_date, site_id)
+    bump_queryset_revisions(aggregates)
+    aggregates.delete()
+    forget_ingested_range(start_date, end_date, site_id)
+    hotwindow.refresh_range(site_id, start_date, end_date)
+    return {
+        "message": f"Successfully deleted {deleted} records.",
+        "deleted_count": deleted,
+        "status": "completed"
+    }
+
+
+@shared_task(queue='ingestion')
+def prune_raw_data(retention_days=None):
+    """
+    Retention policy: delete raw records older than `retention_days`
+    (RAW_DATA_RETENTION_DAYS by default; 0 disables pruning). With tiering
+    enabled, only records behind their site's `compacted_until` are pruned:
+    anything newer has not been compacted yet and is the only copy.
+    """
+    retention_days = settings.RAW_DATA_RETENTION_DAYS if retention_days is None else retention_days
+    if not retention_days:
+        return {"deleted_count": 0, "status": "disabled"}
+
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    queryset = MicrogridData.objects.filter(timestamp__lt=cutoff)
+    if settings.RAW_DATA_TIER_AFTER_DAYS:
+        queryset = queryset.filter(timestamp__lt=F("site__compacted_until"))
+    bump_queryset_revisions(queryset)
+    deleted = delete_in_batches(
+        queryset, settings.BULK_DELETE_BATCH_SIZE, settings.BULK_DELETE_PAUSE_SECONDS
+    )
+    # Tiered sites keep their compacted minutes: their ledger spans still hold
+    forget_ingested_range(end=cutoff, keep_spans=bool(settings.RAW_DATA_TIER_AFTER_DAYS))
+    return {"deleted_count": deleted, "cutoff": cutoff.isoformat(), "status": "completed"}
+
+
+@shared_task(queue='ingestion')
+def compact_old_readings(tier_after_days=None):
+    """
+    Tiering policy: compact raw records older than `tier_after_days`
+    (RAW_DATA_TIER_AFTER_DAYS by default; 0 disables tiering) into
+    per-minute aggregates, site by site.
+    """
+    tier_after_days = settings.RAW_DATA_TIER_AFTER_DAYS if tier_after_days is None else tier_after_days
+    if not tier_after_days:
+        return {"compacted_count": 0, "status": "disabled"}
+
+    cutoff = timezone.now() - timedelta(days=tier_after_days)
+    compacted = 0
+    for site in Site.objects.all():
+        compacted += compact_site_readings(site, cutoff, settings.BULK_DELETE_PAUSE_SECONDS)
+    return {"compacted_count": compacted, "cutoff": cutoff.isoformat(), "status": "completed"}
+
+
+@shared_task(queue='ingestion')
+def maintain_hot_window():
+    """
+    Keep the hot window of every site current: build the windows missing
+    from Redis (first run, Redis restart, failed refresh) and drop the
+    segments older than HOT_WINDOW_HOURS.
+    """
+    if not hotwindow.enabled():
+        return {"status": "disabled"}
+    try:
+        rebuilt = hotwindow.maintain()
+    except RedisError as exc:
+        return {"status": "failed", "error": str(exc)}
+    return {"rebuilt_sites": rebuilt, "status": "completed"}
+
+
+@shared_task(queue='ingestion')
+def refresh_kpi_rollups():
+    """
+    Debounced refresh of the KPI rollup views (see ingestion.rollups):
+    deferred while changes keep coming within KPI_ROLLUP_REFRESH_DELAY_SECONDS,
+    at most KPI_ROLLUP_REFRESH_MAX_WAIT_SECONDS after the first one.
+    """
+    state = RollupRefresh.objects.filter(pk=1).first()
+    if state is None or state.pending_since is None:
+        return {"status": "idle"}
+    now = timezone.now()
+    quiet = (now - state.requested_at).total_seconds()
+    waited = (now - state.pending_since).total_seconds()
+    delay, max_wait = settings.KPI_ROLLUP_REFRESH_DELAY_SECONDS, settings.KPI_ROLLUP_REFRESH_MAX_WAIT_SECONDS
+    if quiet < delay and waited < max_wait:
+        refresh_kpi_rollups.apply_async(countdown=min(delay - quiet, max_wait - waited))
+        return {"status": "deferred"}
+
+    # Changes from now on schedule the next refresh
+    RollupRefresh.objects.filter(pk=1).update(pending_since=None)
+    started = time.perf_counter()
+    rollups.refresh_views()
+    RollupRefresh.objects.filter(pk=1).update(refreshed_at=now)
+    return {"seconds": _elapsed(started), "status": "completed"}
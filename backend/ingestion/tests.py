@@ -1,3 +1,532 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from contextlib import nullcontext
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import hotwindow, tasks
+from .detection import detect_anomalies
+from .models import AnomalyEvent, DetectorState, IngestionRun, MicrogridData, ReadingAggregate, Site
+from .parsers import SNIFF_BYTES, read_csv_file
+from .quality import profile_readings
+from .services import (
+    bump_data_revisions,
+    compact_site_readings,
+    drop_ingested_rows,
+    forget_ingested_range,
+    iter_tiered_rows,
+    parse_readings,
+)
+from .tasks import prune_raw_data
+
+START = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+
+
+def create_readings(site, count, step_seconds=20, start=START, **values):
+    """Create `count` readings of `site`, `step_seconds` apart, with varying power."""
+    MicrogridData.objects.bulk_create([
+        MicrogridData(
+            site=site,
+            timestamp=start + timedelta(seconds=i * step_seconds),
+            ge_active_power=values.get('ge_active_power', 10.0 + i % 7),
+            mg_lv_msb_ac_voltage=values.get('mg_lv_msb_ac_voltage', 230.0 + i % 3),
+        )
+        for i in range(count)
+    ])
+
+
+class TieredRowsTests(TestCase):
+    fields = ('ge_active_power', 'mg_lv_msb_ac_voltage')
+
+    def setUp(self):
+        self.site = Site.objects.create(name='North', slug='north')
+        # Three hours of readings every 20 s
+        create_readings(self.site, 540)
+        self.end = START + timedelta(hours=3)
+
+    def rows(self, aggregation):
+        return list(iter_tiered_rows(START, self.end, Site.objects.get(pk=self.site.pk), self.fields, aggregation))
+
+    def test_hourly_buckets_survive_compaction(self):
+        before = self.rows('hour')
+        # Compact up to the middle of the second hour
+        compact_site_readings(self.site, START + timedelta(minutes=90))
+        after = self.rows('hour')
+        self.assertEqual(len(after), 3)
+        for expected, actual in zip(before, after):
+            self.assertEqual(expected[0], actual[0])
+            for a, b in zip(expected[1:], actual[1:]):
+                self.assertAlmostEqual(a, b)
+
+    def test_raw_export_reads_compacted_minutes(self):
+        compact_site_readings(self.site, START + timedelta(hours=1))
+        rows = self.rows('raw')
+        # 60 per-minute means, then the remaining raw readings
+        self.assertEqual(len(rows), 60 + 360)
+        self.assertEqual(rows[0][0], START)
+        self.assertEqual(rows[60][0], START + timedelta(hours=1))
+
+
+class PruneRawDataTests(TestCase):
+    @override_settings(RAW_DATA_TIER_AFTER_DAYS=30)
+    def test_tiered_sites_keep_readings_not_yet_compacted(self):
+        site = Site.objects.create(name='North', slug='north')
+        create_readings(site, 10, step_seconds=86400)
+        Site.objects.filter(pk=site.pk).update(compacted_until=START + timedelta(days=4))
+        result = prune_raw_data(retention_days=1)
+        self.assertEqual(result['deleted_count'], 4)
+        self.assertEqual(MicrogridData.objects.filter(site=site).count(), 6)
+
+
+class CompactionTests(TestCase):
+    def setUp(self):
+        self.site = Site.objects.create(name='North', slug='north')
+        # One minute: 12 kW, a missing reading, 6 kW
+        for i, power in enumerate((12.0, None, 6.0)):
+            MicrogridData.objects.create(site=self.site, timestamp=START + timedelta(seconds=20 * i), ge_active_power=power)
+
+    def energy(self):
+        compact_site_readings(self.site, START + timedelta(minutes=1))
+        return ReadingAggregate.objects.get(site=self.site).ge_active_power_energy
+
+    def test_missing_readings_are_left_out(self):
+        self.assertAlmostEqual(self.energy(), 9.0 / 60)
+
+    def test_missing_readings_count_as_zero_when_configured(self):
+        with self.settings(KPI_INTEGRATION=dict(settings.KPI_INTEGRATION, missing='zero')):
+            self.assertAlmostEqual(self.energy(), 6.0 / 60)
+
+
+class IngestionLedgerTests(TestCase):
+    def setUp(self):
+        self.site = Site.objects.create(name='North', slug='north')
+        # An earlier file covered minutes 0-9; minutes 3-5 were deleted since
+        create_readings(self.site, 10, step_seconds=60)
+        MicrogridData.objects.filter(
+            timestamp__gte=START + timedelta(minutes=3), timestamp__lte=START + timedelta(minutes=5)
+        ).delete()
+        self.run = IngestionRun.objects.create(
+            file_name='a.csv', site=self.site, status='completed', header_hash='h', content_hash='c',
+            first_timestamp=START, last_timestamp=START + timedelta(minutes=9),
+        )
+
+    def drop(self, minutes):
+        readings = pd.DataFrame({
+            'timestamp': [pd.Timestamp(START) + pd.Timedelta(minutes=m) for m in minutes],
+            'site_id': self.site.pk,
+        })
+        kept, skipped = drop_ingested_rows(readings, pd.Series(dtype=object), self.site, 'h')
+        return [int((ts - pd.Timestamp(START)).total_seconds() // 60) for ts in kept['timestamp']], skipped
+
+    def test_stored_readings_are_dropped_and_holes_filled(self):
+        kept, skipped = self.drop(range(13))
+        self.assertEqual(kept, [3, 4, 5, 10, 11, 12])
+        self.assertEqual(len(skipped), 7)
+        self.assertTrue((skipped == 'already_ingested').all())
+
+    def test_repeated_rows_of_a_file_are_both_dropped(self):
+        kept, skipped = self.drop([1, 1, 2, 11, 11])
+        self.assertEqual(kept, [11, 11])
+        self.assertEqual(len(skipped), 3)
+
+    def test_other_headers_are_not_deduplicated(self):
+        readings = pd.DataFrame({'timestamp': [pd.Timestamp(START)], 'site_id': self.site.pk})
+        kept, _ = drop_ingested_rows(readings, pd.Series(dtype=object), self.site, 'other')
+        self.assertEqual(len(kept), 1)
+
+    def test_compacted_minutes_count_as_stored(self):
+        compact_site_readings(self.site, START + timedelta(minutes=10))
+        kept, _ = self.drop(range(13))
+        self.assertEqual(kept, [3, 4, 5, 10, 11, 12])
+
+    def test_deleting_a_range_forgets_the_file(self):
+        forget_ingested_range(START + timedelta(minutes=3), START + timedelta(minutes=5), self.site)
+        self.run.refresh_from_db()
+        self.assertEqual(self.run.content_hash, '')
+        self.assertEqual(self.run.first_timestamp, START)
+        forget_ingested_range(site=self.site)
+        self.run.refresh_from_db()
+        self.assertIsNone(self.run.first_timestamp)
+
+
+class InMemoryRedis:
+    """The few Redis commands the hot window uses, for tests without a server."""
+
+    def __init__(self):
+        self.data = {}
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = self._bytes(value)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        values = self.data.setdefault(key, {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        for name, item in items.items():
+            values[self._bytes(name)] = self._bytes(item)
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.data.get(key, {}).pop(self._bytes(field), None)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hkeys(self, key):
+        return list(self.data.get(key, {}))
+
+    def flushall(self):
+        self.data.clear()
+
+    def lock(self, *args, **kwargs):
+        return nullcontext()
+
+    def pipeline(self):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.calls = []
+
+            def __getattr__(self, name):
+                return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+            def execute(self):
+                calls, self.calls = self.calls, []
+                return [getattr(client, name)(*args, **kwargs) for name, args, kwargs in calls]
+
+        return Pipeline()
+
+
+@override_settings(HOT_WINDOW_REDIS_URL='redis://hot-window', HOT_WINDOW_SEGMENT_SECONDS=600)
+class HotWindowTests(TestCase):
+    def setUp(self):
+        self.redis = InMemoryRedis()
+        patcher = mock.patch.object(hotwindow, 'get_client', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        hotwindow._segments.clear()
+        self.site = Site.objects.create(name='North', slug='north')
+        self.segment = hotwindow._segment_start(pd.Timestamp(timezone.now() - timedelta(hours=2)).value)
+        self.start = datetime.fromtimestamp(self.segment, dt_timezone.utc)
+
+    def write(self, power):
+        MicrogridData.objects.filter(site=self.site).delete()
+        create_readings(self.site, 10, step_seconds=30, start=self.start, ge_active_power=power)
+
+    def load(self):
+        start_ns = self.segment * hotwindow.NS_PER_SECOND
+        _, columns = hotwindow.load(self.site.pk, start_ns, start_ns + 600 * hotwindow.NS_PER_SECOND, ('ge_active_power',))
+        return sorted(set(columns['ge_active_power']))
+
+    def test_rewritten_segments_are_reloaded(self):
+        self.write(10.0)
+        hotwindow.rebuild(self.site.pk)
+        self.assertEqual(self.load(), [10.0])
+        # Deleted: the segment and its version go away
+        MicrogridData.objects.filter(site=self.site).delete()
+        hotwindow._refresh(self.site.pk, [self.segment])
+        self.assertEqual(self.load(), [])
+        # Written again: a new version, never the one cached before
+        self.write(20.0)
+        hotwindow._refresh(self.site.pk, [self.segment])
+        self.assertEqual(self.load(), [20.0])
+        # Redis lost its keys, the window is built again
+        self.redis.flushall()
+        self.write(30.0)
+        hotwindow.rebuild(self.site.pk)
+        self.assertEqual(self.load(), [30.0])
+
+    def test_evicted_segments_are_not_served_from_the_cache(self):
+        self.write(10.0)
+        hotwindow.rebuild(self.site.pk)
+        self.assertEqual(self.load(), [10.0])
+        self.write(20.0)
+        hotwindow._refresh(self.site.pk, [self.segment])
+        self.redis.delete(hotwindow._key(self.site.pk, 'seg', self.segment))
+        self.assertEqual(self.load(), [])
+
+
+class BulkIngestCommandTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, 'checkpoint.json')
+
+    def write_csv(self, name, first_minute, count):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write('Timestamp,GE_Active_Power,MG-LV-MSB_Frequency\n')
+            for minute in range(first_minute, first_minute + count):
+                timestamp = START + timedelta(minutes=minute)
+                f.write(f"{timestamp:%Y/%m/%d %H:%M:%S},{10 + minute % 5},50.0\n")
+        return path
+
+    def ingest(self):
+        output = StringIO()
+        call_command(
+            'bulk_ingest', self.directory, workers=1, checkpoint=self.checkpoint, stdout=output, stderr=output
+        )
+        return output.getvalue()
+
+    def checkpointed(self):
+        with open(self.checkpoint) as f:
+            return {os.path.basename(path): entry['status'] for path, entry in json.load(f)['files'].items()}
+
+    def test_checkpoint_resumes(self):
+        self.write_csv('a.csv', 0, 20)
+        self.write_csv('b.csv', 20, 20)
+        self.assertIn('2 to go', self.ingest())
+        self.assertEqual(self.checkpointed(), {'a.csv': 'completed', 'b.csv': 'completed'})
+        self.assertIn('0 to go', self.ingest())
+        # A file changed since is ingested again, only its new rows are added
+        self.write_csv('b.csv', 20, 30)
+        self.assertIn('1 to go', self.ingest())
+        self.assertEqual(MicrogridData.objects.count(), 50)
+
+    def test_failed_file_keeps_its_chunks_and_is_retried(self):
+        self.write_csv('a.csv', 0, 20)
+        build_readings = tasks.build_readings
+        calls = []
+
+        def fail_second_chunk(chunk):
+            calls.append(chunk)
+            if len(calls) == 2:
+                raise RuntimeError('storage unavailable')
+            return build_readings(chunk)
+
+        with mock.patch.object(tasks, 'INGESTION_CHUNK_SIZE', 5), \
+                mock.patch.object(tasks, 'build_readings', side_effect=fail_second_chunk):
+            self.assertIn('storage unavailable', self.ingest())
+        self.assertEqual(self.checkpointed(), {'a.csv': 'failed'})
+        self.assertEqual(MicrogridData.objects.count(), 5)
+
+        self.assertIn('1 to go', self.ingest())
+        self.assertEqual(self.checkpointed(), {'a.csv': 'completed'})
+        self.assertEqual(MicrogridData.objects.count(), 20)
+        self.assertEqual(IngestionRun.objects.filter(status='completed').get().skipped_rows, 5)
+
+    def test_files_of_the_same_site(self):
+        self.write_csv('a.csv', 0, 30)
+        self.write_csv('b.csv', 20, 30)
+        self.ingest()
+        self.assertEqual(MicrogridData.objects.count(), 50)
+        self.assertEqual(MicrogridData.objects.values('timestamp').distinct().count(), 50)
+        state = DetectorState.objects.get(signal='mg_lv_msb_frequency')
+        self.assertEqual(state.sample_count, 50)
+
+
+class DetectionTests(TestCase):
+    rules = {'p': {'max': 10.0, 'zscore': 4.0, 'alpha': 0.1, 'warmup': 5}}
+
+    def setUp(self):
+        self.site = Site.objects.create(name='North', slug='north')
+
+    def detect(self, minutes, values, site=None):
+        timestamps = pd.DatetimeIndex([pd.Timestamp(START) + pd.Timedelta(minutes=m) for m in minutes]).asi8
+        return detect_anomalies((site or self.site).pk, timestamps, {'p': np.array(values, dtype=float)}, self.rules)
+
+    def events(self, site=None):
+        return list(
+            AnomalyEvent.objects.filter(site=site or self.site).order_by('started_at')
+            .values_list('kind', 'started_at', 'ended_at', 'sample_count')
+        )
+
+    def test_baseline_carries_across_batches(self):
+        values = list(np.random.default_rng(0).normal(5.0, 0.5, 60))
+        values[40] = 9.5
+        whole = Site.objects.create(name='Whole', slug='whole')
+        self.detect(range(60), values, whole)
+        self.detect(range(25), values[:25])
+        self.detect(range(25, 60), values[25:])
+        split, single = DetectorState.objects.get(site=self.site), DetectorState.objects.get(site=whole)
+        self.assertEqual(split.sample_count, single.sample_count)
+        self.assertAlmostEqual(split.mean, single.mean)
+        self.assertAlmostEqual(split.variance, single.variance)
+        self.assertEqual(self.events(), self.events(whole))
+        self.assertIn(('zscore', START + timedelta(minutes=40)), [event[:2] for event in self.events()])
+
+    def test_runs_continue_into_the_next_batch(self):
+        self.detect([0, 1, 2], [5.0, 20.0, 20.0])
+        self.detect([3, 4], [20.0, 5.0])
+        self.assertEqual(
+            self.events(), [('high', START + timedelta(minutes=1), START + timedelta(minutes=3), 3)]
+        )
+
+    def test_distant_or_older_batches_open_new_events(self):
+        self.detect([0, 1, 2], [5.0, 20.0, 20.0])
+        self.detect([3 * 1440, 3 * 1440 + 1], [20.0, 5.0])
+        self.assertEqual(len(self.events()), 2)
+        # A backfill of older readings does not stretch the open event backwards
+        self.detect([-10, -9], [20.0, 5.0])
+        self.assertEqual(
+            [(started - START, ended - START) for _, started, ended, _ in self.events()],
+            [(timedelta(minutes=-10),) * 2, (timedelta(minutes=1), timedelta(minutes=2)), (timedelta(days=3),) * 2],
+        )
+
+    def test_readings_scanned_again_are_not_recorded_twice(self):
+        self.assertEqual(self.detect([0, 1, 2, 3], [5.0, 20.0, 20.0, 5.0]), 1)
+        self.assertEqual(self.detect([0, 1, 2, 3], [5.0, 20.0, 20.0, 5.0]), 0)
+        self.assertEqual(len(self.events()), 1)
+
+
+class ParserTests(TestCase):
+    def read(self, content, encoding='utf-8', delimiter=','):
+        path = os.path.join(tempfile.mkdtemp(), 'export.csv')
+        with open(path, 'wb') as f:
+            f.write(content.encode(encoding))
+        df, csv_format = read_csv_file(path, delimiter, engine='arrow')
+        readings, skipped = parse_readings(df, 1, csv_format['timestamp_format'])
+        return df, csv_format, readings, skipped
+
+    def test_byte_order_mark(self):
+        df, csv_format, readings, _ = self.read(
+            '\ufeffTimestamp,GE_Active_Power\n2024/03/01 00:00:00,1.5\n', encoding='utf-8'
+        )
+        self.assertEqual(csv_format['encoding'], 'utf-8-sig')
+        self.assertEqual((csv_format['engine'], csv_format['fallbacks']), ('arrow', []))
+        self.assertEqual(readings['ge_active_power'].tolist(), [1.5])
+
+    def test_latin_1(self):
+        df, csv_format, readings, _ = self.read(
+            'Timestamp,GE_Active_Power,Site\n2024/03/01 00:00:00,1.5,Forêt\n', encoding='latin-1'
+        )
+        self.assertEqual(csv_format['encoding'], 'latin-1')
+        self.assertEqual(df['site'].tolist(), ['Forêt'])
+
+    def test_semicolons(self):
+        _, csv_format, readings, _ = self.read(
+            'Timestamp;GE_Active_Power\n2024/03/01 00:00:00;1.5\n2024/03/01 00:00:20;2.5\n'
+        )
+        self.assertEqual(csv_format['delimiter'], ';')
+        self.assertEqual(readings['ge_active_power'].tolist(), [1.5, 2.5])
+
+    def test_timestamp_layout_changing_after_the_sample(self):
+        lines = ['Timestamp,GE_Active_Power']
+        while sum(len(line) + 1 for line in lines) < SNIFF_BYTES:
+            lines.append(f"{START + timedelta(seconds=len(lines)):%Y/%m/%d %H:%M:%S},1.0")
+        lines.append(f"{START + timedelta(days=1):%Y-%m-%d %H:%M:%S},2.0")
+        _, csv_format, readings, skipped = self.read('\n'.join(lines) + '\n')
+        self.assertEqual(csv_format['engine'], 'arrow-text')
+        self.assertTrue(csv_format['fallbacks'][0].startswith('arrow:'))
+        self.assertEqual(len(readings), len(lines) - 1)
+        self.assertTrue(skipped.empty)
+
+    def test_bad_numeric_cell(self):
+        _, csv_format, readings, skipped = self.read(
+            'Timestamp,GE_Active_Power\n2024/03/01 00:00:00,1.5\n2024/03/01 00:00:20,n/a kW\n'
+        )
+        self.assertEqual(csv_format['engine'], 'arrow-text')
+        self.assertEqual(len(csv_format['fallbacks']), 1)
+        self.assertEqual(readings['ge_active_power'].tolist()[0], 1.5)
+        self.assertTrue(np.isnan(readings['ge_active_power'].tolist()[1]))
+        self.assertTrue(skipped.empty)
+
+
+class QualityProfileTests(TestCase):
+    def profile(self, content):
+        path = os.path.join(tempfile.mkdtemp(), 'export.csv')
+        with open(path, 'w') as f:
+            f.write(content)
+        df, csv_format = read_csv_file(path, ',')
+        readings, skipped = parse_readings(df, 1, csv_format['timestamp_format'])
+        return profile_readings(df, readings, skipped)
+
+    def test_rejected_rows_and_columns(self):
+        quality = self.profile(
+            'Timestamp,GE_Active_Power,MG-LV-MSB_Frequency,Comment\n'
+            '2024/03/01 00:00:00,1.5,50,a\n'
+            '2024/03/01 00:00:20,n/a,70,b\n'
+            ',1.0,50,c\n'
+            'yesterday,1.0,50,d\n'
+        )
+        self.assertEqual((quality['rows'], quality['imported_rows']), (4, 2))
+        self.assertEqual(quality['skipped_rows'], {'missing_timestamp': 1, 'invalid_timestamp': 1})
+        self.assertEqual(quality['unknown_columns'], ['Comment'])
+        self.assertIn('battery_active_power', quality['missing_columns'])
+        power = quality['columns']['ge_active_power']
+        self.assertEqual((power['null_rate'], power['invalid'], power['max']), (0.5, 1, 1.5))
+        self.assertEqual(quality['columns']['mg_lv_msb_frequency']['out_of_range'], 1)
+
+    @override_settings(QUALITY_GAP_FACTOR=3.0)
+    def test_timestamp_sequence(self):
+        times = ['00:00:00', '00:00:20', '00:00:20', '00:00:10', '00:00:30', '00:00:40', '00:05:00']
+        quality = self.profile(
+            'Timestamp,GE_Active_Power\n' + ''.join(f'2024/03/01 {time},1.0\n' for time in times)
+        )
+        timestamps = quality['timestamps']['1']
+        self.assertEqual(timestamps['duplicates'], 1)
+        self.assertEqual(timestamps['monotonicity_breaks'], 1)
+        self.assertEqual(timestamps['median_interval_seconds'], 10.0)
+        self.assertEqual((timestamps['gaps'], timestamps['max_gap_seconds']), (1, 260.0))
+        self.assertEqual(timestamps['last'], '2024-03-01T00:05:00+00:00')
+
+
+class DataListTests(TestCase):
+    def test_aggregate_rows_have_no_id(self):
+        site = Site.objects.create(name='North', slug='north')
+        create_readings(site, 6, step_seconds=30)
+        compact_site_readings(site, START + timedelta(minutes=2))
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('viewer'))
+        response = client.get('/api/ingestion/data/', {'site': 'north'})
+        self.assertEqual(response.status_code, 200)
+        rows = response.data['results']
+        self.assertEqual([row['tier'] for row in rows], ['minute', 'minute', 'raw', 'raw'])
+        self.assertEqual([row['id'] for row in rows[:2]], [None, None])
+        self.assertEqual(
+            [row['id'] for row in rows[2:]], list(MicrogridData.objects.order_by('timestamp').values_list('pk', flat=True))
+        )
+
+
+@override_settings(HTTP_CONDITIONAL_ENABLED=True, HTTP_MICROCACHE_SECONDS=5)
+class ConditionalResponseTests(TestCase):
+    def setUp(self):
+        self.site = Site.objects.create(name='North', slug='north')
+        create_readings(self.site, 6)
+        bump_data_revisions(self.site, [START.date()])
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('viewer'))
+
+    def test_responses_carry_validators_and_cache_headers(self):
+        response = self.client.get('/api/ingestion/data/', {'site': 'north'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+        self.assertEqual(response['X-Accel-Expires'], '5')
+
+    def test_unchanged_data_gets_not_modified(self):
+        etag = self.client.get('/api/ingestion/data/', {'site': 'north'})['ETag']
+        response = self.client.get('/api/ingestion/data/', {'site': 'north'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_data_changes_the_etag(self):
+        etag = self.client.get('/api/ingestion/data/', {'site': 'north'})['ETag']
+        bump_data_revisions(self.site, [START.date()])
+        response = self.client.get('/api/ingestion/data/', {'site': 'north'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
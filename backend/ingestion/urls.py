@@ -1,16 +1,24 @@
 from django.urls import path
 from .views import (
     SimpleCSVUploadAPIView,
+    SiteListCreateView,
     MicrogridDataListView,
     MicrogridDataDetailView,
     BulkDeleteMicrogridDataView,
+    IngestionRunListView,
+    IngestionRunDetailView,
+    AnomalyEventListView,
     TaskStatusAPIView
 )
 
 urlpatterns = [
     path('upload/', SimpleCSVUploadAPIView.as_view(), name='csv-upload'),
+    path('sites/', SiteListCreateView.as_view(), name='site-list'),
     path('data/', MicrogridDataListView.as_view(), name='microgrid-data-list'),
     path('data/<int:pk>/', MicrogridDataDetailView.as_view(), name='microgrid-data-detail'),
     path('data/bulk-delete/', BulkDeleteMicrogridDataView.as_view(), name='microgrid-data-bulk-delete'),
+    path('runs/', IngestionRunListView.as_view(), name='ingestion-run-list'),
+    path('runs/<int:pk>/', IngestionRunDetailView.as_view(), name='ingestion-run-detail'),
+    path('anomalies/', AnomalyEventListView.as_view(), name='anomaly-list'),
     path('tasks/<str:task_id>/', TaskStatusAPIView.as_view(), name='task-status'),
 ]
\ No newline at end of file
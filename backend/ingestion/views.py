@@ -1,5 +1,8 @@
+import hashlib
 import os
 import pandas as pd
+from django.db.models import Value
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status, filters
@@ -7,10 +10,22 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from celery.result import AsyncResult
-from .serializers import CSVUploadSerializer, MicrogridDataSerializer
-from .models import MicrogridData
-from .tasks import process_csv_file
-from .filters import MicrogridDataFilter
+from microgrid_monitoring.db_router import reads_from_replica
+from profiling.middleware import profile_headers
+from . import hotwindow
+from .conditional import conditional_on_revision
+from .serializers import (
+    AnomalyEventSerializer,
+    CSVUploadSerializer,
+    IngestionRunSerializer,
+    MicrogridDataSerializer,
+    SiteSerializer,
+    TieredReadingSerializer,
+)
+from .models import AnomalyEvent, IngestionRun, MicrogridData, ReadingAggregate, Site
+from .tasks import process_csv_file, bulk_delete_microgrid_data
+from .services import MEASUREMENT_FIELDS, bump_data_revisions, find_identical_run, forget_ingested_range
+from .filters import AnomalyEventFilter, MicrogridDataFilter
 
 class SimpleCSVUploadAPIView(generics.CreateAPIView):
     serializer_class = CSVUploadSerializer
@@ -22,6 +37,7 @@ class SimpleCSVUploadAPIView(generics.CreateAPIView):
 
         csv_file = request.FILES["csv_file"]
         delimiter = serializer.validated_data.get("delimiter", ",")
+        site = serializer.validated_data.get("site")
 
         # Save file in shared volume
         upload_dir = "/app/csv_uploads"
@@ -29,36 +45,115 @@ class SimpleCSVUploadAPIView(generics.CreateAPIView):
         file_name = f"{csv_file.name}_{timezone.now().timestamp()}.csv"
         file_path = os.path.join(upload_dir, file_name)
 
+        # Hash while streaming to disk: no second pass over the file
+        digest = hashlib.sha256()
         with open(file_path, "wb+") as f:
             for chunk in csv_file.chunks():
+                digest.update(chunk)
                 f.write(chunk)
+        content_hash = digest.hexdigest()
+
+        # Same bytes already ingested for this site: answer with that run
+        force = serializer.validated_data["force"]
+        previous = None if force else find_identical_run(content_hash, site)
+        if previous is not None:
+            os.remove(file_path)
+            return Response(
+                {
+                    "message": "This file was already ingested.",
+                    "task_id": previous.task_id,
+                    "run_id": previous.pk,
+                    "status": "duplicate",
+                    "result": {
+                        "imported_rows": previous.imported_rows,
+                        "skipped_rows": previous.skipped_rows,
+                        "total_rows": previous.total_rows,
+                        "status": previous.status,
+                    },
+                },
+                status=status.HTTP_200_OK
+            )
+
+        run = IngestionRun.objects.create(
+            file_name=csv_file.name, site=site, created_by=request.user, content_hash=content_hash
+        )
 
         # Pass shared path to Celery
-        task = process_csv_file.delay(file_path, delimiter)
+        task = process_csv_file.apply_async(
+            (file_path, delimiter, site.pk if site else None, run.pk),
+            {"skip_ingested": not force},
+            headers=profile_headers(request),
+        )
+        IngestionRun.objects.filter(pk=run.pk).update(task_id=task.id)
 
         return Response(
             {
                 "message": "File is being processed in the background.",
                 "task_id": task.id,
+                "run_id": run.pk,
                 "status": "accepted"
             },
             status=status.HTTP_202_ACCEPTED
         )
 
 
+class SiteListCreateView(generics.ListCreateAPIView):
+    """
+    GET/POST endpoint listing and registering the monitored sites.
+    """
+    queryset = Site.objects.all()
+    serializer_class = SiteSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = None
+
+
+def data_list_range(view, request):
+    """Range and site selected by the timestamp and site filters of the data list."""
+    params = request.query_params
+    site = Site.objects.filter(slug=params['site']).first() if params.get('site') else None
+    exact = params.get('timestamp')
+    return params.get('timestamp__gte') or exact, params.get('timestamp__lte') or exact, site
+
+
 class MicrogridDataListView(generics.ListAPIView):
     """
     GET endpoint to retrieve imported microgrid data.
-    Supports pagination, filtering by timestamp, and ordering.
+    Supports pagination, filtering by site and timestamp, and ordering.
+    Periods compacted into per-minute aggregates (cold tier) are listed
+    alongside raw readings, with the same filters applied to both.
     """
     queryset = MicrogridData.objects.all()
-    serializer_class = MicrogridDataSerializer
+    serializer_class = TieredReadingSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_class = MicrogridDataFilter 
     ordering_fields = '__all__'
     ordering = ['timestamp']
 
+    @reads_from_replica
+    @conditional_on_revision(data_list_range)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        columns = ('id', 'site', 'timestamp', *MEASUREMENT_FIELDS)
+        raw = DjangoFilterBackend().filter_queryset(self.request, queryset, self)
+        cold = self.filterset_class(
+            self.request.query_params, queryset=ReadingAggregate.objects.all(), request=self.request
+        ).qs
+        rows = (
+            raw.order_by()
+            .annotate(sample_count=Value(1), tier=Value('raw'))
+            .values(*columns, 'sample_count', 'tier')
+            .union(
+                cold.order_by()
+                .annotate(tier=Value('minute'))
+                .values(*columns, 'sample_count', 'tier'),
+                all=True,
+            )
+        )
+        return filters.OrderingFilter().filter_queryset(self.request, rows, self)
+
 class MicrogridDataDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     GET, PUT, PATCH, DELETE endpoint for a single microgrid data record.
@@ -67,41 +162,85 @@ class MicrogridDataDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = MicrogridDataSerializer
     permission_classes = [IsAuthenticated]
 
+    def perform_update(self, serializer):
+        previous_site = serializer.instance.site_id
+        previous_timestamp = serializer.instance.timestamp
+        instance = serializer.save()
+        bump_data_revisions(previous_site, [timezone.localdate(previous_timestamp)])
+        bump_data_revisions(instance.site_id, [timezone.localdate(instance.timestamp)])
+        hotwindow.refresh_segments(previous_site, [pd.Timestamp(previous_timestamp).value])
+        hotwindow.refresh_segments(instance.site_id, [pd.Timestamp(instance.timestamp).value])
+
+    def perform_destroy(self, instance):
+        bump_data_revisions(instance.site_id, [timezone.localdate(instance.timestamp)])
+        instance.delete()
+        forget_ingested_range(instance.timestamp, instance.timestamp, instance.site_id)
+        hotwindow.refresh_segments(instance.site_id, [pd.Timestamp(instance.timestamp).value])
+
 
 class BulkDeleteMicrogridDataView(APIView):
     """
     DELETE endpoint to bulk delete microgrid data records based on filters.
+    The deletion runs in the background in paced batches; follow it with
+    the task status endpoint (PROGRESS state reports `deleted_count`/`total`).
     """
     permission_classes = [IsAuthenticated]
 
     def delete(self, request):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
-        
-        queryset = MicrogridData.objects.all()
-        
-        if start_date and end_date:
-            queryset = queryset.filter(timestamp__range=[start_date, end_date])
-        elif start_date:
-            queryset = queryset.filter(timestamp__gte=start_date)
-        elif end_date:
-            queryset = queryset.filter(timestamp__lte=end_date)
-        
-        # Count records to be deleted
-        count = queryset.count()
-        
-        # Delete the records
-        queryset.delete()
-        
+        site_slug = request.query_params.get('site')
+        site_id = get_object_or_404(Site, slug=site_slug).pk if site_slug else None
+
+        task = bulk_delete_microgrid_data.delay(start_date, end_date, site_id)
+
         return Response(
             {
-                "message": f"Successfully deleted {count} records.",
-                "deleted_count": count
+                "message": "Records are being deleted in the background.",
+                "task_id": task.id,
+                "status": "accepted"
             },
-            status=status.HTTP_200_OK
+            status=status.HTTP_202_ACCEPTED
         )
 
 
+class IngestionRunListView(generics.ListAPIView):
+    """
+    GET endpoint listing uploaded files, most recent first, with their row
+    counts, data quality profile and processing timings.
+    """
+    queryset = IngestionRun.objects.select_related('site')
+    serializer_class = IngestionRunSerializer
+    permission_classes = [IsAuthenticated]
+
+
+class IngestionRunDetailView(generics.RetrieveAPIView):
+    """
+    GET endpoint for the outcome and quality profile of one upload.
+    """
+    queryset = IngestionRun.objects.select_related('site')
+    serializer_class = IngestionRunSerializer
+    permission_classes = [IsAuthenticated]
+
+
+class AnomalyEventListView(generics.ListAPIView):
+    """
+    GET endpoint listing the anomalies detected during ingestion, most
+    recent first. Filter by site, signal, kind and start time.
+    """
+    queryset = AnomalyEvent.objects.select_related('site')
+    serializer_class = AnomalyEventSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_class = AnomalyEventFilter
+    ordering_fields = ['started_at', 'ended_at', 'sample_count']
+    ordering = ['-started_at']
+
+    @reads_from_replica
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
 class TaskStatusAPIView(APIView):
     permission_classes = [IsAuthenticated]
     
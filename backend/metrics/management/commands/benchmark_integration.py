@@ -0,0 +1,108 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from ingestion.services import READING_CHUNK_SIZE
+from metrics.integration import EnergyIntegrator
+from metrics.services import CONSUMPTION_FIELD, POWER_FIELDS
+
+DAY_SECONDS = 86400
+
+
+def synthetic_power(seconds, scale):
+    """Daily sine around 50 kW, with its exact integral for the error column."""
+    omega = 2 * np.pi / DAY_SECONDS
+    power = scale * (50 + 20 * np.sin(omega * seconds))
+    primitive = scale * (50 * seconds - 20 / omega * np.cos(omega * seconds))
+    return power, primitive
+
+
+def legacy_energy(timestamps, columns):
+    """Energy part of the original pandas calculate_kpis, kept as the baseline."""
+    df = pd.DataFrame({'timestamp': pd.to_datetime(timestamps), **columns})
+    for col in POWER_FIELDS:
+        df[col] = df[col].fillna(0)
+    df = df.sort_values('timestamp')
+    time_diffs = df['timestamp'].diff().dt.total_seconds().fillna(0) / 3600
+    if len(time_diffs) > 1:
+        time_diffs.iloc[0] = time_diffs.iloc[1:].mean()
+    else:
+        time_diffs.iloc[0] = 1
+    return {col: float((df[col] * time_diffs).sum()) for col in POWER_FIELDS}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the energy integration engine against the original pandas "
+        "implementation on synthetic readings with outages and missing values."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000_000)
+        parser.add_argument("--interval", type=float, default=1.0, help="Sampling interval in seconds.")
+        parser.add_argument("--outages", type=int, default=20, help="Number of 2 hour outages.")
+        parser.add_argument("--missing-rate", type=float, default=0.01, help="Share of NULL powers.")
+        parser.add_argument("--chunk-size", type=int, default=READING_CHUNK_SIZE)
+        parser.add_argument("--max-gap", type=int, default=900, help="max_gap_seconds of the engine.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        rng = np.random.default_rng(options["seed"])
+
+        # Jittered sampling, with outages inserted as jumps of the clock
+        steps = options["interval"] * (1 + rng.uniform(-0.1, 0.1, rows))
+        steps[0] = 0
+        for position in rng.choice(np.arange(1, rows), size=min(options["outages"], rows - 1), replace=False):
+            steps[position] += 2 * 3600
+        seconds = np.cumsum(steps)
+        timestamps = (pd.Timestamp("2025-01-01", tz="UTC").value + seconds * 1e9).astype(np.int64)
+        covered = np.diff(seconds) <= options["max_gap"]
+
+        columns, truth = {}, {}
+        for scale, col in enumerate(POWER_FIELDS, start=1):
+            power, primitive = synthetic_power(seconds, scale)
+            # Exact energy over the sampled segments (outages excluded)
+            truth[col] = float(np.diff(primitive)[covered].sum()) / 3600
+            power[rng.random(rows) < options["missing_rate"]] = np.nan
+            columns[col] = power
+
+        self.stdout.write(
+            f"{rows} rows, {options['outages']} outages, {options['missing_rate']:.1%} missing, "
+            f"chunks of {options['chunk_size']}; exact consumption {truth[CONSUMPTION_FIELD]:.2f} kWh"
+        )
+        started = time.perf_counter()
+        self._report("pandas (original)", legacy_energy(timestamps, columns), truth, started, rows)
+
+        variants = [
+            ("engine legacy", {"method": "legacy"}),
+            ("engine left", {"method": "left", "max_gap_seconds": options["max_gap"]}),
+            ("engine trapezoid", {"method": "trapezoid", "max_gap_seconds": options["max_gap"]}),
+            ("engine trapezoid, zero", {
+                "method": "trapezoid", "max_gap_seconds": options["max_gap"], "missing": "zero",
+            }),
+            ("engine trapezoid, 60 s grid", {
+                "method": "trapezoid", "max_gap_seconds": options["max_gap"], "resample_seconds": 60,
+            }),
+        ]
+        chunk_size = options["chunk_size"]
+        for label, settings in variants:
+            started = time.perf_counter()
+            integrator = EnergyIntegrator(POWER_FIELDS, **settings)
+            for offset in range(0, rows, chunk_size):
+                chunk = slice(offset, offset + chunk_size)
+                integrator.update(timestamps[chunk], {col: columns[col][chunk] for col in POWER_FIELDS})
+            energy = integrator.result()
+            gap_hours = integrator.gap_hours[CONSUMPTION_FIELD]
+            self._report(label, energy, truth, started, rows, gap_hours)
+
+    def _report(self, label, energy, truth, started, rows, gap_hours=0.0):
+        elapsed = time.perf_counter() - started
+        consumption = energy[CONSUMPTION_FIELD]
+        error = (consumption - truth[CONSUMPTION_FIELD]) / truth[CONSUMPTION_FIELD]
+        self.stdout.write(
+            f"{label:<30} {elapsed:8.3f} s {rows / elapsed / 1e6:7.2f} M rows/s "
+            f"{consumption:14.2f} kWh  error {error:+.4%}  gaps {gap_hours:.1f} h"
+        )
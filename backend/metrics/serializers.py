@@ -1,4 +1,8 @@
 from rest_framework import serializers
+from ingestion.models import Site
+from ingestion.services import AGGREGATE_EXTREMA_FIELDS, MEASUREMENT_FIELDS
+from .series import DEFAULT_SERIES_POINTS, MAX_SERIES_POINTS, SERIES_STATS, check_bucket_count
+from .services import KPI_GROUPINGS, period_ranges
 
 class KPISerializer(serializers.Serializer):
     consommation_totale = serializers.FloatField(allow_null=True)
@@ -12,4 +16,88 @@ class KPISerializer(serializers.Serializer):
     production_fc = serializers.FloatField(allow_null=True)
     ratio_renewables = serializers.FloatField(allow_null=True)
     voltage_moyen = serializers.FloatField(allow_null=True)
-    frequence_moyenne = serializers.FloatField(allow_null=True)
\ No newline at end of file
+    frequence_moyenne = serializers.FloatField(allow_null=True)
+
+MAX_BATCH_RANGES = 400
+
+
+class BatchKPIQuerySerializer(serializers.Serializer):
+    """
+    Paramètres de /api/metrics/batch/ : soit des périodes explicites
+    (`range` répété, intervalles ISO 8601 `début/fin`), soit un découpage
+    `group_by` (day, week, month) de [start_date, end_date].
+    """
+    range = serializers.ListField(child=serializers.CharField(), required=False)
+    group_by = serializers.ChoiceField(choices=KPI_GROUPINGS, required=False)
+    start_date = serializers.DateTimeField(required=False)
+    end_date = serializers.DateTimeField(required=False)
+    site = serializers.SlugRelatedField(slug_field='slug', queryset=Site.objects.all(), required=False)
+
+    def validate_range(self, value):
+        bounds = serializers.DateTimeField()
+        ranges = []
+        for item in value:
+            start, separator, end = item.partition('/')
+            if not separator:
+                raise serializers.ValidationError(f"Période invalide (attendu début/fin) : {item}")
+            start, end = bounds.to_internal_value(start), bounds.to_internal_value(end)
+            if start > end:
+                raise serializers.ValidationError(f"Début après la fin : {item}")
+            ranges.append((start, end))
+        return ranges
+
+    def validate(self, attrs):
+        if attrs.get('range') and attrs.get('group_by'):
+            raise serializers.ValidationError("range et group_by sont exclusifs")
+        if attrs.get('group_by'):
+            start, end = attrs.get('start_date'), attrs.get('end_date')
+            if not start or not end:
+                raise serializers.ValidationError("group_by demande start_date et end_date")
+            if start > end:
+                raise serializers.ValidationError("start_date doit précéder end_date")
+            attrs['range'] = period_ranges(start, end, attrs['group_by'])
+        if not attrs.get('range'):
+            raise serializers.ValidationError("Indiquer range ou group_by")
+        if len(attrs['range']) > MAX_BATCH_RANGES:
+            raise serializers.ValidationError(f"Au plus {MAX_BATCH_RANGES} périodes par requête")
+        return attrs
+
+
+class SeriesQuerySerializer(serializers.Serializer):
+    """Paramètres de /api/metrics/series/ (listes séparées par des virgules)."""
+    start_date = serializers.DateTimeField(required=False)
+    end_date = serializers.DateTimeField(required=False)
+    site = serializers.SlugRelatedField(slug_field='slug', queryset=Site.objects.all(), required=False)
+    signals = serializers.CharField(required=False, default=','.join(AGGREGATE_EXTREMA_FIELDS))
+    stats = serializers.CharField(required=False, default='mean')
+    points = serializers.IntegerField(required=False, min_value=1, max_value=MAX_SERIES_POINTS,
+                                      default=DEFAULT_SERIES_POINTS)
+    bucket_seconds = serializers.IntegerField(required=False, min_value=1)
+
+    def validate_signals(self, value):
+        return self._choices(value, MEASUREMENT_FIELDS)
+
+    def validate_stats(self, value):
+        return self._choices(value, SERIES_STATS)
+
+    def validate(self, attrs):
+        start, end, width = attrs.get('start_date'), attrs.get('end_date'), attrs.get('bucket_seconds')
+        if start and end and start > end:
+            raise serializers.ValidationError("start_date doit précéder end_date")
+        if start and end and width:
+            # Période ouverte : vérifié par bucketed_series une fois les bornes connues
+            try:
+                check_bucket_count(start, end, width)
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
+        return attrs
+
+    @staticmethod
+    def _choices(value, allowed):
+        items = [item.strip() for item in value.split(',') if item.strip()]
+        unknown = [item for item in items if item not in allowed]
+        if unknown or not items:
+            raise serializers.ValidationError(
+                f"Valeurs inconnues : {', '.join(unknown) or '(vide)'}. Possibles : {', '.join(allowed)}"
+            )
+        return tuple(dict.fromkeys(items))
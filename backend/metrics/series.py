@@ -0,0 +1,238 @@
+"""
+Séries agrégées par intervalle de temps pour les graphiques.
+
+La base groupe les mesures par intervalle (`date_bin` sous PostgreSQL) et ne
+renvoie qu'une ligne par intervalle : le coût réseau et mémoire dépend du
+nombre de points demandés, pas du nombre de lignes. Les minutes compactées
+(ReadingAggregate) sont lues à la place des mesures brutes avant le
+`compacted_until` de chaque site, ce qui rend les longues périodes rapides.
+Les périodes récentes couvertes par la fenêtre chaude (ingestion.hotwindow)
+sont agrégées en NumPy sur ses colonnes, sans requête.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db import NotSupportedError
+from django.db.models import Case, Count, DateTimeField, F, Func, Max, Min, Q, Sum, When
+from django.db.models.functions import Coalesce
+from ingestion import hotwindow
+from ingestion.models import Site
+from ingestion.services import (
+    AGGREGATE_EXTREMA_FIELDS,
+    aggregates_queryset,
+    readings_queryset,
+)
+
+SERIES_STATS = ('mean', 'min', 'max', 'count')
+DEFAULT_SERIES_POINTS = 500
+MAX_SERIES_POINTS = 5000
+
+# Largeurs d'intervalle possibles (secondes), de la seconde à la semaine
+BUCKET_WIDTHS = (
+    1, 2, 5, 10, 15, 30,
+    60, 120, 300, 600, 900, 1800,
+    3600, 7200, 10800, 21600, 43200,
+    86400, 2 * 86400, 7 * 86400,
+)
+
+
+class DateBin(Func):
+    """
+    Début de l'intervalle de `seconds` secondes contenant `expression`,
+    intervalles alignés sur l'epoch Unix (UTC).
+    """
+    output_field = DateTimeField()
+
+    def __init__(self, expression, seconds):
+        self.seconds = int(seconds)
+        super().__init__(expression)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return (
+            f"date_bin(%s::interval, {sql}, TIMESTAMPTZ '1970-01-01 00:00:00+00')",
+            [f'{self.seconds} seconds', *params],
+        )
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return (
+            f"datetime((CAST(strftime('%%s', {sql}) AS INTEGER) / %s) * %s, 'unixepoch')",
+            [*params, self.seconds, self.seconds],
+        )
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"DateBin is not implemented for {connection.vendor}.")
+
+
+def choose_bucket_seconds(start, end, points):
+    """Plus petite largeur de BUCKET_WIDTHS donnant au plus `points` intervalles."""
+    span = max((end - start).total_seconds(), 1)
+    for width in BUCKET_WIDTHS:
+        if span / width <= points:
+            return width
+    return BUCKET_WIDTHS[-1]
+
+
+def check_bucket_count(start, end, bucket_seconds):
+    """Refuse une largeur imposée donnant plus de MAX_SERIES_POINTS intervalles."""
+    if (end - start).total_seconds() / bucket_seconds > MAX_SERIES_POINTS:
+        raise ValueError(f"bucket_seconds trop petit : plus de {MAX_SERIES_POINTS} intervalles sur la période")
+
+
+def data_bounds(site=None):
+    """Premier et dernier timestamp présents, tous tiers confondus."""
+    bounds = [
+        readings_queryset(site=site).aggregate(first=Min('timestamp'), last=Max('timestamp')),
+        aggregates_queryset(site=site).aggregate(first=Min('timestamp'), last=Max('timestamp')),
+    ]
+    firsts = [b['first'] for b in bounds if b['first'] is not None]
+    lasts = [b['last'] for b in bounds if b['last'] is not None]
+    if not firsts:
+        return None, None
+    return min(firsts), max(lasts)
+
+
+def bucketed_series(start=None, end=None, site=None, signals=AGGREGATE_EXTREMA_FIELDS,
+                    stats=('mean',), points=DEFAULT_SERIES_POINTS, bucket_seconds=None):
+    """
+    Agrège `signals` par intervalle sur [start, end] (bornes des données si
+    omises), pour un site ou tous les sites. La largeur d'intervalle est
+    choisie pour environ `points` points, sauf si `bucket_seconds` est donné
+    (ValueError s'il donne plus de MAX_SERIES_POINTS intervalles une fois les
+    bornes connues).
+
+    Retourne `{'start', 'end', 'bucket_seconds', 'timestamps', 'series'}` où
+    `series[signal][stat]` est une liste alignée sur `timestamps` (début
+    d'intervalle) ; seuls les intervalles contenant des mesures sont présents.
+    """
+    if start is None or end is None:
+        first, last = data_bounds(site)
+        start = start or first
+        end = end or last
+    if start is None or end is None:
+        return {}
+    if bucket_seconds:
+        check_bucket_count(start, end, bucket_seconds)
+    else:
+        bucket_seconds = choose_bucket_seconds(start, end, points)
+
+    buckets = _window_buckets(start, end, site, signals, bucket_seconds)
+    if buckets is None:
+        buckets = _database_buckets(start, end, site, signals, bucket_seconds)
+
+    timestamps = sorted(buckets)
+    series = {
+        signal: {stat: [_bucket_stat(buckets[ts], signal, stat) for ts in timestamps] for stat in stats}
+        for signal in signals
+    }
+    return {
+        'start': start,
+        'end': end,
+        'bucket_seconds': bucket_seconds,
+        'timestamps': timestamps,
+        'series': series,
+    }
+
+
+def _window_buckets(start, end, site, signals, bucket_seconds):
+    """
+    Comme _database_buckets, calculé sur les colonnes de la fenêtre chaude ;
+    None quand elle ne couvre pas la période.
+    """
+    readings = hotwindow.window_readings(start, end, site, signals)
+    if readings is None:
+        return None
+    buckets = {}
+    width_ns = bucket_seconds * 10**9
+    for _, timestamps, columns in readings:
+        if not len(timestamps):
+            continue
+        # Les timestamps sont triés : un intervalle est une tranche contiguë
+        bins = timestamps // width_ns
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        aggregates = {}
+        for signal in signals:
+            values = columns[signal]
+            valid = ~np.isnan(values)
+            aggregates[f'sum_{signal}'] = np.add.reduceat(np.where(valid, values, 0.0), starts)
+            aggregates[f'count_{signal}'] = np.add.reduceat(valid.astype('int64'), starts)
+            aggregates[f'min_{signal}'] = np.fmin.reduceat(values, starts)
+            aggregates[f'max_{signal}'] = np.fmax.reduceat(values, starts)
+        for index, first in enumerate(starts):
+            bucket = datetime.fromtimestamp(int(bins[first]) * bucket_seconds, tz=dt_timezone.utc)
+            row = {name: values[index].item() for name, values in aggregates.items()}
+            _merge_bucket(buckets.setdefault(bucket, {}), row, signals)
+    return buckets
+
+
+def _database_buckets(start, end, site, signals, bucket_seconds):
+    """Intervalles lus en base : intervalle -> {signal: somme, effectif, min, max}."""
+    # Tier chaud (mesures brutes) et tier froid (minutes compactées)
+    hot = readings_queryset(start, end, site)
+    cold = aggregates_queryset(start, end, site)
+    if isinstance(site, Site):
+        if site.compacted_until is None:
+            cold = cold.none()
+        else:
+            cold = cold.filter(timestamp__lt=site.compacted_until)
+            hot = hot.filter(timestamp__gte=site.compacted_until)
+    else:
+        cold = cold.filter(site__compacted_until__gt=F('timestamp'))
+        hot = hot.filter(Q(site__compacted_until__isnull=True) | Q(timestamp__gte=F('site__compacted_until')))
+
+    buckets = {}
+    for rows in (_bucket_rows(hot, signals, bucket_seconds, weighted=False),
+                 _bucket_rows(cold, signals, bucket_seconds, weighted=True)):
+        for row in rows:
+            _merge_bucket(buckets.setdefault(row['bucket'], {}), row, signals)
+    return buckets
+
+
+def _bucket_rows(queryset, signals, bucket_seconds, weighted):
+    """
+    Une ligne par intervalle : somme, effectif, min et max de chaque signal.
+    Une minute compactée compte pour `sample_count` mesures ; ses extrema
+    sont ceux stockés pour les puissances, la moyenne de la minute sinon.
+    """
+    aggregates = {}
+    for signal in signals:
+        if weighted:
+            present = When(**{f'{signal}__isnull': False}, then=F('sample_count'))
+            aggregates[f'sum_{signal}'] = Sum(F(signal) * F('sample_count'))
+            aggregates[f'count_{signal}'] = Coalesce(Sum(Case(present, default=0)), 0)
+        else:
+            aggregates[f'sum_{signal}'] = Sum(signal)
+            aggregates[f'count_{signal}'] = Count(signal)
+        extrema = weighted and signal in AGGREGATE_EXTREMA_FIELDS
+        aggregates[f'min_{signal}'] = Min(f'{signal}_min' if extrema else signal)
+        aggregates[f'max_{signal}'] = Max(f'{signal}_max' if extrema else signal)
+    return (
+        queryset.order_by()
+        .annotate(bucket=DateBin('timestamp', bucket_seconds))
+        .values('bucket')
+        .annotate(**aggregates)
+        .iterator()
+    )
+
+
+def _merge_bucket(bucket, row, signals):
+    for signal in signals:
+        count = row[f'count_{signal}'] or 0
+        if not count:
+            continue
+        state = bucket.setdefault(signal, {'sum': 0.0, 'count': 0, 'min': None, 'max': None})
+        state['sum'] += row[f'sum_{signal}']
+        state['count'] += count
+        low, high = row[f'min_{signal}'], row[f'max_{signal}']
+        state['min'] = low if state['min'] is None else min(state['min'], low)
+        state['max'] = high if state['max'] is None else max(state['max'], high)
+
+
+def _bucket_stat(bucket, signal, stat):
+    state = bucket.get(signal)
+    if state is None:
+        return 0 if stat == 'count' else None
+    if stat == 'mean':
+        return state['sum'] / state['count']
+    return state[stat]
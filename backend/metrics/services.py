@@ -1,86 +1,465 @@
-import pandas as pd
+from datetime import datetime, timedelta
+
 import numpy as np
-from ingestion.models import MicrogridData
-
-def calculate_kpis(start_date=None, end_date=None):
-    qs = MicrogridData.objects.all()
-    if start_date and end_date:
-        qs = qs.filter(timestamp__range=[start_date, end_date])
-    
-    # Utiliser les noms de colonnes corrects (snake_case)
-    df = pd.DataFrame(list(qs.values(
-        'timestamp', 
-        'battery_active_power',
-        'pvpcs_active_power',
-        'fc_active_power',
-        'ge_active_power',
-        'mg_lv_msb_ac_voltage',
-        'mg_lv_msb_frequency'
-    )))
-    
-    if df.empty:
-        return {}
-    
-    # Gérer les valeurs nulles
-    power_columns = ['battery_active_power', 'pvpcs_active_power', 'fc_active_power', 'ge_active_power']
-    for col in power_columns:
-        df[col] = df[col].fillna(0)
-    
-    # Calcul Δt en heures
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df = df.sort_values('timestamp')  # S'assurer que les données sont triées par temps
-    
-    # Calculer le temps écoulé entre les mesures
-    time_diffs = df['timestamp'].diff().dt.total_seconds().fillna(0) / 3600  # en heures
-    
-    # Pour la première ligne, utiliser la moyenne des différences de temps suivantes
-    if len(time_diffs) > 1:
-        time_diffs.iloc[0] = time_diffs.iloc[1:].mean()
+import pandas as pd
+from django.utils import timezone
+from ingestion import hotwindow, rollups
+from ingestion.models import Site
+from ingestion.services import AGGREGATE_EXTREMA_FIELDS, iter_reading_chunks, iter_tiered_chunks
+
+from .integration import EnergyIntegrator
+
+# Colonnes nécessaires au calcul des KPIs
+KPI_FIELDS = (
+    'battery_active_power',
+    'pvpcs_active_power',
+    'fc_active_power',
+    'ge_active_power',
+    'mg_lv_msb_ac_voltage',
+    'mg_lv_msb_frequency',
+)
+PRODUCTION_FIELDS = ('battery_active_power', 'pvpcs_active_power', 'fc_active_power')
+CONSUMPTION_FIELD = 'ge_active_power'
+POWER_FIELDS = PRODUCTION_FIELDS + (CONSUMPTION_FIELD,)
+
+
+class KPIAccumulator:
+    """
+    Calcul incrémental des KPIs sur des blocs ordonnés par timestamp.
+
+    Chaque bloc est intégré puis oublié : la mémoire ne dépend pas de la
+    taille de la période. Le résultat est identique à un calcul sur la
+    période entière. L'intégration des énergies est déléguée à
+    EnergyIntegrator (`integration` surcharge KPI_INTEGRATION).
+    """
+    fields = KPI_FIELDS
+    # Colonnes supplémentaires lues dans le tier agrégé (ReadingAggregate)
+    aggregate_fields = ('sample_count', 'ge_active_power_max', 'production_max') + tuple(
+        f'{col}_energy' for col in POWER_FIELDS
+    )
+
+    def __init__(self, **integration):
+        self.count = 0
+        # Intégration des puissances : méthode et coupures selon KPI_INTEGRATION
+        self.integrator = EnergyIntegrator.from_settings(POWER_FIELDS, **integration)
+        self.pic_consommation = -np.inf
+        self.pic_production = -np.inf
+        self.voltage_sum = 0.0
+        self.voltage_count = 0
+        self.frequency_sum = 0.0
+        self.frequency_count = 0
+
+    def update(self, timestamps, columns):
+        if len(timestamps) == 0:
+            return
+
+        # Une ligne agrégée (une minute) porte déjà son énergie intégrée ; les
+        # cumuls (ingestion.rollups) portent en plus leurs mesures de bord
+        if 'sample_count' not in columns:
+            self.integrator.update(timestamps, columns)
+        elif f'{CONSUMPTION_FIELD}_first_at' in columns:
+            self.integrator.add_periods(columns)
+        else:
+            self.integrator.add_energy(
+                {col: np.nansum(columns[f'{col}_energy']) for col in POWER_FIELDS}
+            )
+
+        # Gérer les valeurs nulles ; les blocs agrégés portent leurs propres pics
+        if 'sample_count' in columns:
+            consumption = np.nan_to_num(columns['ge_active_power_max'], nan=0.0)
+            production = np.nan_to_num(columns['production_max'], nan=0.0)
+        else:
+            consumption = np.nan_to_num(columns[CONSUMPTION_FIELD], nan=0.0)
+            production = sum(np.nan_to_num(columns[col], nan=0.0) for col in PRODUCTION_FIELDS)
+        self.pic_consommation = max(self.pic_consommation, consumption.max())
+        self.pic_production = max(self.pic_production, production.max())
+
+        # Moyennes pondérées par le nombre de mesures de chaque ligne agrégée
+        weights = columns.get('sample_count')
+        voltage = columns['mg_lv_msb_ac_voltage']
+        frequency = columns['mg_lv_msb_frequency']
+        if weights is None:
+            self.voltage_sum += np.nansum(voltage)
+            self.voltage_count += int(np.count_nonzero(~np.isnan(voltage)))
+            self.frequency_sum += np.nansum(frequency)
+            self.frequency_count += int(np.count_nonzero(~np.isnan(frequency)))
+        else:
+            # Les cumuls (ingestion.rollups) portent l'effectif de chaque colonne
+            voltage_weights = columns.get('mg_lv_msb_ac_voltage_count', weights)
+            frequency_weights = columns.get('mg_lv_msb_frequency_count', weights)
+            self.voltage_sum += np.nansum(voltage * voltage_weights)
+            self.voltage_count += int(voltage_weights[~np.isnan(voltage)].sum())
+            self.frequency_sum += np.nansum(frequency * frequency_weights)
+            self.frequency_count += int(frequency_weights[~np.isnan(frequency)].sum())
+
+        self.count += len(timestamps)
+
+    def energies(self):
+        """Énergie intégrée (kWh) par colonne de puissance."""
+        return self.integrator.result()
+
+    def result(self):
+        return self.combine([self])
+
+    @staticmethod
+    def combine(accumulators):
+        """
+        KPIs de plusieurs séries indépendantes (un accumulateur par site) :
+        énergies additionnées, pics = plus haut pic d'un site, moyennes de
+        tension / fréquence sur l'ensemble des mesures.
+        """
+        accumulators = [acc for acc in accumulators if acc.count]
+        if not accumulators:
+            return {}
+
+        energy = dict.fromkeys(POWER_FIELDS, 0.0)
+        for acc in accumulators:
+            for col, value in acc.energies().items():
+                energy[col] += value
+        pic_consommation = max(acc.pic_consommation for acc in accumulators)
+        pic_production = max(acc.pic_production for acc in accumulators)
+        voltage_sum = sum(acc.voltage_sum for acc in accumulators)
+        voltage_count = sum(acc.voltage_count for acc in accumulators)
+        frequency_sum = sum(acc.frequency_sum for acc in accumulators)
+        frequency_count = sum(acc.frequency_count for acc in accumulators)
+
+        # Consommation totale (en kWh)
+        consommation_totale = energy[CONSUMPTION_FIELD]
+
+        # Production par source (en kWh)
+        production_battery = energy['battery_active_power']
+        production_pv = energy['pvpcs_active_power']
+        production_fc = energy['fc_active_power']
+        production_totale = production_battery + production_pv + production_fc
+
+        # Taux autonomie et pertes
+        autonomie = (production_totale / consommation_totale * 100) if consommation_totale else 0
+        pertes = max(0, consommation_totale - production_totale)
+
+        # Ratio renouvelables
+        ratio_renewables = ((production_battery + production_pv) / production_totale * 100) if production_totale else 0
+
+        # Moyennes voltage / fréquence (en ignorant les valeurs nulles)
+        voltage_moyen = voltage_sum / voltage_count if voltage_count else 0
+        frequence_moyenne = frequency_sum / frequency_count if frequency_count else 0
+
+        return {
+            'consommation_totale': round(consommation_totale, 2),
+            'production_totale': round(production_totale, 2),
+            'production_battery': round(production_battery, 2),
+            'production_pv': round(production_pv, 2),
+            'production_fc': round(production_fc, 2),
+            'autonomie': round(autonomie, 2),
+            'pertes': round(pertes, 2),
+            'pic_consommation': round(float(pic_consommation), 2),
+            'pic_production': round(float(pic_production), 2),
+            'ratio_renewables': round(ratio_renewables, 2),
+            'voltage_moyen': round(float(voltage_moyen), 2),
+            'frequence_moyenne': round(float(frequence_moyenne), 2)
+        }
+
+
+class SeriesAccumulator:
+    """
+    Série sous-échantillonnée à budget de points fixe.
+
+    La période [start, end] est découpée en `points` intervalles égaux ;
+    chaque intervalle garde count / somme / min / max par colonne. Le coût
+    du rendu ne dépend donc que de `points`, pas du nombre de lignes.
+    """
+
+    def __init__(self, start, end, fields, points=500):
+        self.fields = tuple(fields)
+        self.aggregate_fields = ('sample_count',) + tuple(
+            f'{col}_{stat}' for col in self.fields if col in AGGREGATE_EXTREMA_FIELDS
+            for stat in ('min', 'max')
+        )
+        self.points = points
+        self.start_ns = pd.Timestamp(start).value
+        self.span_ns = max(pd.Timestamp(end).value - self.start_ns, 1)
+        self.count = {col: np.zeros(points) for col in self.fields}
+        self.sum = {col: np.zeros(points) for col in self.fields}
+        self.min = {col: np.full(points, np.nan) for col in self.fields}
+        self.max = {col: np.full(points, np.nan) for col in self.fields}
+
+    def update(self, timestamps, columns):
+        if len(timestamps) == 0:
+            return
+        position = (timestamps - self.start_ns) / self.span_ns * self.points
+        buckets = np.floor(position).astype(np.int64).clip(0, self.points - 1)
+        # Les blocs sont triés : chaque intervalle est une plage contiguë
+        starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        touched = buckets[starts]
+        # Lignes agrégées : moyenne pondérée par le nombre de mesures
+        weights = columns.get('sample_count', np.ones(len(timestamps)))
+        for col in self.fields:
+            values = columns[col]
+            valid = ~np.isnan(values)
+            self.count[col] += np.bincount(buckets[valid], weights=weights[valid], minlength=self.points)
+            self.sum[col] += np.bincount(
+                buckets[valid], weights=values[valid] * weights[valid], minlength=self.points
+            )
+            low = columns.get(f'{col}_min', values)
+            high = columns.get(f'{col}_max', values)
+            self.min[col][touched] = np.fmin(self.min[col][touched], np.fmin.reduceat(low, starts))
+            self.max[col][touched] = np.fmax(self.max[col][touched], np.fmax.reduceat(high, starts))
+
+    def result(self):
+        """
+        Retourne les centres d'intervalle (datetime64) et, par colonne,
+        les séries mean / min / max (NaN pour les intervalles vides).
+        """
+        width = self.span_ns / self.points
+        centers = self.start_ns + (np.arange(self.points) + 0.5) * width
+        series = {'timestamps': centers.astype('int64').astype('datetime64[ns]')}
+        for col in self.fields:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = self.sum[col] / self.count[col]
+            series[col] = {'mean': mean, 'min': self.min[col], 'max': self.max[col]}
+        return series
+
+
+class RangeKPIAccumulator:
+    """
+    KPIs de plusieurs périodes [start, end] (bornes incluses, éventuellement
+    chevauchantes, None pour une période ouverte) alimentés par une seule lecture ordonnée : chaque bloc est
+    découpé par recherche dichotomique et chaque tranche va au KPIAccumulator
+    de sa période. Le résultat de chaque période est celui d'un calcul isolé.
+    """
+    fields = KPIAccumulator.fields
+    aggregate_fields = KPIAccumulator.aggregate_fields
+
+    def __init__(self, ranges, **integration):
+        self.bounds = [
+            (
+                pd.Timestamp(start).value if start is not None else np.iinfo(np.int64).min,
+                pd.Timestamp(end).value if end is not None else np.iinfo(np.int64).max,
+            )
+            for start, end in ranges
+        ]
+        self.accumulators = [KPIAccumulator(**integration) for _ in ranges]
+
+    def update(self, timestamps, columns):
+        if len(timestamps) == 0:
+            return
+        for (start_ns, end_ns), accumulator in zip(self.bounds, self.accumulators):
+            if end_ns < timestamps[0] or start_ns > timestamps[-1]:
+                continue
+            left = np.searchsorted(timestamps, start_ns, side='left')
+            right = np.searchsorted(timestamps, end_ns, side='right')
+            if left < right:
+                accumulator.update(
+                    timestamps[left:right], {col: values[left:right] for col, values in columns.items()}
+                )
+
+
+def _scan_fields(accumulators):
+    fields, aggregate_fields = [], []
+    for accumulator in accumulators:
+        fields.extend(col for col in accumulator.fields if col not in fields)
+        aggregate_fields.extend(
+            col for col in getattr(accumulator, 'aggregate_fields', ()) if col not in aggregate_fields
+        )
+    return fields, aggregate_fields
+
+
+def scan_readings(queryset, *accumulators):
+    """
+    Alimente plusieurs accumulateurs avec une seule lecture ordonnée de
+    `queryset` (union des colonnes demandées).
+    """
+    fields, _ = _scan_fields(accumulators)
+    for timestamps, columns in iter_reading_chunks(queryset, fields):
+        for accumulator in accumulators:
+            accumulator.update(timestamps, columns)
+    return accumulators
+
+
+def scan_tiered_readings(start, end, site, *accumulators):
+    """
+    Comme scan_readings, pour un site sur [start, end], en lisant à la suite
+    le tier agrégé (minutes compactées) puis les mesures brutes.
+    """
+    fields, aggregate_fields = _scan_fields(accumulators)
+    for timestamps, columns in iter_tiered_chunks(start, end, site, fields, aggregate_fields):
+        for accumulator in accumulators:
+            accumulator.update(timestamps, columns)
+    return accumulators
+
+
+def scan_site_kpis(start=None, end=None, site=None, *accumulators):
+    """
+    Calcule les KPIs sur [start, end] pour un site, ou (site=None) pour tous
+    les sites : chaque site est alors lu et intégré séparément, le Δt
+    n'ayant de sens qu'entre deux mesures d'un même site, puis les résultats
+    sont combinés. Les deux tiers (agrégé et brut) sont lus. Les
+    `accumulators` supplémentaires (séries des graphiques) reçoivent toutes
+    les lectures.
+    """
+    sites = [site] if site is not None else Site.objects.all()
+    kpi_accumulators = []
+    for current in sites:
+        kpi_accumulator = KPIAccumulator()
+        scan_tiered_readings(start, end, current, kpi_accumulator, *accumulators)
+        kpi_accumulators.append(kpi_accumulator)
+    return KPIAccumulator.combine(kpi_accumulators)
+
+
+def calculate_kpis(start_date=None, end_date=None, site=None):
+    """
+    Calcule les KPIs sur [start_date, end_date] en lecture en flux, pour un
+    site ou (site=None) pour l'ensemble des sites. Une période couverte par
+    la fenêtre chaude est calculée sur ses colonnes, sans lecture en base ;
+    sinon les heures et jours complets sont lus dans les cumuls
+    (rollup_kpis) quand ils sont disponibles.
+    """
+    kpis = window_kpis(start_date, end_date, site)
+    if kpis is None:
+        kpis = rollup_kpis(start_date, end_date, site)
+    if kpis is None:
+        kpis = scan_site_kpis(start_date, end_date, site)
+    return kpis
+
+
+def window_kpis(start_date=None, end_date=None, site=None):
+    """
+    KPIs de calculate_kpis à partir de la fenêtre chaude (ingestion.hotwindow),
+    None quand elle ne couvre pas la période.
+    """
+    readings = hotwindow.window_readings(start_date, end_date, site, KPIAccumulator.fields)
+    if readings is None:
+        return None
+    accumulators = []
+    for _, timestamps, columns in readings:
+        accumulator = KPIAccumulator()
+        accumulator.update(timestamps, columns)
+        accumulators.append(accumulator)
+    return KPIAccumulator.combine(accumulators)
+
+
+def _bound(value):
+    """Borne de période (datetime ou chaîne ISO) en datetime avec fuseau, None si absente."""
+    if value is None or value == '':
+        return None
+    value = pd.Timestamp(value)
+    if value.tzinfo is None:
+        value = value.tz_localize(timezone.get_current_timezone())
+    return value.to_pydatetime()
+
+
+def rollup_kpis(start_date=None, end_date=None, site=None):
+    """
+    KPIs de calculate_kpis dont les heures et jours complets de [start_date,
+    end_date] sont lus dans les cumuls à jour (ingestion.rollups) ; le reste
+    (bords de période, jours modifiés depuis le dernier rafraîchissement)
+    est lu dans les tables. None quand les cumuls ne sont pas disponibles.
+    """
+    if not rollups.available():
+        return None
+    sites = [site] if site is not None else Site.objects.all()
+    ranges = [(_bound(start_date), _bound(end_date))]
+    return KPIAccumulator.combine([_rollup_accumulators(ranges, current)[0] for current in sites])
+
+
+def _rollup_accumulators(ranges, site):
+    """
+    KPIAccumulator de chaque période de `ranges` pour un site : les cumuls
+    de l'union des périodes sont lus en une fois, puis chaque partie non
+    couverte est lue dans les tables, dans l'ordre, de sorte que
+    l'intégration raccorde cumuls et mesures comme une lecture unique.
+    """
+    starts = [start for start, _ in ranges]
+    ends = [end for _, end in ranges]
+    start = None if None in starts else min(starts)
+    end = None if None in ends else max(ends)
+    # Heures entièrement comprises dans l'union ; une période ne découpe aucun cumul lu
+    first_hour = pd.Timestamp(start).ceil('h').to_pydatetime() if start is not None else None
+    last_hour = (pd.Timestamp(end) + pd.Timedelta(microseconds=1)).floor('h').to_pydatetime() if end is not None else None
+    boundaries = [value for value in starts if value is not None] + [
+        value + timedelta(microseconds=1) for value in ends if value is not None
+    ]
+
+    router = RangeKPIAccumulator(ranges)
+    covered = []
+    if first_hour is None or last_hour is None or first_hour < last_hour:
+        covered, timestamps, columns = rollups.rollup_readings(site, first_hour, last_hour, boundaries)
+    # Parties non couvertes, bornes incluses comme dans les tables
+    gap_start = start
+    for covered_start, covered_end in covered:
+        left = np.searchsorted(timestamps, pd.Timestamp(covered_start).value, side='left')
+        right = np.searchsorted(timestamps, pd.Timestamp(covered_end).value, side='left')
+        if gap_start is None or gap_start < covered_start:
+            scan_tiered_readings(gap_start, covered_start - timedelta(microseconds=1), site, router)
+        router.update(timestamps[left:right], {col: values[left:right] for col, values in columns.items()})
+        gap_start = covered_end
+    if gap_start is None or end is None or gap_start <= end:
+        scan_tiered_readings(gap_start, end, site, router)
+    return router.accumulators
+
+
+# Découpages proposés par /api/metrics/batch/
+KPI_GROUPINGS = ('day', 'week', 'month')
+
+
+def period_ranges(start, end, group_by):
+    """
+    Découpe [start, end] en jours, semaines (du lundi) ou mois calendaires
+    du fuseau courant. Retourne des couples (début, fin) bornes incluses,
+    la première et la dernière période étant rognées sur [start, end].
+    """
+    local_start = timezone.localtime(start).replace(tzinfo=None)
+    current = datetime.combine(local_start.date(), datetime.min.time())
+    if group_by == 'week':
+        current -= timedelta(days=current.weekday())
+    elif group_by == 'month':
+        current = current.replace(day=1)
+
+    ranges = []
+    while True:
+        if group_by == 'day':
+            following = current + timedelta(days=1)
+        elif group_by == 'week':
+            following = current + timedelta(weeks=1)
+        else:
+            following = (current + timedelta(days=32)).replace(day=1)
+        period_start = timezone.make_aware(current)
+        if period_start > end:
+            break
+        period_end = timezone.make_aware(following) - timedelta(microseconds=1)
+        ranges.append((max(period_start, start), min(period_end, end)))
+        current = following
+    return ranges
+
+
+def calculate_kpis_batch(ranges, site=None):
+    """
+    KPIs de chaque période de `ranges` (couples (début, fin) bornes incluses)
+    pour un site ou tous les sites, en une seule lecture ordonnée par site
+    couvrant l'union des périodes (dans la fenêtre chaude si elle la couvre,
+    dans les cumuls horaires et journaliers quand ils sont disponibles).
+    Retourne une liste alignée sur `ranges` ({} pour une période sans
+    données).
+    """
+    if not ranges:
+        return []
+    start = min(start for start, _ in ranges)
+    end = max(end for _, end in ranges)
+    per_site = []
+    readings = hotwindow.window_readings(start, end, site, RangeKPIAccumulator.fields)
+    if readings is not None:
+        for _, timestamps, columns in readings:
+            router = RangeKPIAccumulator(ranges)
+            router.update(timestamps, columns)
+            per_site.append(router.accumulators)
+    elif rollups.available():
+        for current in ([site] if site is not None else Site.objects.all()):
+            per_site.append(_rollup_accumulators(ranges, current))
     else:
-        time_diffs.iloc[0] = 1  # Valeur par défaut si une seule ligne
-    
-    df['dt'] = time_diffs
-
-    # Consommation totale (en kWh)
-    consommation_totale = (df['ge_active_power'] * df['dt']).sum()
-
-    # Production par source (en kWh)
-    df['Production_Battery'] = df['battery_active_power'] * df['dt']
-    df['Production_PV'] = df['pvpcs_active_power'] * df['dt']
-    df['Production_FC'] = df['fc_active_power'] * df['dt']
-    df['Production_totale'] = df['Production_Battery'] + df['Production_PV'] + df['Production_FC']
-
-    production_totale = df['Production_totale'].sum()
-    production_battery = df['Production_Battery'].sum()
-    production_pv = df['Production_PV'].sum()
-    production_fc = df['Production_FC'].sum()
-
-    # Taux autonomie et pertes
-    autonomie = (production_totale / consommation_totale * 100) if consommation_totale else 0
-    pertes = max(0, consommation_totale - production_totale)
-
-    # Pics instantanés
-    pic_consommation = df['ge_active_power'].max()
-    pic_production = (df['battery_active_power'] + df['pvpcs_active_power'] + df['fc_active_power']).max()
-
-    # Ratio renouvelables
-    ratio_renewables = ((production_battery + production_pv) / production_totale * 100) if production_totale else 0
-
-    # Moyennes voltage / fréquence (en ignorant les valeurs nulles)
-    voltage_moyen = df['mg_lv_msb_ac_voltage'].mean() if not df['mg_lv_msb_ac_voltage'].isnull().all() else 0
-    frequence_moyenne = df['mg_lv_msb_frequency'].mean() if not df['mg_lv_msb_frequency'].isnull().all() else 0
-
-    return {
-        'consommation_totale': round(consommation_totale, 2),
-        'production_totale': round(production_totale, 2),
-        'production_battery': round(production_battery, 2),
-        'production_pv': round(production_pv, 2),
-        'production_fc': round(production_fc, 2),
-        'autonomie': round(autonomie, 2),
-        'pertes': round(pertes, 2),
-        'pic_consommation': round(pic_consommation, 2),
-        'pic_production': round(pic_production, 2),
-        'ratio_renewables': round(ratio_renewables, 2),
-        'voltage_moyen': round(voltage_moyen, 2),
-        'frequence_moyenne': round(frequence_moyenne, 2)
-    }
\ No newline at end of file
+        for current in ([site] if site is not None else Site.objects.all()):
+            router = RangeKPIAccumulator(ranges)
+            scan_tiered_readings(start, end, current, router)
+            per_site.append(router.accumulators)
+    return [
+        KPIAccumulator.combine([accumulators[index] for accumulators in per_site])
+        for index in range(len(ranges))
+    ]
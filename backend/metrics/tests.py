@@ -1,3 +1,250 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from ingestion import rollups
+from ingestion.models import MicrogridData, Site
+from ingestion.services import bump_data_revisions
+from .integration import NS_PER_SECOND, EnergyIntegrator
+from .services import calculate_kpis, calculate_kpis_batch, scan_site_kpis
+from .serializers import SeriesQuerySerializer
+
+
+def seconds(*values):
+    return np.array(values, dtype='int64') * NS_PER_SECOND
+
+
+class EnergyIntegratorTests(SimpleTestCase):
+    def integrate(self, timestamps, values, chunks=1, **options):
+        integrator = EnergyIntegrator(('p',), **options)
+        for ts, vs in zip(np.array_split(timestamps, chunks), np.array_split(values, chunks)):
+            integrator.update(ts, {'p': vs})
+        return integrator.result()['p'], integrator.gap_hours['p']
+
+    def test_trapezoid(self):
+        energy, _ = self.integrate(seconds(0, 1800, 3600), np.array([0.0, 10.0, 10.0]))
+        self.assertAlmostEqual(energy, 2.5 + 5.0)
+
+    def test_left(self):
+        energy, _ = self.integrate(seconds(0, 1800, 3600), np.array([0.0, 10.0, 10.0]), method='left')
+        self.assertAlmostEqual(energy, 5.0)
+
+    def test_gaps_longer_than_max_gap_are_not_integrated(self):
+        energy, gap = self.integrate(seconds(0, 600, 3600), np.array([6.0, 6.0, 6.0]), max_gap_seconds=900)
+        self.assertAlmostEqual(energy, 1.0)
+        self.assertAlmostEqual(gap, 3000 / 3600)
+
+    def test_missing_values(self):
+        timestamps, values = seconds(0, 1800, 3600), np.array([4.0, np.nan, 4.0])
+        skipped, _ = self.integrate(timestamps, values, missing='skip')
+        zeroed, _ = self.integrate(timestamps, values, missing='zero')
+        self.assertAlmostEqual(skipped, 4.0)
+        self.assertAlmostEqual(zeroed, 2.0)
+
+    def test_result_does_not_depend_on_chunking(self):
+        rng = np.random.default_rng(0)
+        timestamps = np.cumsum(rng.integers(1, 1200, 500)) * NS_PER_SECOND
+        values = rng.normal(50, 10, 500)
+        values[rng.integers(0, 500, 50)] = np.nan
+        for options in ({}, {'method': 'left'}, {'method': 'legacy'}, {'resample_seconds': 300}):
+            whole, _ = self.integrate(timestamps, values, **options)
+            split, _ = self.integrate(timestamps, values, chunks=7, **options)
+            self.assertAlmostEqual(whole, split, msg=options)
+
+    def test_add_energy_breaks_the_series(self):
+        integrator = EnergyIntegrator(('p',))
+        integrator.update(seconds(0, 60), {'p': np.array([60.0, 60.0])})
+        integrator.add_energy({'p': 1.0})
+        integrator.update(seconds(120, 180), {'p': np.array([60.0, 60.0])})
+        self.assertAlmostEqual(integrator.result()['p'], 3.0)
+
+    def test_periods_join_like_the_readings(self):
+        # Readings every 5 min, an hour missing: three hourly periods
+        timestamps = np.concatenate((seconds(*range(0, 7200, 300)), seconds(*range(10800, 14400, 300))))
+        values = np.arange(len(timestamps), dtype='float64')
+        values[3] = np.nan
+        expected, expected_gap = self.integrate(timestamps, values, max_gap_seconds=900)
+
+        columns = {name: [] for name in ('p_energy', 'p_first_at', 'p_first', 'p_last_at', 'p_last')}
+        for hour in range(4):
+            inside = (timestamps // (3600 * NS_PER_SECOND) == hour) & ~np.isnan(values)
+            ts, vs = timestamps[inside], values[inside]
+            period = EnergyIntegrator(('p',), max_gap_seconds=900)
+            period.update(ts, {'p': vs})
+            columns['p_energy'].append(period.result()['p'])
+            columns['p_first_at'].append(ts[0] if len(ts) else 0)
+            columns['p_first'].append(vs[0] if len(ts) else np.nan)
+            columns['p_last_at'].append(ts[-1] if len(ts) else 0)
+            columns['p_last'].append(vs[-1] if len(ts) else np.nan)
+        columns = {name: np.array(value) for name, value in columns.items()}
+
+        integrator = EnergyIntegrator(('p',), max_gap_seconds=900)
+        integrator.update(seconds(-300), {'p': np.array([1.0])})
+        integrator.add_periods(columns)
+        integrator.update(seconds(14400), {'p': np.array([1.0])})
+        joined = expected + (1.0 + values[0]) / 2 * 300 / 3600 + (values[-1] + 1.0) / 2 * 300 / 3600
+        self.assertAlmostEqual(integrator.result()['p'], joined)
+        self.assertAlmostEqual(integrator.gap_hours['p'], expected_gap)
+
+    def test_periods_need_a_joinable_method(self):
+        with self.assertRaises(ValueError):
+            EnergyIntegrator(('p',), method='legacy').add_periods({})
+
+
+class SeriesQuerySerializerTests(SimpleTestCase):
+    def validate(self, **params):
+        serializer = SeriesQuerySerializer(data=params)
+        return serializer.is_valid(), serializer
+
+    def test_defaults(self):
+        valid, serializer = self.validate()
+        self.assertTrue(valid, serializer.errors)
+        self.assertEqual(serializer.validated_data['stats'], ('mean',))
+        self.assertEqual(serializer.validated_data['points'], 500)
+
+    def test_lists_are_checked_and_deduplicated(self):
+        valid, serializer = self.validate(signals='ge_active_power, ge_active_power', stats='min,max')
+        self.assertTrue(valid, serializer.errors)
+        self.assertEqual(serializer.validated_data['signals'], ('ge_active_power',))
+        self.assertFalse(self.validate(signals='voltage')[0])
+        self.assertFalse(self.validate(stats='median')[0])
+
+    def test_period_must_be_ordered(self):
+        self.assertFalse(self.validate(start_date='2024-01-02T00:00Z', end_date='2024-01-01T00:00Z')[0])
+
+    def test_bucket_count_is_capped(self):
+        period = {'start_date': '2024-01-01T00:00Z', 'end_date': '2024-01-02T00:00Z'}
+        self.assertTrue(self.validate(bucket_seconds=60, **period)[0])
+        self.assertFalse(self.validate(bucket_seconds=1, **period)[0])
+
+
+class SeriesViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('viewer'))
+        site = Site.objects.create(name='North', slug='north')
+        start = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        MicrogridData.objects.bulk_create([
+            MicrogridData(site=site, timestamp=start + timedelta(hours=i), ge_active_power=10.0)
+            for i in range(48)
+        ])
+
+    def test_bucket_count_is_capped_on_open_periods(self):
+        response = self.client.get('/api/metrics/series/', {'bucket_seconds': 1})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/metrics/series/', {'bucket_seconds': 3600})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['timestamps']), 48)
+
+
+class BatchMetricsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('viewer'))
+        self.start = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        for slug, scale in (('north', 1.0), ('south', 2.0)):
+            site = Site.objects.create(name=slug, slug=slug)
+            MicrogridData.objects.bulk_create([
+                MicrogridData(
+                    site=site, timestamp=self.start + timedelta(minutes=10 * i),
+                    ge_active_power=scale * (10.0 + i % 7), pvpcs_active_power=scale * (i % 5),
+                )
+                for i in range(3 * 144)
+            ])
+
+    def assertKPIsEqual(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for key, value in first.items():
+            self.assertAlmostEqual(value, second[key], places=6, msg=key)
+
+    def test_batch_matches_one_computation_per_range(self):
+        day = timedelta(days=1)
+        ranges = [
+            (self.start, self.start + day),
+            (self.start + day / 2, self.start + 2 * day),  # overlapping
+            (self.start + 2 * day, self.start + 3 * day),
+            (self.start + 10 * day, self.start + 11 * day),  # no data
+        ]
+        for site in (None, Site.objects.get(slug='south')):
+            batch = calculate_kpis_batch(ranges, site)
+            for (start, end), kpis in zip(ranges, batch):
+                self.assertKPIsEqual(kpis, calculate_kpis(start, end, site))
+        self.assertEqual(batch[-1], {})
+
+    def test_group_by_day(self):
+        response = self.client.get('/api/metrics/batch/', {
+            'group_by': 'day', 'start_date': '2024-03-01T00:00Z', 'end_date': '2024-03-03T23:59Z', 'site': 'north',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertTrue(all(result['kpis'] for result in response.data['results']))
+
+    def test_ranges_are_validated(self):
+        for params in (
+            {},
+            {'range': '2024-03-01T00:00Z'},
+            {'range': '2024-03-02T00:00Z/2024-03-01T00:00Z'},
+            {'range': '2024-03-01T00:00Z/2024-03-02T00:00Z', 'group_by': 'day'},
+            {'group_by': 'day', 'start_date': '2024-03-01T00:00Z'},
+        ):
+            self.assertEqual(self.client.get('/api/metrics/batch/', params).status_code, 400, params)
+
+
+@skipUnless(connection.vendor == 'postgresql', "KPI rollup views need PostgreSQL")
+@override_settings(KPI_ROLLUPS_ENABLED=True, TIME_ZONE='UTC')
+class RollupKPITests(TestCase):
+    def setUp(self):
+        self.start = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        self.site = Site.objects.create(name='North', slug='north')
+        self.add_readings(self.start, 3 * 24 * 12)
+        rollups.refresh_views()
+
+    def add_readings(self, start, count):
+        readings = []
+        for i in range(count):
+            # A two-hour hole on the second day, longer than the integration max gap
+            if 24 * 12 + 60 <= i < 24 * 12 + 84:
+                continue
+            readings.append(MicrogridData(
+                site=self.site, timestamp=start + timedelta(minutes=5 * i),
+                ge_active_power=10.0 + i % 7, pvpcs_active_power=float(i % 5) if i % 11 else None,
+                mg_lv_msb_frequency=50.0,
+            ))
+        MicrogridData.objects.bulk_create(readings)
+        bump_data_revisions(self.site, {reading.timestamp.date() for reading in readings})
+
+    def assertKPIsEqual(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for key, value in first.items():
+            self.assertAlmostEqual(value, second[key], places=6, msg=key)
+
+    def test_rollups_match_a_scan_of_the_readings(self):
+        self.assertTrue(rollups.available())
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {rollups.DAILY_VIEW} WHERE site_id = %s", [self.site.pk])
+            self.assertEqual(cursor.fetchone()[0], 3)
+        ranges = [
+            (self.start, self.start + timedelta(days=3)),
+            (self.start + timedelta(hours=5, minutes=17), self.start + timedelta(days=2, hours=3, minutes=2)),
+            (None, None),
+        ]
+        for start, end in ranges:
+            self.assertKPIsEqual(calculate_kpis(start, end, self.site), scan_site_kpis(start, end, self.site))
+        batch = calculate_kpis_batch(ranges[:2], self.site)
+        for (start, end), kpis in zip(ranges, batch):
+            self.assertKPIsEqual(kpis, scan_site_kpis(start, end, self.site))
+
+    def test_days_changed_since_the_refresh_are_read_from_the_tables(self):
+        self.add_readings(self.start + timedelta(days=1, minutes=2), 12)
+        self.assertKPIsEqual(calculate_kpis(None, None, self.site), scan_site_kpis(None, None, self.site))
+
+    def test_other_integration_settings_do_not_use_the_views(self):
+        with self.settings(KPI_INTEGRATION=dict(settings.KPI_INTEGRATION, method='left')):
+            self.assertFalse(rollups.available())
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views import MetricsView
+from .views import BatchMetricsView, MetricsView, SeriesView
 
 urlpatterns = [
     path('', MetricsView.as_view(), name='metrics'),
+    path('series/', SeriesView.as_view(), name='metrics-series'),
+    path('batch/', BatchMetricsView.as_view(), name='metrics-batch'),
 ]
\ No newline at end of file
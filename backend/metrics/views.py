@@ -1,17 +1,46 @@
 from rest_framework.generics import RetrieveAPIView
 from rest_framework.response import Response
 from rest_framework import status
-from .services import calculate_kpis
-from .serializers import KPISerializer
+from django.shortcuts import get_object_or_404
+from ingestion.conditional import conditional_on_revision, revision_day
+from microgrid_monitoring.db_router import reads_from_replica
+from ingestion.models import Site
+from .series import bucketed_series
+from .services import calculate_kpis, calculate_kpis_batch
+from .serializers import BatchKPIQuerySerializer, KPISerializer, SeriesQuerySerializer
+
+def query_range(view, request):
+    """Période et site des paramètres `start_date`, `end_date` et `site`."""
+    params = request.query_params
+    site = Site.objects.filter(slug=params['site']).first() if params.get('site') else None
+    return params.get('start_date'), params.get('end_date'), site
+
+
+def batch_range(view, request):
+    """Union des périodes `range` (début/fin), sinon comme query_range."""
+    items = request.query_params.getlist('range')
+    _, _, site = query_range(view, request)
+    if not items:
+        return query_range(view, request)
+    starts = [revision_day(item.partition('/')[0]) for item in items]
+    ends = [revision_day(item.partition('/')[2]) for item in items]
+    start = None if None in starts else min(starts)
+    end = None if None in ends else max(ends)
+    return start, end, site
+
 
 class MetricsView(RetrieveAPIView):
     serializer_class = KPISerializer
 
+    @reads_from_replica
+    @conditional_on_revision(query_range)
     def get(self, request, *args, **kwargs):
+        site_slug = request.query_params.get('site')
+        site = get_object_or_404(Site, slug=site_slug) if site_slug else None
         try:
             start_date = request.query_params.get('start_date')
             end_date = request.query_params.get('end_date')
-            kpis = calculate_kpis(start_date, end_date)
+            kpis = calculate_kpis(start_date, end_date, site)
             
             if not kpis:
                 return Response(
@@ -27,4 +56,60 @@ class MetricsView(RetrieveAPIView):
                 {"error": f"Une erreur s'est produite: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-        
\ No newline at end of file
+
+
+class SeriesView(RetrieveAPIView):
+    """
+    Séries agrégées par intervalle pour les graphiques : `signals` et
+    `stats` (mean, min, max, count) au choix, largeur d'intervalle choisie
+    pour environ `points` points ou imposée par `bucket_seconds`.
+    """
+    serializer_class = SeriesQuerySerializer
+
+    @reads_from_replica
+    @conditional_on_revision(query_range)
+    def get(self, request, *args, **kwargs):
+        query = self.get_serializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        try:
+            series = bucketed_series(
+                params.get('start_date'),
+                params.get('end_date'),
+                params.get('site'),
+                signals=params['signals'],
+                stats=params['stats'],
+                points=params['points'],
+                bucket_seconds=params.get('bucket_seconds'),
+            )
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        if not series or not series['timestamps']:
+            return Response(
+                {"error": "Aucune donnée disponible pour la période sélectionnée"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(series)
+
+
+class BatchMetricsView(RetrieveAPIView):
+    """
+    KPIs de plusieurs périodes en une requête (aujourd'hui / hier, chaque
+    jour de la semaine, chaque mois de l'année...) : une seule lecture
+    ordonnée des mesures couvre toutes les périodes.
+    """
+    serializer_class = BatchKPIQuerySerializer
+
+    @reads_from_replica
+    @conditional_on_revision(batch_range)
+    def get(self, request, *args, **kwargs):
+        query = self.get_serializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        ranges = query.validated_data['range']
+        kpis = calculate_kpis_batch(ranges, query.validated_data.get('site'))
+        return Response({
+            'results': [
+                {'start': start, 'end': end, 'kpis': KPISerializer(values).data if values else None}
+                for (start, end), values in zip(ranges, kpis)
+            ]
+        })
@@ -7,3 +7,6 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "microgrid_monitoring.settings")
 app = Celery("microgrid_monitoring")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+# Task duration metrics and the worker metrics server (signal handlers)
+from . import instrumentation  # noqa: E402,F401
@@ -0,0 +1,112 @@
+# microgrid_monitoring/db_router.py
+"""
+Optional read replica for the heavy analytical reads.
+
+With a `replica` database configured (POSTGRES_REPLICA_HOST), the code paths
+wrapped in replica_reads() (KPI and series endpoints, data and anomaly
+lists, report generation) read the measurement models (REPLICA_MODELS) from
+the replica, as long as its replication lag is at most
+REPLICA_MAX_LAG_SECONDS. Everything else (ingestion, edits, compaction, the
+bookkeeping of runs and reports) keeps reading and writing the primary, so
+it never sees stale rows.
+
+The lag is measured at most every REPLICA_LAG_CHECK_SECONDS per process; an
+unreachable or lagging replica sends the reads back to the primary. A
+replica that is not in recovery (e.g. a second connection to the same
+database, to simulate one locally) has no lag.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+REPLICA_ALIAS = "replica"
+# app_label.model_name of the models served from the replica
+REPLICA_MODELS = {
+    "ingestion.microgriddata",
+    "ingestion.readingaggregate",
+    "ingestion.datarevision",
+    "ingestion.site",
+    "ingestion.anomalyevent",
+}
+
+_replica_reads = ContextVar("replica_reads", default=False)
+_lag_state = {"checked": None, "lag": None}
+
+
+@contextmanager
+def replica_reads():
+    """Let the reads of REPLICA_MODELS in this block go to the replica."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reads_from_replica(function):
+    """Decorator form of replica_reads, for view handlers and tasks."""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with replica_reads():
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def replica_lag_seconds():
+    """
+    Replication lag of the replica in seconds (0 when it is not in
+    recovery or has replayed everything it received), None when it
+    cannot be reached.
+    """
+    connection = connections[REPLICA_ALIAS]
+    if connection.vendor != "postgresql":
+        return 0.0
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT CASE"
+                " WHEN NOT pg_is_in_recovery() THEN 0"
+                " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+                " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+                " END"
+            )
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        connection.close()
+        return None
+
+
+def replica_usable():
+    """True when a replica is configured and its lag is within REPLICA_MAX_LAG_SECONDS."""
+    if REPLICA_ALIAS not in settings.DATABASES:
+        return False
+    now = time.monotonic()
+    checked = _lag_state["checked"]
+    if checked is None or now - checked >= settings.REPLICA_LAG_CHECK_SECONDS:
+        _lag_state["lag"] = replica_lag_seconds()
+        _lag_state["checked"] = now
+    lag = _lag_state["lag"]
+    return lag is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS
+
+
+class ReplicaRouter:
+    """Database router: replica reads inside replica_reads(), the primary otherwise."""
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get() or model._meta.label_lower not in REPLICA_MODELS:
+            return None
+        return REPLICA_ALIAS if replica_usable() else "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both sides
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
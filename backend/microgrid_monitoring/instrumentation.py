@@ -0,0 +1,217 @@
+# microgrid_monitoring/instrumentation.py
+"""
+Prometheus instrumentation of the API, the ingestion pipeline and the
+report pipeline.
+
+- MetricsMiddleware times every view and counts its SQL queries (through a
+  database execute wrapper, no DEBUG needed).
+- Celery signals time every task; the ingestion and report tasks also
+  report their per-phase timings (observe_phases).
+- metrics_view renders everything in the Prometheus text format, with the
+  depth of the Celery queues read from the broker at scrape time.
+
+The scrape endpoint is closed (403) until PROMETHEUS_METRICS_TOKEN is set.
+
+Under gunicorn (several processes) set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by the workers; gunicorn.conf.py marks the files of a dead
+worker (child_exit hook) so its gauges do not linger. Celery workers expose
+their own metrics on WORKER_METRICS_PORT.
+"""
+import hmac
+import os
+import time
+from contextlib import ExitStack
+
+from celery.signals import task_postrun, task_prerun, worker_ready
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+TASK_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+REQUEST_DURATION = Histogram(
+    "microgrid_http_request_duration_seconds",
+    "Time spent serving a request, per view.",
+    ["view", "method", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "microgrid_http_request_db_queries",
+    "SQL queries executed while serving a request, per view.",
+    ["view"],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_DURATION = Histogram(
+    "microgrid_http_request_db_duration_seconds",
+    "Time spent in SQL while serving a request, per view.",
+    ["view"],
+)
+TASK_DURATION = Histogram(
+    "microgrid_celery_task_duration_seconds",
+    "Run time of a Celery task.",
+    ["task", "state"],
+    buckets=TASK_BUCKETS,
+)
+PHASE_DURATION = Histogram(
+    "microgrid_pipeline_phase_duration_seconds",
+    "Duration of one phase of the ingestion or report pipeline.",
+    ["pipeline", "phase"],
+    buckets=TASK_BUCKETS,
+)
+INGESTED_ROWS = Counter(
+    "microgrid_ingestion_rows",
+    "CSV rows processed by the ingestion pipeline.",
+    ["outcome"],
+)
+
+
+class QueryCounter:
+    """Database execute wrapper counting the queries and their total time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Latency and SQL usage of every request, labelled by view name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PROMETHEUS_ENABLED:
+            return self.get_response(request)
+
+        queries = QueryCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        view = view_label(request)
+        REQUEST_DURATION.labels(view, request.method, response.status_code).observe(duration)
+        REQUEST_DB_QUERIES.labels(view).observe(queries.count)
+        REQUEST_DB_DURATION.labels(view).observe(queries.duration)
+        return response
+
+
+def view_label(request):
+    """Route name of the request, bounded to the declared URL patterns."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unmatched>"
+    return match.view_name or match._func_path
+
+
+def observe_phases(pipeline, timings):
+    """Feed the per-phase `timings` dict of a pipeline run to PHASE_DURATION."""
+    if not settings.PROMETHEUS_ENABLED:
+        return
+    for phase, seconds in timings.items():
+        if isinstance(seconds, float):
+            PHASE_DURATION.labels(pipeline, phase).observe(seconds)
+
+
+def count_ingested_rows(imported, skipped):
+    if not settings.PROMETHEUS_ENABLED:
+        return
+    INGESTED_ROWS.labels("imported").inc(imported)
+    INGESTED_ROWS.labels("skipped").inc(skipped)
+
+
+# -- Celery --------------------------------------------------------------
+
+_task_started = {}
+
+
+@task_prerun.connect
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is None or not settings.PROMETHEUS_ENABLED:
+        return
+    TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+
+@worker_ready.connect
+def _serve_worker_metrics(**kwargs):
+    if settings.PROMETHEUS_ENABLED and settings.WORKER_METRICS_PORT:
+        start_http_server(settings.WORKER_METRICS_PORT, registry=build_registry())
+
+
+class QueueDepthCollector:
+    """Messages waiting in each Celery queue, asked to the broker at scrape time."""
+
+    def collect(self):
+        from .celery import app
+
+        gauge = GaugeMetricFamily(
+            "microgrid_celery_queue_depth", "Messages waiting in a Celery queue.", labels=["queue"]
+        )
+        try:
+            with app.connection_for_read() as conn:
+                conn.ensure_connection(max_retries=1)
+                channel = conn.default_channel
+                for queue in settings.PROMETHEUS_QUEUES:
+                    try:
+                        _, depth, _ = channel.queue_declare(queue=queue, passive=True)
+                    except Exception:
+                        # Not declared yet: nothing was ever sent to it
+                        depth = 0
+                    gauge.add_metric([queue], depth)
+        except Exception:
+            return
+        yield gauge
+
+
+QUEUE_REGISTRY = CollectorRegistry()
+QUEUE_REGISTRY.register(QueueDepthCollector())
+
+
+def build_registry():
+    """
+    Registry to expose: the aggregated multiprocess files when
+    PROMETHEUS_MULTIPROC_DIR is set, the process registry otherwise.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint, for the bearer of PROMETHEUS_METRICS_TOKEN only."""
+    token = settings.PROMETHEUS_METRICS_TOKEN
+    if not settings.PROMETHEUS_ENABLED or not token:
+        return HttpResponseForbidden()
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    output = generate_latest(build_registry()) + generate_latest(QUEUE_REGISTRY)
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
@@ -14,7 +14,9 @@ from pathlib import Path
 
 import os
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,9 +51,12 @@ INSTALLED_APPS = [
     'ingestion',
     'metrics',
     'reports',
+    'profiling',
 ]
 
 MIDDLEWARE = [
+    "microgrid_monitoring.instrumentation.MetricsMiddleware",
+    "profiling.middleware.ProfilingMiddleware",
     'corsheaders.middleware.CorsMiddleware', 
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -98,6 +103,22 @@ DATABASES = {
     }
 }
 
+# Optional read replica for KPIs, lists and reports (see
+# microgrid_monitoring.db_router). Pointing it at the primary itself
+# simulates one locally.
+if config('POSTGRES_REPLICA_HOST', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': config('POSTGRES_REPLICA_HOST'),
+        'PORT': config('POSTGRES_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['microgrid_monitoring.db_router.ReplicaRouter']
+# Replication lag above which replica reads go back to the primary
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=30, cast=float)
+# Seconds between two lag measurements, per process
+REPLICA_LAG_CHECK_SECONDS = config('REPLICA_LAG_CHECK_SECONDS', default=5, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -200,6 +221,35 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_RESULT_BACKEND = config('CELERY_RESULT_BACKEND')
 CELERY_TIMEZONE = config('CELERY_TIMEZONE')
+CELERY_BEAT_SCHEDULE = {
+    # Enqueue report configurations whose cron `schedule` is due
+    'dispatch-scheduled-reports': {
+        'task': 'reports.tasks.dispatch_scheduled_reports',
+        'schedule': 60.0,
+        'options': {'queue': 'reports'},
+    },
+    'cleanup-old-reports': {
+        'task': 'reports.tasks.cleanup_old_reports',
+        'schedule': crontab(hour=3, minute=0),
+        'options': {'queue': 'reports'},
+    },
+    'compact-old-readings': {
+        'task': 'ingestion.tasks.compact_old_readings',
+        'schedule': crontab(hour=2, minute=0),
+        'options': {'queue': 'ingestion'},
+    },
+    'prune-raw-data': {
+        'task': 'ingestion.tasks.prune_raw_data',
+        'schedule': crontab(hour=2, minute=30),
+        'options': {'queue': 'ingestion'},
+    },
+    # Build missing hot windows, drop the segments that slid out
+    'maintain-hot-window': {
+        'task': 'ingestion.tasks.maintain_hot_window',
+        'schedule': 60.0,
+        'options': {'queue': 'ingestion'},
+    },
+}
 DJANGO_SETTINGS_MODULE = config('DJANGO_SETTINGS_MODULE')
 
 # Documentation settings
@@ -235,4 +285,126 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
-]
\ No newline at end of file
+]
+
+# Ingestion maintenance
+# Bulk deletes and retention pruning remove rows in paced batches
+BULK_DELETE_BATCH_SIZE = config('BULK_DELETE_BATCH_SIZE', default=5000, cast=int)
+BULK_DELETE_PAUSE_SECONDS = config('BULK_DELETE_PAUSE_SECONDS', default=0.05, cast=float)
+# Raw readings older than this many days are pruned nightly (0 = keep forever)
+RAW_DATA_RETENTION_DAYS = config('RAW_DATA_RETENTION_DAYS', default=0, cast=int)
+# Raw readings older than this many days are compacted nightly into per-minute
+# aggregates, read transparently by KPIs and the data list (0 = no tiering)
+RAW_DATA_TIER_AFTER_DAYS = config('RAW_DATA_TIER_AFTER_DAYS', default=0, cast=int)
+# Pruning before compaction would delete readings the cold tier never received
+if 0 < RAW_DATA_RETENTION_DAYS < RAW_DATA_TIER_AFTER_DAYS:
+    raise ImproperlyConfigured(
+        "RAW_DATA_RETENTION_DAYS must not be shorter than RAW_DATA_TIER_AFTER_DAYS"
+    )
+# CSV reader of the ingestion pipeline: 'arrow' (multithreaded pyarrow) or
+# 'pandas' (see ingestion.parsers)
+INGESTION_CSV_ENGINE = config('INGESTION_CSV_ENGINE', default='arrow')
+# Anomaly detection run on every ingestion batch (see ingestion.detection).
+# Per signal: fixed `min` / `max` limits and/or a `zscore` limit against an
+# exponentially weighted baseline (`alpha`, active after `warmup` readings)
+ANOMALY_DETECTION_ENABLED = config('ANOMALY_DETECTION_ENABLED', default=True, cast=bool)
+ANOMALY_RULES = {
+    'mg_lv_msb_frequency': {'min': 49.5, 'max': 50.5, 'zscore': 6.0, 'alpha': 0.01, 'warmup': 60},
+    'mg_lv_msb_ac_voltage': {'zscore': 6.0, 'alpha': 0.01, 'warmup': 60},
+    'inlet_temperature_of_chilled_water': {'zscore': 6.0, 'alpha': 0.01, 'warmup': 60},
+}
+# A run opening a batch extends the event left open by the previous batch
+# when it starts at most this many seconds after the event ended
+ANOMALY_EVENT_MAX_GAP_SECONDS = config('ANOMALY_EVENT_MAX_GAP_SECONDS', default=300, cast=int)
+# Data quality profile of each ingested file (see ingestion.quality):
+# plausible range per signal, and the multiple of the median sampling
+# interval above which a step between two readings counts as a gap
+QUALITY_RANGES = {
+    'mg_lv_msb_frequency': (45.0, 65.0),
+    'island_mode_mccb_frequency': (45.0, 65.0),
+    'mg_lv_msb_ac_voltage': (0.0, 1000.0),
+    'receiving_point_ac_voltage': (0.0, 1000.0),
+    'island_mode_mccb_ac_voltage': (0.0, 1000.0),
+    'inlet_temperature_of_chilled_water': (-10.0, 60.0),
+    'outlet_temperature': (-10.0, 60.0),
+}
+QUALITY_GAP_FACTOR = config('QUALITY_GAP_FACTOR', default=3.0, cast=float)
+
+# KPIs
+# Energy integration of the power columns (see metrics.integration):
+# `method` 'trapezoid', 'left' (left Riemann sum) or 'legacy' (historical
+# behaviour, no gap handling); intervals longer than `max_gap_seconds` are
+# outages and are not integrated (0 = never); `missing` 'skip' or 'zero' for
+# NULL powers; `resample_seconds` averages onto a fixed grid first (0 = off)
+KPI_INTEGRATION = {
+    'method': config('KPI_INTEGRATION_METHOD', default='trapezoid'),
+    'max_gap_seconds': config('KPI_INTEGRATION_MAX_GAP_SECONDS', default=900, cast=int),
+    'missing': config('KPI_INTEGRATION_MISSING', default='skip'),
+    'resample_seconds': config('KPI_INTEGRATION_RESAMPLE_SECONDS', default=0, cast=int),
+}
+
+# Hourly / daily KPI rollups in PostgreSQL materialized views (see
+# ingestion.rollups), refreshed once changes have been quiet for
+# KPI_ROLLUP_REFRESH_DELAY_SECONDS (at most KPI_ROLLUP_REFRESH_MAX_WAIT_SECONDS
+# after the first). Their energies follow the default KPI_INTEGRATION and their
+# days are UTC days: with other settings KPIs are read from the tables
+KPI_ROLLUPS_ENABLED = config('KPI_ROLLUPS_ENABLED', default=True, cast=bool)
+KPI_ROLLUP_REFRESH_DELAY_SECONDS = config('KPI_ROLLUP_REFRESH_DELAY_SECONDS', default=30, cast=int)
+KPI_ROLLUP_REFRESH_MAX_WAIT_SECONDS = config('KPI_ROLLUP_REFRESH_MAX_WAIT_SECONDS', default=300, cast=int)
+
+# HTTP caching of the KPI, series and data list responses (see
+# ingestion.conditional): ETag / Last-Modified from the data revision of the
+# requested range, 304 when unchanged
+HTTP_CONDITIONAL_ENABLED = config('HTTP_CONDITIONAL_ENABLED', default=True, cast=bool)
+# Seconds nginx may serve a response from its micro-cache (0 = no caching)
+HTTP_MICROCACHE_SECONDS = config('HTTP_MICROCACHE_SECONDS', default=5, cast=int)
+
+# Hot window (see ingestion.hotwindow): the raw readings of the last
+# HOT_WINDOW_HOURS hours kept as columns in Redis, serving recent KPIs and
+# series without the database. Empty URL = disabled; defaults to the Celery
+# broker when it is Redis
+HOT_WINDOW_REDIS_URL = config(
+    'HOT_WINDOW_REDIS_URL',
+    default=CELERY_BROKER_URL if CELERY_BROKER_URL.startswith(('redis://', 'rediss://')) else '',
+)
+HOT_WINDOW_HOURS = config('HOT_WINDOW_HOURS', default=24, cast=int)
+HOT_WINDOW_SEGMENT_SECONDS = config('HOT_WINDOW_SEGMENT_SECONDS', default=600, cast=int)
+
+# Monitoring (see microgrid_monitoring.instrumentation)
+# Prometheus metrics of requests, tasks and pipeline phases, scraped at
+# /api/prometheus/ with the Bearer PROMETHEUS_METRICS_TOKEN; the endpoint
+# answers 403 while the token is empty. With several gunicorn workers,
+# PROMETHEUS_MULTIPROC_DIR holds their shared files (gunicorn.conf.py
+# cleans up after dead workers)
+PROMETHEUS_ENABLED = config('PROMETHEUS_ENABLED', default=True, cast=bool)
+PROMETHEUS_METRICS_TOKEN = config('PROMETHEUS_METRICS_TOKEN', default='')
+# Celery queues whose depth is reported
+PROMETHEUS_QUEUES = ('ingestion', 'reports')
+# Port on which each Celery worker serves its own metrics (0 = off)
+WORKER_METRICS_PORT = config('WORKER_METRICS_PORT', default=0, cast=int)
+
+# Profiling (see profiling.profiler)
+# Requests sent with `X-Profile: <PROFILING_TOKEN>` are profiled (SQL,
+# sampled stacks, memory peak) and their report stored under the request ID
+# (empty token = disabled)
+PROFILING_TOKEN = config('PROFILING_TOKEN', default='')
+PROFILING_SAMPLE_INTERVAL = config('PROFILING_SAMPLE_INTERVAL', default=0.005, cast=float)
+# SQL statements kept per report (counts and totals cover all of them)
+PROFILING_MAX_STATEMENTS = config('PROFILING_MAX_STATEMENTS', default=500, cast=int)
+PROFILING_TRACE_MEMORY = config('PROFILING_TRACE_MEMORY', default=True, cast=bool)
+
+# Reports
+# Reuse the file of an identical report (same parameters and unchanged data)
+REPORT_CACHE_ENABLED = config('REPORT_CACHE_ENABLED', default=True, cast=bool)
+# Number of points per report chart series, whatever the raw row count
+REPORT_CHART_POINTS = config('REPORT_CHART_POINTS', default=500, cast=int)
+# 'stream': Django streams report files (with HTTP Range support)
+# 'x-accel': nginx serves them from REPORT_ACCEL_REDIRECT_PREFIX (internal location)
+REPORT_DOWNLOAD_MODE = config('REPORT_DOWNLOAD_MODE', default='stream')
+REPORT_ACCEL_REDIRECT_PREFIX = config('REPORT_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+# Storage maintenance (reports.tasks.cleanup_old_reports, daily)
+REPORT_RETENTION_DAYS = config('REPORT_RETENTION_DAYS', default=30, cast=int)
+REPORT_CLEANUP_BATCH_SIZE = config('REPORT_CLEANUP_BATCH_SIZE', default=500, cast=int)
+REPORT_ORPHAN_GRACE_SECONDS = config('REPORT_ORPHAN_GRACE_SECONDS', default=3600, cast=int)
+# Total size allowed for report files, least recently used evicted first (0 = unlimited)
+REPORTS_MAX_TOTAL_BYTES = config('REPORTS_MAX_TOTAL_BYTES', default=5 * 1024**3, cast=int)
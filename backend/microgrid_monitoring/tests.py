@@ -0,0 +1,62 @@
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+
+from ingestion.models import MicrogridData
+from . import db_router
+from .db_router import ReplicaRouter, replica_reads
+
+
+class PrometheusEndpointTests(SimpleTestCase):
+    url = '/api/prometheus/'
+
+    @override_settings(PROMETHEUS_METRICS_TOKEN='')
+    def test_closed_without_a_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    @override_settings(PROMETHEUS_METRICS_TOKEN='secret')
+    def test_bearer_of_the_token_only(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'microgrid_http_request_duration_seconds', response.content)
+
+
+@override_settings(REPLICA_MAX_LAG_SECONDS=30, REPLICA_LAG_CHECK_SECONDS=60)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        db_router._lag_state.update(checked=None, lag=None)
+        self.router = ReplicaRouter()
+        databases = mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']})
+        databases.start()
+        self.addCleanup(databases.stop)
+
+    def route(self, model=MicrogridData, lag=0.0):
+        with mock.patch.object(db_router, 'replica_lag_seconds', return_value=lag) as measure:
+            with replica_reads():
+                alias = self.router.db_for_read(model)
+        return alias, measure.call_count
+
+    def test_measurement_reads_go_to_a_fresh_replica(self):
+        self.assertEqual(self.route(), ('replica', 1))
+        self.assertIsNone(self.router.db_for_read(MicrogridData))
+        self.assertEqual(self.router.db_for_write(MicrogridData), 'default')
+
+    def test_other_models_stay_on_the_primary(self):
+        self.assertEqual(self.route(User), (None, 0))
+
+    def test_lagging_or_unreachable_replica_falls_back_to_the_primary(self):
+        self.assertEqual(self.route(lag=120.0)[0], 'default')
+        db_router._lag_state.update(checked=None)
+        self.assertEqual(self.route(lag=None)[0], 'default')
+
+    def test_lag_is_measured_once_per_check_interval(self):
+        self.route()
+        self.assertEqual(self.route(lag=120.0), ('replica', 0))
+
+    def test_no_replica_configured(self):
+        del settings.DATABASES['replica']
+        self.assertEqual(self.route(), ('default', 0))
@@ -0,0 +1,45 @@
+from django.conf import settings
+
+from .profiler import Profiler, new_request_id
+
+
+class ProfilingMiddleware:
+    """
+    Profile the requests carrying `X-Profile: <PROFILING_TOKEN>`. The report
+    is stored under the request ID (the incoming `X-Request-ID` when given)
+    returned in the `X-Request-ID` response header, and readable at
+    /api/profiles/<request_id>/. Other requests only pay a header lookup.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = settings.PROFILING_TOKEN
+        if not token or request.headers.get("X-Profile") != token:
+            request.profile_id = None
+            return self.get_response(request)
+
+        request.profile_id = new_request_id(request.headers.get("X-Request-ID"))
+        with Profiler() as profiler:
+            response = self.get_response(request)
+        user = getattr(request, "user", None)
+        profiler.save(
+            request.profile_id,
+            "request",
+            request.get_full_path(),
+            method=request.method,
+            status_code=response.status_code,
+            user=user if user is not None and user.is_authenticated else None,
+        )
+        response["X-Request-ID"] = request.profile_id
+        return response
+
+
+def profile_headers(request, suffix="task"):
+    """
+    Celery message headers profiling the task a profiled request enqueues,
+    under `<request_id>.<suffix>`; empty for other requests.
+    """
+    profile_id = getattr(request, "profile_id", None)
+    return {"profile": f"{profile_id}.{suffix}"} if profile_id else {}
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('request_id', models.CharField(max_length=64, unique=True)),
+                ('kind', models.CharField(choices=[('request', 'Request'), ('task', 'Task')], max_length=10)),
+                ('name', models.CharField(max_length=500)),
+                ('method', models.CharField(blank=True, max_length=10)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('duration', models.FloatField()),
+                ('sql_count', models.PositiveIntegerField(default=0)),
+                ('sql_duration', models.FloatField(default=0)),
+                ('memory_peak_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('report', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.conf import settings
+from django.db import models
+
+
+class ProfileReport(models.Model):
+    """
+    Profile of one opted-in request or Celery task (see profiling.profiler):
+    SQL statements with timings, sampled Python stacks grouped by layer
+    (SQL, ORM, pandas, NumPy, application) and the memory peak.
+    """
+    KIND_CHOICES = [
+        ('request', 'Request'),
+        ('task', 'Task'),
+    ]
+
+    request_id = models.CharField(max_length=64, unique=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    # Request path with its query string, or task name
+    name = models.CharField(max_length=500)
+    method = models.CharField(max_length=10, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    duration = models.FloatField()
+    sql_count = models.PositiveIntegerField(default=0)
+    sql_duration = models.FloatField(default=0)
+    memory_peak_bytes = models.BigIntegerField(null=True, blank=True)
+    report = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.request_id} {self.name} ({self.duration:.3f}s)"
@@ -0,0 +1,270 @@
+"""
+Opt-in profiling of a single request or Celery task.
+
+A Profiler records, while active:
+
+- every SQL statement with its duration, through a database execute wrapper;
+- a sampled Python profile: a background thread snapshots the profiled
+  thread's stack every PROFILING_SAMPLE_INTERVAL seconds, and each sample is
+  attributed to a layer (sql, orm, pandas, numpy, app, other) from its
+  innermost recognised frame;
+- the memory peak, through tracemalloc (NumPy and pandas buffers included).
+  tracemalloc has a single, process-wide peak: only one profile at a time
+  traces memory, overlapping profiles of the same process skip it and say so
+  in their report (`memory.skipped`).
+
+Nothing runs for unprofiled requests or tasks. Requests opt in with the
+`X-Profile` header (see profiling.middleware); tasks with a `profile` message
+header, e.g. `task.apply_async(args, headers={"profile": True})`.
+"""
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.db import connections
+
+from .models import ProfileReport
+
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+MAX_STACK_DEPTH = 64
+TOP_FUNCTIONS = 30
+TOP_STACKS = 20
+TOP_STATEMENTS = 50
+
+# Innermost frame of a sample -> layer. SQL also covers row fetching
+# (compiler.cursor_iter), "orm" is the materialization of rows and models.
+LAYER_PATTERNS = (
+    ("sql", re.compile(r"[/\\](psycopg2|sqlite3)[/\\]|[/\\]django[/\\]db[/\\](backends[/\\]|utils\.py)")),
+    ("orm", re.compile(r"[/\\]django[/\\]db[/\\]models[/\\]")),
+    ("pandas", re.compile(r"[/\\]pandas[/\\]")),
+    ("numpy", re.compile(r"[/\\]numpy[/\\]")),
+)
+SQL_FETCH_FUNCTIONS = {"cursor_iter", "fetchmany", "fetchone", "fetchall"}
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_owner = None
+
+
+def new_request_id(candidate=None):
+    """`candidate` (e.g. an incoming X-Request-ID) when well-formed, a fresh id otherwise."""
+    if candidate and REQUEST_ID_PATTERN.match(candidate):
+        return candidate
+    return uuid.uuid4().hex
+
+
+class Profiler:
+    """Context manager profiling the current thread."""
+
+    def __init__(self, interval=None, max_statements=None, trace_memory=None):
+        self.interval = interval or settings.PROFILING_SAMPLE_INTERVAL
+        self.max_statements = max_statements or settings.PROFILING_MAX_STATEMENTS
+        self.trace_memory = settings.PROFILING_TRACE_MEMORY if trace_memory is None else trace_memory
+        self.statements = []
+        self.sql_count = 0
+        self.sql_duration = 0.0
+        self.repeated = defaultdict(lambda: [0, 0.0])
+        self.samples = Counter()
+        self.memory_peak = None
+        self.memory_skipped = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self._record_sql))
+        if self.trace_memory and not _start_tracemalloc(self):
+            self.memory_skipped = "another profile is tracing memory in this process"
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+        self._started = time.perf_counter()
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.duration = time.perf_counter() - self._started
+        self._stop.set()
+        self._sampler.join()
+        self._stack.close()
+        if self.trace_memory and self.memory_skipped is None:
+            self.memory_peak = _stop_tracemalloc()
+        return False
+
+    def _record_sql(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.sql_count += 1
+            self.sql_duration += elapsed
+            repeated = self.repeated[sql]
+            repeated[0] += 1
+            repeated[1] += elapsed
+            if len(self.statements) < self.max_statements:
+                self.statements.append({
+                    "sql": sql[:2000],
+                    "seconds": round(elapsed, 6),
+                    "many": many,
+                    "at": round(started - self._started, 6),
+                })
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(stack)] += 1
+
+    def report(self):
+        """JSON-serializable profile."""
+        total = sum(self.samples.values())
+        layers = Counter()
+        self_counts, cumulative_counts = Counter(), Counter()
+        folded = Counter()
+        for stack, count in self.samples.items():
+            layers[_layer(stack)] += count
+            self_counts[stack[0]] += count
+            for code in set(stack):
+                cumulative_counts[code] += count
+            # Outermost first, as flame graph tools expect
+            folded[";".join(f"{_short(code[0])}:{code[1]}" for code in reversed(stack))] += count
+        seconds = self.duration / total if total else 0.0
+
+        def functions(counts):
+            return [
+                {"function": f"{_short(code[0])}:{code[2]} {code[1]}", "samples": count,
+                 "seconds": round(count * seconds, 4)}
+                for code, count in counts.most_common(TOP_FUNCTIONS)
+            ]
+
+        statements = sorted(self.statements, key=lambda statement: -statement["seconds"])
+        repeated = [
+            {"sql": sql[:2000], "count": count, "seconds": round(duration, 6)}
+            for sql, (count, duration) in sorted(self.repeated.items(), key=lambda item: -item[1][1])
+            if count > 1
+        ]
+        return {
+            "duration_seconds": round(self.duration, 6),
+            "sql": {
+                "count": self.sql_count,
+                "seconds": round(self.sql_duration, 6),
+                "statements": statements[:TOP_STATEMENTS],
+                "repeated": repeated[:TOP_STATEMENTS],
+                "truncated": self.sql_count > len(self.statements),
+            },
+            "memory": {"peak_bytes": self.memory_peak, "skipped": self.memory_skipped},
+            "sampling": {
+                "interval_seconds": self.interval,
+                "samples": total,
+                # Estimated seconds spent in each layer
+                "layers": {layer: round(count * seconds, 4) for layer, count in layers.most_common()},
+                "self": functions(self_counts),
+                "cumulative": functions(cumulative_counts),
+                "stacks": [{"stack": stack, "samples": count} for stack, count in folded.most_common(TOP_STACKS)],
+            },
+        }
+
+    def save(self, request_id, kind, name, details=None, **fields):
+        report = self.report()
+        report.update(details or {})
+        return ProfileReport.objects.update_or_create(
+            request_id=request_id,
+            defaults=dict(
+                kind=kind,
+                name=name[:500],
+                duration=self.duration,
+                sql_count=self.sql_count,
+                sql_duration=self.sql_duration,
+                memory_peak_bytes=self.memory_peak,
+                report=report,
+                **fields,
+            ),
+        )[0]
+
+
+def _layer(stack):
+    app_root = str(settings.BASE_DIR)
+    for filename, function, _ in stack:
+        if function in SQL_FETCH_FUNCTIONS and "django" in filename:
+            return "sql"
+        for layer, pattern in LAYER_PATTERNS:
+            if pattern.search(filename):
+                return layer
+    for filename, _, _ in stack:
+        if filename.startswith(app_root) and "site-packages" not in filename:
+            return "app"
+    return "other"
+
+
+def _short(filename):
+    """Path relative to site-packages or to the project."""
+    for marker in ("site-packages/", str(settings.BASE_DIR) + "/"):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    return filename
+
+
+def _start_tracemalloc(profiler):
+    """Start tracing for `profiler`; False when another profile already traces memory."""
+    global _tracemalloc_owner
+    with _tracemalloc_lock:
+        if _tracemalloc_owner is not None or tracemalloc.is_tracing():
+            # Resetting the shared peak would corrupt the other profile's figure
+            return False
+        _tracemalloc_owner = profiler
+        tracemalloc.start()
+        return True
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_owner
+    with _tracemalloc_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        _tracemalloc_owner = None
+    return peak
+
+
+# -- Celery ---------------------------------------------------------------
+
+_task_profilers = {}
+
+
+def _task_profile_id(task):
+    request = task.request
+    value = getattr(request, "profile", None) or (getattr(request, "headers", None) or {}).get("profile")
+    if not value:
+        return None
+    if isinstance(value, str):
+        return new_request_id(value)
+    return f"task-{request.id}"
+
+
+@task_prerun.connect
+def _profile_task_start(task_id=None, task=None, **kwargs):
+    profile_id = _task_profile_id(task)
+    if profile_id:
+        profiler = Profiler()
+        _task_profilers[task_id] = (profile_id, profiler.__enter__())
+
+
+@task_postrun.connect
+def _profile_task_end(task_id=None, task=None, state=None, **kwargs):
+    entry = _task_profilers.pop(task_id, None)
+    if entry is None:
+        return
+    profile_id, profiler = entry
+    profiler.__exit__(None, None, None)
+    profiler.save(profile_id, "task", task.name, details={"state": state})
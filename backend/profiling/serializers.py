@@ -0,0 +1,14 @@
+from rest_framework import serializers
+from .models import ProfileReport
+
+
+class ProfileReportListSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProfileReport
+        exclude = ["report"]
+
+
+class ProfileReportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProfileReport
+        fields = "__all__"
@@ -0,0 +1,52 @@
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from .models import ProfileReport
+from .profiler import Profiler, new_request_id
+
+
+class ProfilerTests(TestCase):
+    def test_sql_statements_are_counted(self):
+        with Profiler(trace_memory=False) as profiler:
+            User.objects.count()
+            User.objects.count()
+        report = profiler.report()
+        self.assertEqual(report['sql']['count'], 2)
+        self.assertEqual(report['sql']['repeated'][0]['count'], 2)
+        self.assertIsNone(report['memory']['peak_bytes'])
+
+    def test_memory_peak_is_traced(self):
+        with Profiler(trace_memory=True) as profiler:
+            buffer = np.ones(1_000_000)
+            del buffer
+        self.assertGreaterEqual(profiler.memory_peak, 8_000_000)
+        self.assertIsNone(profiler.report()['memory']['skipped'])
+
+    def test_overlapping_profiles_do_not_share_the_peak(self):
+        with Profiler(trace_memory=True) as outer:
+            buffer = np.ones(1_000_000)
+            del buffer
+            with Profiler(trace_memory=True) as inner:
+                pass
+        self.assertGreaterEqual(outer.memory_peak, 8_000_000)
+        self.assertIsNone(inner.memory_peak)
+        self.assertTrue(inner.report()['memory']['skipped'])
+        # Tracing is free again once the owner is done
+        with Profiler(trace_memory=True) as later:
+            pass
+        self.assertIsNotNone(later.memory_peak)
+
+    def test_request_ids_are_sanitized(self):
+        self.assertEqual(new_request_id('abc-123'), 'abc-123')
+        self.assertNotEqual(new_request_id('../etc'), '../etc')
+
+
+@override_settings(PROFILING_TOKEN='secret')
+class ProfilingMiddlewareTests(TestCase):
+    def test_only_requests_with_the_token_are_profiled(self):
+        self.client.get('/api/metrics/', HTTP_X_PROFILE='wrong')
+        self.assertFalse(ProfileReport.objects.exists())
+        response = self.client.get('/api/metrics/', HTTP_X_PROFILE='secret', HTTP_X_REQUEST_ID='req-1')
+        self.assertEqual(response['X-Request-ID'], 'req-1')
+        self.assertTrue(ProfileReport.objects.filter(request_id='req-1', kind='request').exists())
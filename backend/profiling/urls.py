@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import ProfileReportDetailView, ProfileReportListView
+
+urlpatterns = [
+    path('', ProfileReportListView.as_view(), name='profile-list'),
+    path('<str:request_id>/', ProfileReportDetailView.as_view(), name='profile-detail'),
+]
@@ -0,0 +1,20 @@
+from rest_framework import generics
+from rest_framework.permissions import IsAdminUser
+from .models import ProfileReport
+from .serializers import ProfileReportListSerializer, ProfileReportSerializer
+
+
+class ProfileReportListView(generics.ListAPIView):
+    """Stored profiles, most recent first (staff only)."""
+    queryset = ProfileReport.objects.all()
+    serializer_class = ProfileReportListSerializer
+    permission_classes = [IsAdminUser]
+    filterset_fields = ["kind"]
+
+
+class ProfileReportDetailView(generics.RetrieveDestroyAPIView):
+    """Full profile of one request or task, looked up by request ID (staff only)."""
+    queryset = ProfileReport.objects.all()
+    serializer_class = ProfileReportSerializer
+    permission_classes = [IsAdminUser]
+    lookup_field = "request_id"
@@ -0,0 +1,143 @@
+# backend/reports/charts.py
+import base64
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from reportlab.lib import colors
+from reportlab.graphics import renderSVG
+from reportlab.graphics.shapes import Drawing, String
+from reportlab.graphics.charts.lineplots import LinePlot
+from reportlab.graphics.charts.legends import Legend
+
+# Chart key -> (title, unit, [(field, statistic, label), ...])
+CHARTS = {
+    "production": (
+        "Production by source",
+        "kW",
+        [
+            ("battery_active_power", "mean", "Battery"),
+            ("pvpcs_active_power", "mean", "PV"),
+            ("fc_active_power", "mean", "Fuel cell"),
+        ],
+    ),
+    "consumption": (
+        "Consumption",
+        "kW",
+        [
+            ("ge_active_power", "mean", "Mean"),
+            ("ge_active_power", "max", "Peak"),
+        ],
+    ),
+    "voltage": (
+        "MG-LV-MSB AC voltage",
+        "V",
+        [("mg_lv_msb_ac_voltage", "mean", "Voltage")],
+    ),
+    "frequency": (
+        "MG-LV-MSB frequency",
+        "Hz",
+        [("mg_lv_msb_frequency", "mean", "Frequency")],
+    ),
+}
+
+REPORT_CHARTS = {
+    "kpi": ["production", "consumption"],
+    "production": ["production"],
+    "consumption": ["consumption"],
+    "electrical": ["voltage", "frequency"],
+    "comprehensive": ["production", "consumption", "voltage", "frequency"],
+}
+
+LINE_COLORS = [colors.HexColor(c) for c in ("#2e7d32", "#f9a825", "#1565c0", "#c62828")]
+
+
+def charts_for(config):
+    """Return the chart keys a report configuration should render."""
+    if not config.include_charts:
+        return []
+    return REPORT_CHARTS.get(config.report_type, [])
+
+
+def chart_fields(chart_keys):
+    """Return the data fields needed to draw `chart_keys`."""
+    fields = []
+    for key in chart_keys:
+        for field, _, _ in CHARTS[key][2]:
+            if field not in fields:
+                fields.append(field)
+    return fields
+
+
+def _segments(x, y):
+    """Split a series on NaN so data gaps are drawn as gaps."""
+    valid = ~np.isnan(y)
+    if not valid.any():
+        return []
+    edges = np.flatnonzero(np.diff(valid.astype(np.int8))) + 1
+    runs = np.split(np.arange(len(y)), edges)
+    return [list(zip(x[run].tolist(), y[run].tolist())) for run in runs if valid[run[0]]]
+
+
+def build_chart(series, key, width=480, height=220):
+    """
+    Build a reportlab Drawing for chart `key` from a downsampled `series`
+    (see metrics.services.SeriesAccumulator). Returns None if the period
+    holds no data for this chart.
+    """
+    title, unit, lines = CHARTS[key]
+    x = series["timestamps"].astype("datetime64[s]").astype(np.int64).astype(float)
+
+    plot_data, line_colors, legend = [], [], []
+    for index, (field, statistic, label) in enumerate(lines):
+        color = LINE_COLORS[index % len(LINE_COLORS)]
+        segments = _segments(x, series[field][statistic])
+        plot_data.extend(segments)
+        line_colors.extend([color] * len(segments))
+        if segments:
+            legend.append((color, label))
+    if not plot_data:
+        return None
+
+    drawing = Drawing(width, height)
+    drawing.add(String(10, height - 14, f"{title} ({unit})", fontName="Helvetica-Bold", fontSize=10))
+
+    plot = LinePlot()
+    plot.x, plot.y = 45, 40
+    plot.width, plot.height = width - 70, height - 80
+    plot.data = plot_data
+    for index, color in enumerate(line_colors):
+        plot.lines[index].strokeColor = color
+        plot.lines[index].strokeWidth = 1
+
+    span = x[-1] - x[0]
+    label_format = "%d/%m %H:%M" if span <= 2 * 86400 else "%d/%m"
+    plot.xValueAxis.valueMin = x[0]
+    plot.xValueAxis.valueMax = x[-1]
+    plot.xValueAxis.maximumTicks = 6
+    plot.xValueAxis.labelTextFormat = lambda value: datetime.fromtimestamp(
+        value, dt_timezone.utc
+    ).strftime(label_format)
+    for axis in (plot.xValueAxis, plot.yValueAxis):
+        axis.labels.fontName = "Helvetica"
+        axis.labels.fontSize = 7
+    drawing.add(plot)
+
+    if len(legend) > 1:
+        chart_legend = Legend()
+        chart_legend.x, chart_legend.y = width - 10, height - 10
+        chart_legend.alignment = "right"
+        chart_legend.boxAnchor = "ne"
+        chart_legend.columnMaximum = 1
+        chart_legend.deltax = 60
+        chart_legend.fontName = "Helvetica"
+        chart_legend.fontSize = 7
+        chart_legend.colorNamePairs = legend
+        drawing.add(chart_legend)
+
+    return drawing
+
+
+def chart_svg_data_uri(drawing):
+    """Render a Drawing as an inline SVG data URI for Markdown reports."""
+    svg = renderSVG.drawToString(drawing)
+    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode()).decode()
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedreport',
+            name='timings',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_generatedreport_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedreport',
+            name='cache_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
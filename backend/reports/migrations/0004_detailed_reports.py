@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_generatedreport_cache_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportconfiguration',
+            name='aggregation',
+            field=models.CharField(choices=[('raw', 'Raw readings'), ('minute', 'Per minute'), ('hour', 'Hourly'), ('day', 'Daily')], default='raw', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='reportconfiguration',
+            name='format',
+            field=models.CharField(choices=[('pdf', 'PDF'), ('md', 'Markdown'), ('csv', 'CSV'), ('csv_gz', 'CSV (gzip)'), ('parquet', 'Parquet')], max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='reportconfiguration',
+            name='report_type',
+            field=models.CharField(choices=[('kpi', 'KPI Summary'), ('electrical', 'Electrical Metrics'), ('production', 'Production Analysis'), ('consumption', 'Consumption Analysis'), ('comprehensive', 'Comprehensive Report'), ('detailed', 'Detailed Data Export')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0004_detailed_reports'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportconfiguration',
+            name='last_scheduled_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportconfiguration',
+            name='schedule',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
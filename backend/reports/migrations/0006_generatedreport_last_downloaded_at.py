@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0005_report_schedules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generatedreport',
+            name='last_downloaded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.6 on 2026-10-19 04:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ingestion', '0004_sites'),
+        ('reports', '0006_generatedreport_last_downloaded_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportconfiguration',
+            name='site',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='report_configurations', to='ingestion.site'),
+        ),
+    ]
@@ -1,4 +1,7 @@
 # backend/reports/models.py
+from datetime import datetime, time, timedelta
+
+from celery.schedules import crontab
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -8,6 +11,8 @@ class ReportConfiguration(models.Model):
         ('pdf', 'PDF'),
         ('md', 'Markdown'),
         ('csv', 'CSV'),
+        ('csv_gz', 'CSV (gzip)'),
+        ('parquet', 'Parquet'),
     ]
     
     REPORT_TYPE_CHOICES = [
@@ -16,6 +21,17 @@ class ReportConfiguration(models.Model):
         ('production', 'Production Analysis'),
         ('consumption', 'Consumption Analysis'),
         ('comprehensive', 'Comprehensive Report'),
+        ('detailed', 'Detailed Data Export'),
+    ]
+
+    # Formats able to carry a full time series (detailed reports only)
+    DATA_EXPORT_FORMATS = ('csv', 'csv_gz', 'parquet')
+
+    AGGREGATION_CHOICES = [
+        ('raw', 'Raw readings'),
+        ('minute', 'Per minute'),
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
     ]
     
     name = models.CharField(max_length=100)
@@ -23,6 +39,12 @@ class ReportConfiguration(models.Model):
     report_type = models.CharField(max_length=20, choices=REPORT_TYPE_CHOICES)
     format = models.CharField(max_length=10, choices=REPORT_FORMAT_CHOICES)
     include_charts = models.BooleanField(default=True)
+    # Site the report covers; null aggregates every site
+    site = models.ForeignKey(
+        'ingestion.Site', on_delete=models.CASCADE, null=True, blank=True, related_name='report_configurations'
+    )
+    # Resolution of the time series written by detailed reports
+    aggregation = models.CharField(max_length=10, choices=AGGREGATION_CHOICES, default='raw')
     date_range = models.CharField(max_length=20, default='last_7_days', 
                                  choices=[('today', 'Today'), 
                                          ('yesterday', 'Yesterday'),
@@ -32,10 +54,77 @@ class ReportConfiguration(models.Model):
                                          ('custom', 'Custom')])
     start_date = models.DateField(null=True, blank=True)
     end_date = models.DateField(null=True, blank=True)
+    # Cron expression "minute hour day_of_month month day_of_week"; blank = manual only
+    schedule = models.CharField(max_length=100, blank=True)
+    last_scheduled_at = models.DateTimeField(null=True, blank=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    def resolve_period(self, today=None):
+        """
+        Resolve `date_range` into a (start_date, end_date) pair of dates.
+        """
+        end_date = today or timezone.localdate()
+        if self.date_range == "today":
+            start_date = end_date
+        elif self.date_range == "yesterday":
+            start_date = end_date - timedelta(days=1)
+            end_date = start_date
+        elif self.date_range == "last_7_days":
+            start_date = end_date - timedelta(days=7)
+        elif self.date_range == "last_30_days":
+            start_date = end_date - timedelta(days=30)
+        elif self.date_range == "this_month":
+            start_date = end_date.replace(day=1)
+        else:  # custom
+            start_date = self.start_date
+            end_date = self.end_date
+        return start_date, end_date
+
+    @staticmethod
+    def period_bounds(start_date, end_date):
+        """
+        Convert an inclusive date period into aware datetime bounds usable
+        directly on the indexed `timestamp` column.
+        """
+        start = timezone.make_aware(datetime.combine(start_date, time.min)) if start_date else None
+        end = timezone.make_aware(datetime.combine(end_date, time.max)) if end_date else None
+        return start, end
+
+    def cron_schedule(self):
+        """
+        Parse `schedule` into a Celery crontab. Raises ValueError when the
+        expression is not a valid five-field cron expression.
+        """
+        parts = self.schedule.split()
+        if len(parts) != 5:
+            raise ValueError("Schedule must have 5 fields: minute hour day_of_month month day_of_week")
+        minute, hour, day_of_month, month_of_year, day_of_week = parts
+        try:
+            return crontab(
+                minute=minute,
+                hour=hour,
+                day_of_month=day_of_month,
+                month_of_year=month_of_year,
+                day_of_week=day_of_week,
+            )
+        except Exception as exc:
+            raise ValueError(f"Invalid schedule {self.schedule!r}: {exc}") from exc
+
+    def schedule_is_due(self, now=None):
+        """
+        True when the schedule fired since the last scheduled run (or since
+        the configuration was created).
+        """
+        if not self.schedule:
+            return False
+        schedule = self.cron_schedule()
+        last_run = self.last_scheduled_at or self.created_at
+        now = now or timezone.now()
+        last_run_local, delta, _ = schedule.remaining_delta(last_run)
+        return last_run_local + delta <= now
+
     def __str__(self):
         return f"{self.name} ({self.get_report_type_display()})"
 
@@ -52,7 +141,14 @@ class GeneratedReport(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     generated_at = models.DateTimeField(default=timezone.now)
     completed_at = models.DateTimeField(null=True, blank=True)
+    # Drives LRU eviction when report storage exceeds its quota
+    last_downloaded_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(blank=True)
+    # Seconds spent in each generation phase, e.g. {"kpi": 0.42, "render": 0.08}
+    timings = models.JSONField(default=dict, blank=True)
+    # Content address of the generated file, see reports.services.report_cache_key
+    cache_key = models.CharField(max_length=64, blank=True, db_index=True)
+
     @property
     def file_url(self):
         if self.file and hasattr(self.file, 'url'):
@@ -14,7 +14,30 @@ class ReportConfigurationSerializer(serializers.ModelSerializer):
     class Meta:
         model = ReportConfiguration
         fields = '__all__'
-        read_only_fields = ['created_by', 'created_at', 'updated_at']
+        read_only_fields = ['created_by', 'created_at', 'updated_at', 'last_scheduled_at']
+
+    def validate_schedule(self, value):
+        value = ' '.join(value.split())
+        if value:
+            try:
+                ReportConfiguration(schedule=value).cron_schedule()
+            except ValueError as exc:
+                raise serializers.ValidationError(str(exc))
+        return value
+
+    def validate(self, attrs):
+        report_type = attrs.get('report_type', getattr(self.instance, 'report_type', None))
+        report_format = attrs.get('format', getattr(self.instance, 'format', None))
+        detailed = report_type == 'detailed'
+        if detailed and report_format not in ReportConfiguration.DATA_EXPORT_FORMATS:
+            raise serializers.ValidationError(
+                {'format': 'Detailed reports can only be exported as CSV, gzip CSV or Parquet.'}
+            )
+        if not detailed and report_format in ('csv_gz', 'parquet'):
+            raise serializers.ValidationError(
+                {'format': 'Gzip CSV and Parquet are only available for detailed reports.'}
+            )
+        return attrs
 
 class GeneratedReportSerializer(serializers.ModelSerializer):
     configuration = ReportConfigurationSerializer(read_only=True)
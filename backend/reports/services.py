@@ -0,0 +1,78 @@
+# backend/reports/services.py
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.utils import timezone
+
+from ingestion.services import range_revision
+from .charts import CHARTS, charts_for
+from .models import GeneratedReport
+
+
+# Bump when the rendering of the files changes (layout, colors, columns):
+# cached files of the previous rendering then stop matching
+REPORT_LAYOUT_VERSION = 1
+
+
+def report_cache_key(config, start_date, end_date):
+    """
+    Content address of a report: everything that shapes the output file,
+    including the data revision of the resolved period. Any ingestion, edit
+    or delete touching the period changes the revision and therefore the key,
+    and so does a change of the KPI integration, chart or time zone settings.
+
+    Hits may cross configurations of the same owner (same name and options:
+    identical files) but never owners: a file carries the name and the
+    generation time its owner asked for.
+    """
+    revision = range_revision(start_date, end_date, config.site_id)
+    payload = {
+        'owner': config.created_by_id,
+        'name': config.name,
+        'report_type': config.report_type,
+        'format': config.format,
+        'site': config.site_id,
+        'include_charts': config.include_charts,
+        'aggregation': config.aggregation,
+        'start_date': start_date.isoformat() if start_date else None,
+        'end_date': end_date.isoformat() if end_date else None,
+        'data_version': revision['version'],
+        'integration': settings.KPI_INTEGRATION,
+        'charts': {key: CHARTS[key] for key in charts_for(config)},
+        'chart_points': settings.REPORT_CHART_POINTS,
+        'time_zone': settings.TIME_ZONE,
+        'layout': REPORT_LAYOUT_VERSION,
+    }
+    encoded = json.dumps(payload, sort_keys=True).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def find_cached_report(cache_key):
+    """
+    Return the most recent completed report generated for `cache_key` whose
+    file is still on disk, or None.
+    """
+    if not settings.REPORT_CACHE_ENABLED or not cache_key:
+        return None
+    candidates = GeneratedReport.objects.filter(
+        cache_key=cache_key, status='completed'
+    ).exclude(file='').order_by('-completed_at')
+    for report in candidates[:5]:
+        if os.path.exists(report.file.path):
+            return report
+    return None
+
+
+def link_cached_report(report, cached, cache_key):
+    """
+    Complete `report` instantly by pointing it at the file of `cached`.
+    """
+    report.file.name = cached.file.name
+    report.status = 'completed'
+    report.completed_at = timezone.now()
+    report.cache_key = cache_key
+    report.timings = {'cached_from': cached.id}
+    report.save()
+    return report
@@ -1,13 +1,22 @@
 import os
 import csv
+import gzip
+import time
 import logging
 import traceback
-from datetime import timedelta
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime, timezone as dt_timezone
+from itertools import chain, islice
 
 from celery import shared_task
-from celery.exceptions import MaxRetriesExceededError
+from django.core.files.storage import default_storage
+from django.db import InterfaceError, OperationalError
+from django.db.models import Min, Max
 from django.utils import timezone
 from django.conf import settings
+from microgrid_monitoring.db_router import reads_from_replica
+from microgrid_monitoring.instrumentation import observe_phases
 
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
@@ -15,17 +24,46 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.units import inch
 
-from ingestion.models import MicrogridData
-from metrics.services import calculate_kpis
-from .models import GeneratedReport
+from ingestion.services import (
+    MEASUREMENT_FIELDS,
+    aggregates_queryset,
+    iter_tiered_rows,
+    readings_queryset,
+)
+from ingestion import rollups
+from ingestion.models import Site
+from metrics.services import SeriesAccumulator, calculate_kpis, scan_site_kpis, scan_tiered_readings
+from .charts import build_chart, chart_fields, chart_svg_data_uri, charts_for
+from .models import GeneratedReport, ReportConfiguration
+from .services import find_cached_report, link_cached_report, report_cache_key
 
 logger = logging.getLogger(__name__)
 
+# Rows written per batch by detailed (full time series) reports
+DETAILED_BATCH_SIZE = 20000
+
+# Failures worth retrying: lost database connections, lock timeouts, storage I/O
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, OSError)
+
+
+@contextmanager
+def phase_timer(timings, phase):
+    """Record the wall-clock duration of a generation phase into `timings`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = round(time.perf_counter() - started, 4)
+
 
 @shared_task(bind=True, max_retries=3, default_retry_delay=60, queue='reports')
+@reads_from_replica
 def generate_report_task(self, report_id):
     """
-    Asynchronous Celery task to generate a report with retries and status updates.
+    Asynchronous Celery task to generate a report with status updates.
+    Transient errors (TRANSIENT_ERRORS) are retried up to max_retries times,
+    default_retry_delay seconds apart, the report staying "processing";
+    other errors, and the last transient one, fail the report.
     """
     try:
         report = GeneratedReport.objects.get(id=report_id)
@@ -33,72 +71,240 @@ def generate_report_task(self, report_id):
         report.save()
 
         config = report.configuration
+        timings = {}
+
+        with phase_timer(timings, "total"):
+            # --- Date range handling ---
+            start_date, end_date = config.resolve_period()
+            range_start, range_end = config.period_bounds(start_date, end_date)
+            # Keyed before reading so a concurrent ingestion yields a new key
+            cache_key = report_cache_key(config, start_date, end_date)
+
+            data = readings_queryset(range_start, range_end, config.site_id)
+
+            if config.report_type == "detailed":
+                # --- Detailed reports: stream the time series itself ---
+                with phase_timer(timings, "export"):
+                    generated_file_path = generate_detailed_report(config, range_start, range_end)
+            else:
+                # --- Data, KPIs & chart series (one pass over the indexed range) ---
+                with phase_timer(timings, "scan"):
+                    kpis, series = scan_report_data(
+                        charts_for(config), data, range_start, range_end, config.site_id
+                    )
+
+                # --- Format-specific generation ---
+                with phase_timer(timings, "render"):
+                    generated_file_path = render_summary_report(config, kpis, series, data, start_date, end_date)
+
+        complete_report(report, generated_file_path, timings, cache_key)
+
+    except TRANSIENT_ERRORS as exc:
+        if self.request.retries < self.max_retries:
+            logger.warning(f"⚠️ Retrying report {report_id} after a transient error: {exc}")
+            raise self.retry(exc=exc)
+        fail_report(report_id, exc)
+    except Exception as exc:
+        fail_report(report_id, exc)
 
-        # --- Date range handling ---
-        end_date = timezone.now().date()
-        if config.date_range == "today":
-            start_date = end_date
-        elif config.date_range == "yesterday":
-            start_date = end_date - timedelta(days=1)
-            end_date = start_date
-        elif config.date_range == "last_7_days":
-            start_date = end_date - timedelta(days=7)
-        elif config.date_range == "last_30_days":
-            start_date = end_date - timedelta(days=30)
-        elif config.date_range == "this_month":
-            start_date = end_date.replace(day=1)
-        else:  # custom
-            start_date = config.start_date
-            end_date = config.end_date
-
-        # --- Data & KPIs ---
-        data = MicrogridData.objects.filter(
-            timestamp__date__gte=start_date,
-            timestamp__date__lte=end_date,
-        )
-        kpis = calculate_kpis(data)
-
-        # --- Format-specific generation ---
-        generated_file_path = None
-        if config.format == "pdf":
-            generated_file_path = generate_pdf_report(config, kpis, data, start_date, end_date)
-        elif config.format == "md":
-            generated_file_path = generate_markdown_report(config, kpis, data, start_date, end_date)
-        elif config.format == "csv":
-            generated_file_path = generate_csv_report(config, kpis, data, start_date, end_date)
-        else:
-            raise ValueError(f"Unsupported report format: {config.format}")
-
-        if generated_file_path:
-            report.file.name = generated_file_path
-            report.status = "completed"
-            report.completed_at = timezone.now()
-            report.save()
-            logger.info(f"✅ Successfully generated report {report_id} as {config.format}")
-        else:
-            raise Exception("Report generation failed to produce a file path.")
 
+@shared_task(queue='reports')
+@reads_from_replica
+def generate_report_batch(report_ids, start_date=None, end_date=None, site_id=None):
+    """
+    Generate several reports covering the same period and site (site_id=None
+    for all sites). KPIs and chart series
+    are computed once, from a single pass over the period, and every summary
+    report is rendered from that shared result. Detailed exports still stream
+    their own rows. A failure only fails the report it belongs to.
+    """
+    start_date = date.fromisoformat(start_date) if start_date else None
+    end_date = date.fromisoformat(end_date) if end_date else None
+    range_start, range_end = ReportConfiguration.period_bounds(start_date, end_date)
+    data = readings_queryset(range_start, range_end, site_id)
+
+    reports = list(GeneratedReport.objects.filter(id__in=report_ids).select_related("configuration"))
+    GeneratedReport.objects.filter(id__in=report_ids).update(status="processing")
+
+    summaries = []
+    for report in reports:
+        config = report.configuration
+        try:
+            cache_key = report_cache_key(config, start_date, end_date)
+            cached = find_cached_report(cache_key)
+            if cached:
+                link_cached_report(report, cached, cache_key)
+            elif config.report_type == "detailed":
+                timings = {}
+                with phase_timer(timings, "total"):
+                    generated_file_path = generate_detailed_report(config, range_start, range_end)
+                complete_report(report, generated_file_path, timings, cache_key)
+            else:
+                summaries.append((report, cache_key))
+        except Exception as exc:
+            fail_report(report.id, exc)
+
+    if not summaries:
+        return f"📦 Generated {len(reports)} reports"
+
+    shared = {}
+    chart_keys = []
+    for report, _ in summaries:
+        chart_keys.extend(key for key in charts_for(report.configuration) if key not in chart_keys)
+    try:
+        with phase_timer(shared, "scan"):
+            kpis, series = scan_report_data(chart_keys, data, range_start, range_end, site_id)
     except Exception as exc:
-        logger.error(
-            f"❌ Error generating report {report_id}: {exc}\n{traceback.format_exc()}"
-        )
+        for report, _ in summaries:
+            fail_report(report.id, exc)
+        return f"❌ Shared data pass failed for {len(summaries)} reports"
+
+    for report, cache_key in summaries:
+        timings = {"scan": shared["scan"], "batch_size": len(summaries)}
         try:
-            report = GeneratedReport.objects.get(id=report_id)
-            report.status = "failed"  # Set to failed
-            report.error_message = str(exc)
-            report.completed_at = timezone.now() # Mark completion time even on failure
-            report.save()
-        except Exception:
-            pass
-        # Let Celery's built-in retry mechanism handle retries.
-        # If max_retries are exceeded, Celery will mark the task as FAILED.
+            with phase_timer(timings, "render"):
+                generated_file_path = render_summary_report(
+                    report.configuration, kpis, series, data, start_date, end_date
+                )
+            timings["total"] = round(timings["scan"] + timings["render"], 4)
+            complete_report(report, generated_file_path, timings, cache_key)
+        except Exception as exc:
+            fail_report(report.id, exc)
+
+    return f"📦 Generated {len(reports)} reports ({len(summaries)} from one shared data pass)"
+
+
+@shared_task(queue='reports')
+def dispatch_scheduled_reports():
+    """
+    Celery beat entry point, run every minute. Creates a report for every
+    configuration whose schedule is due and enqueues one batch per resolved
+    period and site, so configurations sharing both share one data pass.
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+    batches = defaultdict(list)
+
+    for config in ReportConfiguration.objects.exclude(schedule=""):
+        try:
+            if not config.schedule_is_due(now):
+                continue
+        except ValueError as exc:
+            logger.warning(f"Skipping configuration {config.id} with invalid schedule: {exc}")
+            continue
+        # Claim this tick; a concurrent dispatcher that read the same value gets 0 rows
+        claimed = ReportConfiguration.objects.filter(
+            pk=config.pk, last_scheduled_at=config.last_scheduled_at
+        ).update(last_scheduled_at=now)
+        if not claimed:
+            continue
+        report = GeneratedReport.objects.create(configuration=config, status="pending")
+        batches[config.resolve_period(today) + (config.site_id,)].append(report.id)
+
+    for (start_date, end_date, site_id), report_ids in batches.items():
+        generate_report_batch.delay(
+            report_ids,
+            start_date.isoformat() if start_date else None,
+            end_date.isoformat() if end_date else None,
+            site_id,
+        )
+    count = sum(len(ids) for ids in batches.values())
+    return f"🗓️ Dispatched {count} scheduled reports in {len(batches)} batches"
+
+
+def complete_report(report, generated_file_path, timings, cache_key):
+    if not generated_file_path:
+        raise Exception("Report generation failed to produce a file path.")
+    report.file.name = generated_file_path
+    report.status = "completed"
+    report.completed_at = timezone.now()
+    report.timings = timings
+    report.cache_key = cache_key
+    report.save()
+    observe_phases("report", timings)
+    logger.info(
+        f"✅ Successfully generated report {report.id} as {report.configuration.format} in {timings.get('total')}s"
+    )
+
+
+def fail_report(report_id, exc):
+    logger.error(
+        f"❌ Error generating report {report_id}: {exc}\n{traceback.format_exc()}"
+    )
+    try:
+        report = GeneratedReport.objects.get(id=report_id)
+        report.status = "failed"  # Set to failed
+        report.error_message = str(exc)
+        report.completed_at = timezone.now() # Mark completion time even on failure
+        report.save()
+    except Exception:
+        pass
+
+
+def scan_report_data(chart_keys, data, range_start=None, range_end=None, site_id=None):
+    """
+    Compute the KPIs and, when `chart_keys` is not empty, the downsampled
+    series of those charts in a single streamed pass over the period (one
+    pass per site when `site_id` is None), reading both the compacted and the
+    raw tier. When the KPI rollup views are available the KPIs come from
+    calculate_kpis and the pass only feeds the series. `data` is only used to
+    bound an open-ended period.
+    """
+    if not chart_keys:
+        return calculate_kpis(range_start, range_end, site_id), None
+
+    if range_start is None or range_end is None:
+        spans = [
+            queryset.aggregate(first=Min("timestamp"), last=Max("timestamp"))
+            for queryset in (data, aggregates_queryset(range_start, range_end, site_id))
+        ]
+        firsts = [span["first"] for span in spans if span["first"]]
+        lasts = [span["last"] for span in spans if span["last"]]
+        range_start = range_start or (min(firsts) if firsts else None)
+        range_end = range_end or (max(lasts) if lasts else None)
+    if range_start is None or range_end is None:  # no data at all
+        return {}, None
+
+    series_accumulator = SeriesAccumulator(
+        range_start, range_end, chart_fields(chart_keys), settings.REPORT_CHART_POINTS
+    )
+    if not rollups.available():
+        kpis = scan_site_kpis(range_start, range_end, site_id, series_accumulator)
+        return kpis, series_accumulator.result()
+    # KPIs from the rollup views; the scan only feeds the series
+    for site in ([site_id] if site_id is not None else Site.objects.all()):
+        scan_tiered_readings(range_start, range_end, site, series_accumulator)
+    return calculate_kpis(range_start, range_end, site_id), series_accumulator.result()
+
+
+def render_summary_report(config, kpis, series, data, start_date, end_date):
+    """Write a KPI/chart report in the configuration's format and return its path."""
+    if config.format == "pdf":
+        return generate_pdf_report(config, kpis, data, start_date, end_date, series)
+    elif config.format == "md":
+        return generate_markdown_report(config, kpis, data, start_date, end_date, series)
+    elif config.format == "csv":
+        return generate_csv_report(config, kpis, data, start_date, end_date)
+    raise ValueError(f"Unsupported report format: {config.format}")
+
+
+def build_report_charts(config, series):
+    """Return the (key, Drawing) pairs to embed in the report."""
+    if series is None:
+        return []
+    charts = []
+    for key in charts_for(config):
+        drawing = build_chart(series, key)
+        if drawing is not None:
+            charts.append((key, drawing))
+    return charts
 
 
 # ---------------------------------------------------------------------
 # Report Generators
 # ---------------------------------------------------------------------
 
-def generate_pdf_report(config, kpis, data, start_date, end_date):
+def generate_pdf_report(config, kpis, data, start_date, end_date, series=None):
     filename = f"report_{config.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.pdf"
     file_path = os.path.join(settings.MEDIA_ROOT, "reports", filename)
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -146,11 +352,19 @@ def generate_pdf_report(config, kpis, data, start_date, end_date):
     elements.append(table)
     elements.append(Spacer(1, 0.5 * inch))
 
+    # Charts
+    charts = build_report_charts(config, series)
+    if charts:
+        elements.append(Paragraph("Charts", styles["Heading2"]))
+        for _, drawing in charts:
+            elements.append(drawing)
+            elements.append(Spacer(1, 0.2 * inch))
+
     doc.build(elements)
     return f"reports/{filename}"
 
 
-def generate_markdown_report(config, kpis, data, start_date, end_date):
+def generate_markdown_report(config, kpis, data, start_date, end_date, series=None):
     filename = f"report_{config.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.md"
     file_path = os.path.join(settings.MEDIA_ROOT, "reports", filename)
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
@@ -170,6 +384,12 @@ def generate_markdown_report(config, kpis, data, start_date, end_date):
             elif key in ["pic_consommation", "pic_production"]:
                 f.write(f"| {key} | {value:.2f} | kW |\n")
 
+        charts = build_report_charts(config, series)
+        if charts:
+            f.write("\n## Charts\n\n")
+            for key, drawing in charts:
+                f.write(f"![{key}]({chart_svg_data_uri(drawing)})\n\n")
+
     return f"reports/{filename}"
 
 
@@ -196,13 +416,181 @@ def generate_csv_report(config, kpis, data, start_date, end_date):
     return f"reports/{filename}"
 
 
+def generate_detailed_report(config, range_start, range_end):
+    """
+    Write the full time series of [range_start, range_end] (or its per-bucket
+    averages) to CSV, gzip CSV or Parquet, reading both the compacted and the
+    raw tier: periods already compacted export per-minute means. Every row
+    names its site; an export of all sites writes one site after the other
+    and aggregates each separately. Rows are streamed from a server-side
+    cursor and written in batches, so memory stays bounded whatever the
+    period length.
+    """
+    extensions = {"csv": "csv", "csv_gz": "csv.gz", "parquet": "parquet"}
+    if config.format not in extensions:
+        raise ValueError(f"Unsupported detailed report format: {config.format}")
+
+    filename = f"report_{config.id}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.{extensions[config.format]}"
+    file_path = os.path.join(settings.MEDIA_ROOT, "reports", filename)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+    fields = list(MEASUREMENT_FIELDS)
+    sites = Site.objects.order_by("pk")
+    if config.site_id:
+        sites = sites.filter(pk=config.site_id)
+    rows = chain.from_iterable(
+        (
+            (timestamp, site.slug, *values)
+            for timestamp, *values in iter_tiered_rows(
+                range_start, range_end, site, fields, aggregation=config.aggregation
+            )
+        )
+        for site in sites
+    )
+    header = ["timestamp", "site"] + fields
+
+    if config.format == "parquet":
+        write_parquet_rows(file_path, header, rows)
+    else:
+        opener = gzip.open if config.format == "csv_gz" else open
+        with opener(file_path, "wt", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for batch in _batched(rows, DETAILED_BATCH_SIZE):
+                writer.writerows(
+                    (timestamp.isoformat(), *values) for timestamp, *values in batch
+                )
+
+    return f"reports/{filename}"
+
+
+def write_parquet_rows(file_path, header, rows):
+    """Write `(timestamp, site, *floats)` rows to a Parquet file, one row group per batch."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package") from exc
+
+    schema = pa.schema(
+        [pa.field("timestamp", pa.timestamp("us", tz="UTC")), pa.field("site", pa.string())]
+        + [pa.field(name, pa.float64()) for name in header[2:]]
+    )
+    with pq.ParquetWriter(file_path, schema, compression="zstd") as writer:
+        for batch in _batched(rows, DETAILED_BATCH_SIZE):
+            columns = list(zip(*batch))
+            arrays = [pa.array(column, type=field.type) for column, field in zip(columns, schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
 # ---------------------------------------------------------------------
 # Maintenance Task
 # ---------------------------------------------------------------------
 @shared_task(queue='reports')
-def cleanup_old_reports(days=30):
-    """Delete reports older than X days"""
+def cleanup_old_reports(days=None):
+    """
+    Report storage maintenance, scheduled daily:
+    1. delete reports older than `days` together with their files, in batches;
+    2. delete files under media/reports/ that no report references;
+    3. evict least recently used files while the total exceeds REPORTS_MAX_TOTAL_BYTES.
+    """
+    days = settings.REPORT_RETENTION_DAYS if days is None else days
     cutoff_date = timezone.now() - timezone.timedelta(days=days)
-    old_reports = GeneratedReport.objects.filter(generated_at__lt=cutoff_date)
-    count, _ = old_reports.delete()
-    return f"🧹 Deleted {count} old reports"
+    old_reports = GeneratedReport.objects.filter(generated_at__lt=cutoff_date).order_by("id")
+
+    deleted_rows = deleted_files = 0
+    while True:
+        batch = list(old_reports.values_list("id", flat=True)[:settings.REPORT_CLEANUP_BATCH_SIZE])
+        if not batch:
+            break
+        rows, files = delete_reports(batch)
+        deleted_rows += rows
+        deleted_files += files
+
+    orphans = remove_orphaned_report_files()
+    evicted_rows, evicted_files = enforce_report_quota()
+    return (
+        f"🧹 Deleted {deleted_rows} old reports ({deleted_files} files), "
+        f"{orphans} orphaned files, evicted {evicted_rows} reports ({evicted_files} files) over quota"
+    )
+
+
+def delete_reports(report_ids):
+    """
+    Delete the given reports and every file of theirs no other report
+    still points at (cached reports share files). Returns (rows, files).
+    """
+    reports = GeneratedReport.objects.filter(id__in=report_ids)
+    names = set(reports.exclude(file="").values_list("file", flat=True))
+    rows, _ = reports.delete()
+    still_used = set(
+        GeneratedReport.objects.filter(file__in=names).values_list("file", flat=True)
+    )
+    files = 0
+    for name in names - still_used:
+        if default_storage.exists(name):
+            default_storage.delete(name)
+            files += 1
+    return rows, files
+
+
+def remove_orphaned_report_files():
+    """
+    Delete files under media/reports/ that no GeneratedReport references.
+    Recent files are left alone: they may belong to a generation in progress.
+    """
+    if not default_storage.exists("reports"):
+        return 0
+    referenced = set(GeneratedReport.objects.exclude(file="").values_list("file", flat=True))
+    grace_cutoff = timezone.now() - timezone.timedelta(seconds=settings.REPORT_ORPHAN_GRACE_SECONDS)
+    removed = 0
+    _, file_names = default_storage.listdir("reports")
+    for file_name in file_names:
+        name = f"reports/{file_name}"
+        if name in referenced or default_storage.get_modified_time(name) > grace_cutoff:
+            continue
+        default_storage.delete(name)
+        removed += 1
+    return removed
+
+
+def enforce_report_quota(max_bytes=None):
+    """
+    Evict report files, least recently downloaded (or generated) first, until
+    their total size fits in `max_bytes` (REPORTS_MAX_TOTAL_BYTES; 0 = no quota).
+    Reports pointing at an evicted file are deleted with it. Returns (rows, files).
+    """
+    max_bytes = settings.REPORTS_MAX_TOTAL_BYTES if max_bytes is None else max_bytes
+    if not max_bytes:
+        return 0, 0
+
+    usage = (
+        GeneratedReport.objects.exclude(file="")
+        .values("file")
+        .annotate(last_downloaded=Max("last_downloaded_at"), last_completed=Max("completed_at"))
+    )
+    files = []
+    for entry in usage:
+        name = entry["file"]
+        if not default_storage.exists(name):
+            continue
+        used_at = max(filter(None, [entry["last_downloaded"], entry["last_completed"]]), default=None)
+        files.append((used_at or datetime.min.replace(tzinfo=dt_timezone.utc), name, default_storage.size(name)))
+
+    total = sum(size for _, _, size in files)
+    evicted_rows = evicted_files = 0
+    for _, name, size in sorted(files):
+        if total <= max_bytes:
+            break
+        ids = list(GeneratedReport.objects.filter(file=name).values_list("id", flat=True))
+        rows, removed = delete_reports(ids)
+        evicted_rows += rows
+        evicted_files += removed
+        total -= size
+    return evicted_rows, evicted_files
@@ -1,3 +1,226 @@
-from django.test import TestCase
+import csv
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from ingestion.models import MicrogridData, Site
+from . import tasks
+from .models import GeneratedReport, ReportConfiguration
+from .services import report_cache_key
+from .tasks import (
+    delete_reports,
+    dispatch_scheduled_reports,
+    enforce_report_quota,
+    generate_detailed_report,
+    generate_report_task,
+    remove_orphaned_report_files,
+)
+from .views import parse_byte_range
+
+
+class ReportCacheKeyTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user('reporter')
+        self.config = ReportConfiguration(
+            name='Export', report_type='detailed', format='csv', created_by=user
+        )
+        self.period = (date(2024, 1, 1), date(2024, 1, 7))
+
+    def test_same_configuration_same_key(self):
+        self.assertEqual(report_cache_key(self.config, *self.period), report_cache_key(self.config, *self.period))
+
+    def test_output_shaping_fields_change_the_key(self):
+        key = report_cache_key(self.config, *self.period)
+        for field, value in (('aggregation', 'hour'), ('format', 'parquet'), ('include_charts', False)):
+            original = getattr(self.config, field)
+            setattr(self.config, field, value)
+            self.assertNotEqual(report_cache_key(self.config, *self.period), key, field)
+            setattr(self.config, field, original)
+
+    def test_output_shaping_settings_change_the_key(self):
+        self.config.report_type = 'kpi'
+        key = report_cache_key(self.config, *self.period)
+        for name, value in (('REPORT_CHART_POINTS', 100), ('TIME_ZONE', 'Europe/Paris')):
+            with self.settings(**{name: value}):
+                self.assertNotEqual(report_cache_key(self.config, *self.period), key, name)
+
+    def test_keys_are_scoped_to_the_owner(self):
+        key = report_cache_key(self.config, *self.period)
+        self.config.created_by = User.objects.create_user('other')
+        self.assertNotEqual(report_cache_key(self.config, *self.period), key)
+
+    def test_period_changes_the_key(self):
+        key = report_cache_key(self.config, *self.period)
+        self.assertNotEqual(report_cache_key(self.config, date(2024, 1, 2), date(2024, 1, 7)), key)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class DetailedReportTests(TestCase):
+    def test_all_sites_export_is_aggregated_per_site(self):
+        start = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+        for slug, power in (('north', 10.0), ('south', 30.0)):
+            site = Site.objects.create(name=slug, slug=slug)
+            MicrogridData.objects.bulk_create([
+                MicrogridData(site=site, timestamp=start + timedelta(minutes=i), ge_active_power=power)
+                for i in range(120)
+            ])
+        config = ReportConfiguration.objects.create(
+            name='Export', report_type='detailed', format='csv', aggregation='hour',
+            created_by=User.objects.create_user('reporter'),
+        )
+        path = generate_detailed_report(config, start, start + timedelta(hours=2))
+        with open(os.path.join(settings.MEDIA_ROOT, path), newline='') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(
+            [(row['site'], float(row['ge_active_power'])) for row in rows],
+            [('north', 10.0), ('north', 10.0), ('south', 30.0), ('south', 30.0)],
+        )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class GenerateReportTaskTests(TestCase):
+    def setUp(self):
+        config = ReportConfiguration.objects.create(
+            name='Weekly', report_type='kpi', format='md', include_charts=False,
+            created_by=User.objects.create_user('reporter'),
+        )
+        self.report = GeneratedReport.objects.create(configuration=config, status='pending')
+
+    def run_task(self, side_effect):
+        with mock.patch.object(tasks, 'readings_queryset', side_effect=side_effect) as queryset:
+            generate_report_task.apply(args=(self.report.id,))
+        self.report.refresh_from_db()
+        return queryset.call_count
+
+    def test_transient_errors_are_retried(self):
+        real, failures = tasks.readings_queryset, [OperationalError('connection lost')]
+
+        def flaky(*args):
+            if failures:
+                raise failures.pop()
+            return real(*args)
+
+        calls = self.run_task(flaky)
+        self.assertEqual(calls, 2)
+        self.assertEqual(self.report.status, 'completed')
+
+    def test_report_fails_once_retries_are_exhausted(self):
+        calls = self.run_task(OperationalError('connection lost'))
+        self.assertEqual(calls, generate_report_task.max_retries + 1)
+        self.assertEqual(self.report.status, 'failed')
+
+    def test_other_errors_are_not_retried(self):
+        calls = self.run_task(ValueError('bad configuration'))
+        self.assertEqual(calls, 1)
+        self.assertEqual(self.report.status, 'failed')
+        self.assertEqual(self.report.error_message, 'bad configuration')
+
+
+class ScheduledReportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reporter')
+
+    def configuration(self, **fields):
+        fields.setdefault('schedule', '0 6 * * *')
+        return ReportConfiguration.objects.create(
+            name='Daily', report_type='kpi', format='md', created_by=self.user, **fields
+        )
+
+    def test_schedule_is_due_once_it_fired_since_the_last_run(self):
+        config = self.configuration(last_scheduled_at=datetime(2024, 3, 1, 6, 0, tzinfo=dt_timezone.utc))
+        self.assertFalse(config.schedule_is_due(datetime(2024, 3, 2, 5, 59, tzinfo=dt_timezone.utc)))
+        self.assertTrue(config.schedule_is_due(datetime(2024, 3, 2, 6, 0, tzinfo=dt_timezone.utc)))
+
+    def test_invalid_schedules_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.configuration(schedule='0 6 * *').cron_schedule()
+        with self.assertRaises(ValueError):
+            self.configuration(schedule='0 25 * * *').cron_schedule()
+
+    def test_configurations_sharing_period_and_site_share_a_batch(self):
+        last_run = timezone.now() - timedelta(days=2)
+        for _ in range(2):
+            self.configuration(last_scheduled_at=last_run)
+        self.configuration(last_scheduled_at=last_run, date_range='last_30_days')
+        self.configuration(last_scheduled_at=last_run, schedule='not a schedule')
+        self.configuration(schedule='')
+
+        with mock.patch.object(tasks.generate_report_batch, 'delay') as delay:
+            dispatch_scheduled_reports()
+        self.assertEqual(sorted(len(call.args[0]) for call in delay.call_args_list), [1, 2])
+        self.assertEqual(GeneratedReport.objects.count(), 3)
+
+        # The tick is claimed: an immediate second dispatch has nothing to do
+        with mock.patch.object(tasks.generate_report_batch, 'delay') as delay:
+            dispatch_scheduled_reports()
+        delay.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), REPORT_ORPHAN_GRACE_SECONDS=3600)
+class ReportStorageTests(TestCase):
+    def setUp(self):
+        self.config = ReportConfiguration.objects.create(
+            name='Weekly', report_type='kpi', format='md', created_by=User.objects.create_user('reporter')
+        )
+
+    def tearDown(self):
+        if default_storage.exists('reports'):
+            for name in default_storage.listdir('reports')[1]:
+                default_storage.delete(f'reports/{name}')
+
+    def report(self, name, size=10, **fields):
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(b'x' * size))
+        return GeneratedReport.objects.create(configuration=self.config, file=name, status='completed', **fields)
+
+    def test_shared_files_survive_until_their_last_report(self):
+        first, second = self.report('reports/shared.md'), self.report('reports/shared.md')
+        self.assertEqual(delete_reports([first.id]), (1, 0))
+        self.assertTrue(default_storage.exists('reports/shared.md'))
+        self.assertEqual(delete_reports([second.id]), (1, 1))
+        self.assertFalse(default_storage.exists('reports/shared.md'))
+
+    def test_only_old_orphans_are_removed(self):
+        self.report('reports/kept.md')
+        default_storage.save('reports/orphan.md', ContentFile(b'x'))
+        self.assertEqual(remove_orphaned_report_files(), 0)
+        with self.settings(REPORT_ORPHAN_GRACE_SECONDS=-60):
+            self.assertEqual(remove_orphaned_report_files(), 1)
+        self.assertTrue(default_storage.exists('reports/kept.md'))
+        self.assertFalse(default_storage.exists('reports/orphan.md'))
+
+    def test_quota_evicts_the_least_recently_used_files(self):
+        now = timezone.now()
+        self.report('reports/old.md', 100, last_downloaded_at=now - timedelta(days=3))
+        self.report('reports/recent.md', 100, last_downloaded_at=now)
+        self.report('reports/middle.md', 100, last_downloaded_at=now - timedelta(days=1))
+        self.assertEqual(enforce_report_quota(max_bytes=150), (2, 2))
+        self.assertEqual(list(GeneratedReport.objects.values_list('file', flat=True)), ['reports/recent.md'])
+        self.assertEqual(enforce_report_quota(max_bytes=0), (0, 0))
+
+
+class ParseByteRangeTests(SimpleTestCase):
+    def test_whole_file_without_a_single_range(self):
+        for header in (None, '', 'bytes=-', 'items=0-10', 'bytes=0-1,5-6'):
+            self.assertIsNone(parse_byte_range(header, 100), header)
+
+    def test_ranges(self):
+        self.assertEqual(parse_byte_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_byte_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_byte_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_byte_range('bytes=-500', 100), (0, 99))
+        self.assertEqual(parse_byte_range('bytes=50-500', 100), (50, 99))
+
+    def test_unsatisfiable_ranges(self):
+        for header in ('bytes=100-', 'bytes=20-10', 'bytes=-0'):
+            with self.assertRaises(ValueError, msg=header):
+                parse_byte_range(header, 100)
@@ -1,10 +1,17 @@
+import os
+import re
+
 from rest_framework import generics, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from profiling.middleware import profile_headers
 from .models import ReportConfiguration, GeneratedReport
 from .serializers import ReportConfigurationSerializer, GeneratedReportSerializer
+from .services import report_cache_key, find_cached_report, link_cached_report
 from .tasks import generate_report_task
 
 
@@ -127,13 +134,27 @@ class ReportGenerationView(generics.CreateAPIView):
         Handles the POST request to start a report generation.
 
         It creates a new `GeneratedReport` record with a 'pending' status and
-        enqueues a Celery task to handle the actual file generation.
+        enqueues a Celery task to handle the actual file generation. When an
+        identical report (same parameters, same period, unchanged data) already
+        exists, the new record points at its file and no task is enqueued.
         """
         config_id = request.data.get('config_id')
 
         try:
             config = ReportConfiguration.objects.get(id=config_id, created_by=request.user)
 
+            start_date, end_date = config.resolve_period()
+            cache_key = report_cache_key(config, start_date, end_date)
+            cached = find_cached_report(cache_key)
+            if cached:
+                report = GeneratedReport.objects.create(configuration=config)
+                link_cached_report(report, cached, cache_key)
+                return Response({
+                    'status': 'Report served from cache',
+                    'report_id': report.id,
+                    'cached': True
+                }, status=status.HTTP_201_CREATED)
+
             # Create a new generated report record
             report = GeneratedReport.objects.create(
                 configuration=config,
@@ -141,7 +162,7 @@ class ReportGenerationView(generics.CreateAPIView):
             )
 
             # Start the Celery task
-            generate_report_task.delay(report.id)
+            generate_report_task.apply_async((report.id,), headers=profile_headers(request))
 
             return Response({
                 'status': 'Report generation started',
@@ -151,12 +172,63 @@ class ReportGenerationView(generics.CreateAPIView):
         except ReportConfiguration.DoesNotExist:
             return Response({'error': 'Report configuration not found or not owned by user'}, status=status.HTTP_404_NOT_FOUND)
 
+# Determine content type based on file extension
+CONTENT_TYPE_MAP = {
+    'pdf': 'application/pdf',
+    'csv': 'text/csv',
+    'md': 'text/markdown',
+    'gz': 'application/gzip',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+
+
+def parse_byte_range(header, size):
+    """
+    Parse a single-range `Range: bytes=...` header against a file of `size`
+    bytes. Returns (start, end) inclusive, None when the header is absent or
+    not a single byte range (serve the whole file), or raises ValueError when
+    the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':  # suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f'Unsatisfiable range {header!r}')
+    return start, end
+
+
+def iter_file_range(file_path, start, length):
+    """Yield `length` bytes of `file_path` from `start` in fixed-size blocks."""
+    with open(file_path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
 class DownloadReportView(generics.GenericAPIView):
     """
     ## API View to Download a Generated Report
 
     This view serves a previously generated report file.
 
+    The file is never loaded in memory: it is streamed in blocks, single
+    byte ranges (`Range: bytes=...`) are answered with `206 Partial Content`,
+    and with `REPORT_DOWNLOAD_MODE = 'x-accel'` the transfer is handed off to
+    nginx through `X-Accel-Redirect`.
+
     **Endpoint:**
     * `GET /download/?report_id={id}`: Downloads a completed report.
 
@@ -185,21 +257,50 @@ class DownloadReportView(generics.GenericAPIView):
 
             file_path = report.file.path
             file_name = report.file.name.split('/')[-1]
-
-            with open(file_path, 'rb') as f:
-                # Determine content type based on file extension
-                content_type_map = {
-                    'pdf': 'application/pdf',
-                    'csv': 'text/csv',
-                    'md': 'text/markdown'
-                }
-                extension = file_name.split('.')[-1].lower()
-                content_type = content_type_map.get(extension, 'application/octet-stream')
-                
-                response = HttpResponse(f.read(), content_type=content_type)
-                response['Content-Disposition'] = f'attachment; filename="{file_name}"'
-                return response
+            if not os.path.exists(file_path):
+                return Response({'error': 'Report file is no longer available'}, status=status.HTTP_404_NOT_FOUND)
+
+            GeneratedReport.objects.filter(pk=report.pk).update(last_downloaded_at=timezone.now())
+
+            extension = file_name.split('.')[-1].lower()
+            content_type = CONTENT_TYPE_MAP.get(extension, 'application/octet-stream')
+
+            if settings.REPORT_DOWNLOAD_MODE == 'x-accel':
+                # nginx serves the file (and any Range request) from an internal location
+                response = HttpResponse(content_type=content_type)
+                response['X-Accel-Redirect'] = settings.REPORT_ACCEL_REDIRECT_PREFIX + report.file.name
+            else:
+                response = self.stream_file(request, file_path, content_type)
+            response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+            return response
         except GeneratedReport.DoesNotExist:
             return Response({'error': 'Report not found or not owned by user'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            return Response({'error': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return Response({'error': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def stream_file(self, request, file_path, content_type):
+        """
+        Stream the whole file, or the requested byte range as a 206 response.
+        """
+        size = os.path.getsize(file_path)
+        try:
+            byte_range = parse_byte_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range is None:
+            response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                iter_file_range(file_path, start, length),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=content_type,
+            )
+            response['Content-Length'] = str(length)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
@@ -98,7 +98,13 @@ const CSVUpload = () => {
       setUploadProgress(50);
       setUploadStatus({ type: 'info', message: '⚙️ Traitement en cours...' });
 
-      if (uploadResponse.task_id) {
+      if (uploadResponse.status === 'duplicate') {
+        // Same file already ingested: the server answers with that run's outcome
+        setUploadProgress(100);
+        setProcessingResults(uploadResponse.result);
+        setUploadStatus({ type: 'info', message: 'ℹ️ Ce fichier a déjà été importé : résultat précédent affiché.' });
+        setUploading(false);
+      } else if (uploadResponse.task_id) {
         await pollTaskStatus(uploadResponse.task_id);
       } else {
         setUploadStatus({ type: 'error', message: 'Aucun ID de tâche reçu du serveur.' });
@@ -26,9 +26,11 @@ const ReportManager = () => {
     report_type: 'kpi',
     format: 'pdf',
     include_charts: true,
+    aggregation: 'raw',
     date_range: 'last_7_days',
     start_date: '',
-    end_date: ''
+    end_date: '',
+    schedule: ''
   });
 
   useEffect(() => {
@@ -68,9 +70,11 @@ const ReportManager = () => {
         report_type: 'kpi',
         format: 'pdf',
         include_charts: true,
+        aggregation: 'raw',
         date_range: 'last_7_days',
         start_date: '',
-        end_date: ''
+        end_date: '',
+        schedule: ''
       });
       fetchData();
     } catch (err) {
@@ -87,9 +91,11 @@ const ReportManager = () => {
       report_type: config.report_type,
       format: config.format,
       include_charts: config.include_charts,
+      aggregation: config.aggregation || 'raw',
       date_range: config.date_range,
       start_date: config.start_date || '',
-      end_date: config.end_date || ''
+      end_date: config.end_date || '',
+      schedule: config.schedule || ''
     });
     setShowConfigForm(true);
   };
@@ -113,7 +119,8 @@ const ReportManager = () => {
       link.href = url;
       
       // Create a proper file name with extension
-      const extension = report.configuration.format === 'md' ? 'md' : report.configuration.format;
+      const extensions = { md: 'md', csv_gz: 'csv.gz', parquet: 'parquet' };
+      const extension = extensions[report.configuration.format] || report.configuration.format;
       link.setAttribute('download', `${report.configuration.name}.${extension}`);
       
       document.body.appendChild(link);
@@ -204,6 +211,7 @@ const ReportManager = () => {
                   <option value="production">Analyse de Production</option>
                   <option value="consumption">Analyse de Consommation</option>
                   <option value="comprehensive">Rapport Complet</option>
+                  <option value="detailed">Export Détaillé des Données</option>
                 </select>
               </div>
 
@@ -216,9 +224,30 @@ const ReportManager = () => {
                   <option value="pdf">PDF</option>
                   <option value="md">Markdown</option>
                   <option value="csv">CSV</option>
+                  {configForm.report_type === 'detailed' && (
+                    <>
+                      <option value="csv_gz">CSV (gzip)</option>
+                      <option value="parquet">Parquet</option>
+                    </>
+                  )}
                 </select>
               </div>
 
+              {configForm.report_type === 'detailed' && (
+                <div className="form-group">
+                  <label>Agrégation</label>
+                  <select
+                    value={configForm.aggregation}
+                    onChange={(e) => setConfigForm({...configForm, aggregation: e.target.value})}
+                  >
+                    <option value="raw">Données brutes</option>
+                    <option value="minute">Par minute</option>
+                    <option value="hour">Horaire</option>
+                    <option value="day">Journalière</option>
+                  </select>
+                </div>
+              )}
+
               <div className="form-group">
                 <label>Période</label>
                 <select
@@ -257,6 +286,16 @@ const ReportManager = () => {
                 </div>
               )}
 
+              <div className="form-group">
+                <label>Planification (cron, optionnelle)</label>
+                <input
+                  type="text"
+                  value={configForm.schedule}
+                  onChange={(e) => setConfigForm({...configForm, schedule: e.target.value})}
+                  placeholder="0 6 * * 1  (lundi à 06:00)"
+                />
+              </div>
+
               <div className="form-group checkbox">
                 <label>
                   <input
@@ -330,6 +369,7 @@ const ReportManager = () => {
                     <span>Format: {config.format.toUpperCase()}</span>
                     <span>Période: {config.date_range}</span>
                     <span>Graphiques: {config.include_charts ? 'Oui' : 'Non'}</span>
+                    {config.schedule && <span>Planification: {config.schedule}</span>}
                   </div>
                   
                   <button
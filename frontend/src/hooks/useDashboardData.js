@@ -32,7 +32,7 @@ export const useDashboardData = (filters = {}, refreshInterval = null) => {
   // Fonction pour charger les données temporelles
   const loadTimeSeriesData = useCallback(async (startDate = '', endDate = '') => {
     try {
-      const data = await fetchTimeSeriesData(startDate, endDate, 1000);
+      const data = await fetchTimeSeriesData(startDate, endDate, 500);
       setTimeSeriesData(data);
       return data;
     } catch (err) {
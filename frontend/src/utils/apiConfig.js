@@ -107,18 +107,59 @@ export const fetchKPIs = async (startDate = '', endDate = '') => {
   }
 };
 
-// --- Time series data fetching ---
-export const fetchTimeSeriesData = async (startDate = '', endDate = '', limit = 1000) => {
+// KPIs de plusieurs périodes en une requête (/metrics/batch/) : soit un
+// découpage (groupBy: 'day' | 'week' | 'month') de [startDate, endDate],
+// soit des périodes explicites ranges: [[début, fin], ...]
+export const fetchBatchKPIs = async ({ groupBy = '', startDate = '', endDate = '', ranges = [], site = '' } = {}) => {
   try {
     const params = new URLSearchParams();
-    if (startDate) params.append('timestamp__gte', startDate);
-    if (endDate) params.append('timestamp__lte', endDate);
-    params.append('limit', limit.toString());
-    params.append('ordering', 'timestamp');
+    if (groupBy) params.append('group_by', groupBy);
+    if (startDate) params.append('start_date', startDate);
+    if (endDate) params.append('end_date', endDate);
+    ranges.forEach(([start, end]) => params.append('range', `${start}/${end}`));
+    if (site) params.append('site', site);
 
-    const response = await apiClient.get(`/ingestion/data/?${params.toString()}`);
-    return response.data;
+    const response = await apiClient.get(`/metrics/batch/?${params.toString()}`);
+    return response.data.results;
+  } catch (error) {
+    console.error('Error fetching batch KPIs:', error);
+    throw new Error(error.response?.data?.error || 'Erreur lors du chargement des KPIs');
+  }
+};
+
+// --- Time series data fetching ---
+// Séries agrégées par intervalle (/metrics/series/), remises sous la forme
+// { results: [{ timestamp, <signal>: moyenne, ... }] } attendue par les graphiques
+export const SERIES_SIGNALS = [
+  'battery_active_power',
+  'pvpcs_active_power',
+  'fc_active_power',
+  'ge_active_power',
+];
+
+export const fetchTimeSeriesData = async (startDate = '', endDate = '', points = 500) => {
+  try {
+    const params = new URLSearchParams();
+    if (startDate) params.append('start_date', startDate);
+    if (endDate) params.append('end_date', endDate);
+    params.append('signals', SERIES_SIGNALS.join(','));
+    params.append('stats', 'mean');
+    params.append('points', points.toString());
+
+    const response = await apiClient.get(`/metrics/series/?${params.toString()}`);
+    const { timestamps, series, bucket_seconds: bucketSeconds } = response.data;
+    const results = timestamps.map((timestamp, index) => {
+      const row = { timestamp };
+      SERIES_SIGNALS.forEach((signal) => {
+        row[signal] = series[signal].mean[index];
+      });
+      return row;
+    });
+    return { results, bucketSeconds };
   } catch (error) {
+    if (error.response?.status === 404) {
+      return { results: [], bucketSeconds: null };
+    }
     console.error('Error fetching time series data:', error);
     throw new Error('Erreur lors du chargement des données temporelles');
   }